@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import ITU_R_P_618_13
+
+def finite_json(value):
+    # NaN and infinities are not JSON; they are written as null, like the
+    # quantities of the steps not executed
+    if isinstance(value, float):
+        return(value if math.isfinite(value) else None)
+    if isinstance(value, dict):
+        return({name: finite_json(x) for name, x in value.items()})
+    if isinstance(value, list):
+        return([finite_json(x) for x in value])
+
+    return(value)
+
+class RequestCoalescer:
+    def __init__(self, window = 0.002, max_batch = 4096, maps_dir = None,
+                 executor = None, region = None):
+        '''
+        Constructor
+
+        Collects the link records submitted within a short window (seconds)
+        and evaluates them together in one pass of the array P.618-13 chain
+        on an executor thread, so the event loop never blocks on the
+        computation. A batch is also flushed as soon as it reaches
+        max_batch records. With a region (lat_min, lat_max, lon_min,
+        lon_max) only that part of the P.837-7 maps is kept resident until a
+        request falls outside of it.
+        '''
+
+        if maps_dir is None:
+            maps_dir = ITU_R_P_618_13.base_dir
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers = 1)
+
+        self.window    = window
+        self.max_batch = max_batch
+        self.maps_dir  = maps_dir
+        self.region    = region
+        self.executor  = executor
+        self.pending   = []
+        self.timer     = None
+
+        # The event loop only keeps weak references to its tasks, so the
+        # batches being evaluated are held here until they finish
+        self.tasks = set()
+
+        # Counters for the /stats endpoint
+        self.requests = 0
+        self.batches  = 0
+
+    async def submit(self, record):
+        '''
+        Evaluate one link record; returns its result dictionary
+        '''
+
+        loop   = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((record, future))
+        self.requests = self.requests + 1
+
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+
+        return(await future)
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        self.batches = self.batches + 1
+        task = asyncio.get_running_loop().create_task(self.run(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, batch):
+        loop    = asyncio.get_running_loop()
+        records = [record for record, _ in batch]
+        try:
+            results = await loop.run_in_executor(
+                self.executor, ITU_R_P_618_13.evaluate_links, records,
+                self.maps_dir)
+        except Exception:
+            # Evaluate the records one at a time, so that a failure only
+            # reaches the request it comes from
+            results = None
+
+        if results is None:
+            for record, future in batch:
+                try:
+                    result = await loop.run_in_executor(
+                        self.executor, ITU_R_P_618_13.evaluate_links,
+                        [record], self.maps_dir)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                if not future.done():
+                    future.set_result(result[0])
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def load_maps(self):
+        # Make the P.837-7 and P.839-4 grids resident before serving
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, ITU_R_P_618_13.load_maps, self.maps_dir,
+            self.region)
+
+class AttenuationService:
+    def __init__(self, coalescer, max_body = 16 * 1024 * 1024):
+        '''
+        Constructor
+
+        Minimal HTTP/1.1 JSON front end:
+            POST /attenuation : body is one link record (or a list of them)
+                                with the fields h_s, theta, lat, lon, f, p,
+                                pol and optionally R_0_01; the response is
+                                the result record (or list of them)
+            GET /stats        : request and batch counters
+            GET /health       : liveness check
+        Bodies that are not link records get a 400 response, and a request
+        whose evaluation fails a 500 response; neither affects the other
+        requests of the same batch. Bodies over max_body bytes are refused
+        with a 413 response before they are read.
+        '''
+
+        self.coalescer = coalescer
+        self.max_body  = max_body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ValueError as e:
+                    error = {'error': 'malformed request: ' + str(e)}
+                    self.write_response(writer, 400, error, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                if body is None:
+                    error = {'error': 'the body exceeds ' +
+                                      str(self.max_body) + ' bytes'}
+                    self.write_response(writer, 413, error, False)
+                    await writer.drain()
+                    break
+                try:
+                    status, payload = await self.dispatch(method, path, body)
+                except Exception as e:
+                    status, payload = 500, {'error': 'evaluation failed: ' +
+                                                     str(e)}
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return(None)
+
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        # A body over the limit is left unread (None)
+        length = int(headers.get('content-length', 0))
+        if length < 0:
+            raise ValueError('negative content length')
+        if length > self.max_body:
+            return(method, path, headers, None)
+        body = await reader.readexactly(length) if length else b''
+
+        return(method, path, headers, body)
+
+    async def dispatch(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return(200, {'status': 'ok'})
+
+        if method == 'GET' and path == '/stats':
+            return(200, {'requests': self.coalescer.requests,
+                         'batches': self.coalescer.batches})
+
+        if method == 'POST' and path == '/attenuation':
+            try:
+                records = json.loads(body)
+            except ValueError as e:
+                return(400, {'error': 'invalid JSON: ' + str(e)})
+
+            # Only objects reach the coalescer, so a malformed request cannot
+            # take the other requests of its batch down with it
+            if isinstance(records, list):
+                bad = [str(i) for i, record in enumerate(records)
+                       if not isinstance(record, dict)]
+                if bad:
+                    return(400, {'error': 'not JSON objects: items ' +
+                                          ', '.join(bad)})
+                results = await asyncio.gather(
+                    *[self.coalescer.submit(r) for r in records])
+                return(200, list(results))
+
+            if not isinstance(records, dict):
+                return(400, {'error': 'the body must be a JSON object or a '
+                                      'list of them'})
+
+            return(200, await self.coalescer.submit(records))
+
+        return(404, {'error': 'not found'})
+
+    def write_response(self, writer, status, payload, keep_alive):
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                  413: 'Payload Too Large',
+                  500: 'Internal Server Error'}[status]
+        body   = json.dumps(finite_json(payload), allow_nan = False).encode()
+
+        writer.write(('HTTP/1.1 ' + str(status) + ' ' + reason + '\r\n' +
+                      'Content-Type: application/json\r\n' +
+                      'Content-Length: ' + str(len(body)) + '\r\n' +
+                      'Connection: ' + ('keep-alive' if keep_alive
+                                        else 'close') + '\r\n' +
+                      '\r\n').encode('latin-1') + body)
+
+async def start_service(host = '127.0.0.1', port = 8618, window = 0.002,
+                        max_batch = 4096, maps_dir = None, region = None,
+                        max_body = 16 * 1024 * 1024):
+    '''
+    Load the maps and start serving; returns the asyncio server and the
+    coalescer
+    '''
+
+    coalescer = RequestCoalescer(window, max_batch, maps_dir,
+                                 region = region)
+    await coalescer.load_maps()
+
+    service = AttenuationService(coalescer, max_body)
+    server  = await asyncio.start_server(service.handle, host, port)
+
+    return(server, coalescer)
+
+async def serve(host = '127.0.0.1', port = 8618, window = 0.002,
+                max_batch = 4096, maps_dir = None, region = None,
+                max_body = 16 * 1024 * 1024):
+    server, _ = await start_service(host, port, window, max_batch, maps_dir,
+                                    region, max_body)
+    async with server:
+        await server.serve_forever()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'HTTP/JSON service for rain attenuation queries '
+                      '(ITU-R P.618-13)')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8618)
+    parser.add_argument('--window', type = float, default = 0.002,
+                        help = 'coalescing window (seconds)')
+    parser.add_argument('--max-batch', type = int, default = 4096)
+    parser.add_argument('--maps-dir', default = None)
+    parser.add_argument('--region', type = float, nargs = 4, default = None,
+                        metavar = ('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help = 'only keep the P.837-7 maps over this region '
+                               'resident')
+    parser.add_argument('--max-body', type = int, default = 16 * 1024 * 1024,
+                        help = 'largest request body accepted (bytes)')
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args.host, args.port, args.window, args.max_batch,
+                      args.maps_dir, args.region, args.max_body))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import csv
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import ITU_R_P_618_13
+import Instrumentation
+
+# Columns every link record must provide, and the optional ones understood by
+# the attenuation chain
+input_columns    = ITU_R_P_618_13.link_fields
+optional_columns = ('R_0_01',)
+
+# Quantities written for each link, after the columns of the input record
+output_columns = ITU_R_P_618_13.result_keys
+
+def read_chunks(path, chunk_size):
+    '''
+    Read a table of links in chunks of at most chunk_size records. Each chunk
+    is a dictionary of column name -> list of values, along with the list of
+    the reasons its rows cannot be evaluated (None for the good rows). Parquet
+    files need pyarrow; anything else is read as CSV with a header row.
+    '''
+
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        table = pq.ParquetFile(path)
+        for batch in table.iter_batches(batch_size = chunk_size):
+            yield batch.to_pydict(), [None] * batch.num_rows
+        return
+
+    with open(path, 'r', newline = '') as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        width  = len(header)
+        rows, errors = [], []
+        for row in reader:
+            # Rows with too few or too many fields cannot be matched to the
+            # header; they are passed through blank-padded or cut to the
+            # header, and reported as errors
+            if len(row) != width:
+                errors.append(str(len(row)) + ' field(s), expected ' +
+                              str(width))
+                row = (row + [''] * width)[:width]
+            else:
+                errors.append(None)
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield dict(zip(header, map(list, zip(*rows)))), errors
+                rows, errors = [], []
+        if rows:
+            yield dict(zip(header, map(list, zip(*rows)))), errors
+
+def input_schema(path):
+    # Arrow schema of a Parquet table of links (None for CSV)
+    if not path.endswith('.parquet'):
+        return(None)
+
+    import pyarrow.parquet as pq
+
+    return(pq.read_schema(path))
+
+def result_columns(chunk):
+    # Output columns: the position of the link in the input, the columns of
+    # the input record, the computed quantities and the reason a row could
+    # not be evaluated
+    columns = ['row'] + list(chunk.keys())
+    columns.extend(c for c in output_columns if c not in columns)
+    if 'error' not in columns:
+        columns.append('error')
+
+    return(columns)
+
+class ResultWriter:
+    def __init__(self, path, columns, schema = None):
+        '''
+        Constructor
+
+        Writes result chunks to a CSV file, or to a Parquet file (needs
+        pyarrow) if the path ends in .parquet. CSV chunks arrive already
+        formatted by the workers. The Parquet schema is fixed up front, so
+        that every chunk is written with the same types whatever its values
+        (e.g. an error column without any error): the computed quantities
+        are float64, the error column a string, and the columns passed
+        through keep their type in the input schema (strings from CSV).
+        '''
+
+        self.path    = path
+        self.columns = columns
+        self.parquet = path.endswith('.parquet')
+        self.fp      = None
+        self.writer  = None
+        self.schema  = None
+
+        if self.parquet:
+            self.schema = self.output_schema(schema)
+
+        if not self.parquet:
+            self.fp = open(self.path, 'w', newline = '')
+            csv.writer(self.fp).writerow(self.columns)
+
+    def output_schema(self, schema):
+        import pyarrow as pa
+
+        fields = []
+        for c in self.columns:
+            if c == 'row':
+                kind = pa.int64()
+            elif c in output_columns:
+                kind = pa.float64()
+            elif schema is not None and c != 'error' and\
+                 c in schema.names:
+                kind = schema.field(c).type
+            else:
+                kind = pa.string()
+            fields.append(pa.field(c, kind))
+
+        return(pa.schema(fields))
+
+    def write(self, chunk):
+        if not self.parquet:
+            self.fp.write(chunk)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pydict({c: chunk[c] for c in self.columns},
+                                     schema = self.schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.fp is not None:
+            self.fp.close()
+
+def evaluate_chunk(first_row, chunk, maps_dir, columns = None,
+                   errors = None):
+    '''
+    Evaluate one chunk of links through the array version of the P.618-13
+    chain. Runs in a worker process; the maps come from the grid registry,
+    which the worker fills from the memory-mapped binary caches. If the
+    output columns are given, the results are returned as CSV text so that
+    the formatting is also spread over the workers. Rows with a reason in
+    errors (as given by read_chunks()) are not evaluated. The instrumentation
+    statistics gathered by the worker for the chunk are returned alongside
+    (None while disabled).
+    '''
+
+    # Each row is checked like a record of the streaming mode; rows that
+    # cannot be parsed get NaN results and the reason in the error column
+    n      = len(chunk['pol'])
+    fields = [c for c in input_columns + optional_columns if c in chunk]
+    errors = [None] * n if errors is None else list(errors)
+    links, good = [], []
+    for i, values in enumerate(zip(*[chunk[c] for c in fields])):
+        if errors[i] is not None:
+            continue
+        try:
+            links.append(ITU_R_P_618_13.parse_link(dict(zip(fields, values))))
+            good.append(i)
+        except (ValueError, TypeError) as e:
+            errors[i] = str(e)
+
+    res = {name: np.full(n, np.nan) for name in output_columns}
+    if links:
+        args = [np.array(column) for column in zip(*links)]
+        done = ITU_R_P_618_13.compute_rain_attenuation_many(
+            *args, maps_dir = maps_dir)
+        for name in output_columns:
+            res[name][good] = done[name]
+
+    out = {'row': list(range(first_row, first_row + n))}
+    out.update(chunk)
+    for name in output_columns:
+        out[name] = res[name].tolist()
+    out['error'] = errors
+
+    if columns is None:
+        return(out, Instrumentation.collect())
+
+    text = io.StringIO()
+    csv.writer(text).writerows(zip(*[out[c] for c in columns]))
+
+    return(text.getvalue(), Instrumentation.collect())
+
+def init_worker(maps_dir, instrumented):
+    if instrumented:
+        Instrumentation.enable()
+    ITU_R_P_618_13.load_maps(maps_dir)
+
+def write_result(writer, future):
+    # Write a finished chunk and fold its statistics into this process
+    chunk, snapshot = future.result()
+    writer.write(chunk)
+    Instrumentation.merge(snapshot)
+
+def run_batch(input_path, output_path, workers = None, chunk_size = 10000,
+              maps_dir = None):
+    '''
+    Compute the rain attenuation for every link of a table, fanning chunks of
+    links out over a pool of worker processes and writing the results as the
+    chunks finish (so the output is not necessarily in input order; the 'row'
+    column gives the position of each link in the input). Rows with a missing,
+    malformed or out of range field, or with more or fewer fields than the
+    header, are not evaluated; their 'error' column says why.
+
+    The maps are loaded (and their binary caches built) once in this process
+    before the pool starts, so the workers only memory-map the caches and
+    share a single page-cached copy of each map.
+
+    INPUT PARAMETERS:
+        input_path  : CSV (or .parquet) table with the columns h_s, theta,
+                      lat, lon, f, p and pol, and optionally R_0_01; any other
+                      columns are passed through to the output
+        output_path : CSV (or .parquet) file to write
+        workers     : number of worker processes (defaults to the CPU count)
+        chunk_size  : number of links per task
+        maps_dir    : directory holding the ITU-R P.839-4 and P.837-7 map
+                      directories
+
+    OUTPUT PARAMETER:
+        count       : number of links evaluated
+    '''
+
+    if maps_dir is None:
+        maps_dir = ITU_R_P_618_13.base_dir
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    ITU_R_P_618_13.load_maps(maps_dir)
+
+    chunks  = read_chunks(input_path, chunk_size)
+    schema  = input_schema(input_path)
+    writer  = None
+    pending = set()
+    count   = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers = workers,
+                                 initializer = init_worker,
+                                 initargs = (maps_dir,
+                                             Instrumentation.enabled)) as pool:
+            for chunk, errors in chunks:
+                if writer is None:
+                    missing = [c for c in input_columns if c not in chunk]
+                    if missing:
+                        raise ValueError('Missing columns: ' +\
+                                         ', '.join(missing))
+
+                    writer = ResultWriter(output_path, result_columns(chunk),
+                                          schema)
+                    text   = None if writer.parquet else writer.columns
+
+                # Keep a bounded number of chunks in flight
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending,
+                                         return_when = FIRST_COMPLETED)
+                    for future in done:
+                        write_result(writer, future)
+
+                pending.add(pool.submit(evaluate_chunk, count, chunk,
+                                        maps_dir, text, errors))
+                count = count + len(chunk['pol'])
+
+            while pending:
+                done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    write_result(writer, future)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return(count)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'Rain attenuation (ITU-R P.618-13) for a table of links')
+    parser.add_argument('input', help = 'CSV or Parquet table of links')
+    parser.add_argument('output', help = 'CSV or Parquet file of results')
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--chunk-size', type = int, default = 10000)
+    parser.add_argument('--maps-dir', default = None)
+    parser.add_argument('--stats', action = 'store_true',
+                        help = 'print aggregated stage timers and branch '
+                               'counters of all workers when done')
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        Instrumentation.enable()
+
+    count = run_batch(args.input, args.output, args.workers, args.chunk_size,
+                      args.maps_dir)
+    print('Evaluated ' + str(count) + ' links', file = sys.stderr)
+
+    if args.stats:
+        Instrumentation.report()
+
+if __name__ == '__main__':
+    main()
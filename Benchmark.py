@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import BilinearInterpolation
+import ITU_R_P_618_13
+import ITU_R_P_837_7
+import ITU_R_P_838_3
+import ITU_R_P_839_4
+
+# Start-up budget of a single-link command line run, on top of the start-up
+# of a bare interpreter (seconds)
+startup_budget = 0.050
+
+def write_map(path, data):
+    # Same layout as the ITU text maps: one matrix row per line
+    np.savetxt(path, data, fmt = '%.5f', delimiter = ' ')
+
+def make_synthetic_maps(maps_dir, p837_step = 1.125, p839_step = 1.5):
+    '''
+    Write synthetic ITU-R P.837-7 and P.839-4 style maps (same file names,
+    axes and directory layout as the ITU downloads, smooth made-up values) so
+    the benchmarks run offline
+    '''
+
+    # P.839-4: latitudes from +90 down to -90, longitudes 0 to 360 (east)
+    lat = np.arange(90.0, -90.0 - p839_step/2, -p839_step)
+    lon = np.arange(0.0, 360.0 + p839_step/2, p839_step)
+    lon_data, lat_data = np.meshgrid(lon, lat)
+    h0 = 3.0 + 2.0*np.cos(np.radians(lat_data)) +\
+         0.3*np.sin(np.radians(2.0*lon_data))
+
+    path = os.path.join(maps_dir, ITU_R_P_618_13.p839_sub_dir)
+    os.makedirs(path, exist_ok = True)
+    write_map(os.path.join(path, 'Lat.txt'), lat_data)
+    write_map(os.path.join(path, 'Lon.txt'), lon_data)
+    write_map(os.path.join(path, 'h0.txt'), h0)
+
+    # P.837-7: latitudes from -90 to +90, longitudes -180 to 180
+    lat = np.arange(-90.0, 90.0 + p837_step/2, p837_step)
+    lon = np.arange(-180.0, 180.0 + p837_step/2, p837_step)
+    lon_data, lat_data = np.meshgrid(lon, lat)
+    R001 = np.maximum(0.0, 60.0*np.cos(np.radians(lat_data))**3 +\
+                           10.0*np.sin(np.radians(3.0*lon_data)))
+
+    path = os.path.join(maps_dir, ITU_R_P_618_13.p837_sub_dir)
+    os.makedirs(path, exist_ok = True)
+    write_map(os.path.join(path, 'LAT_R001.TXT'), lat_data)
+    write_map(os.path.join(path, 'LON_R001.TXT'), lon_data)
+    write_map(os.path.join(path, 'R001.TXT'), R001)
+
+def time_it(func, repeat = 5, number = 1):
+    '''
+    Best wall-clock time of one call of func, over repeat rounds of number
+    calls each
+    '''
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+
+    return(best)
+
+def random_sites(count, seed = 0):
+    rng = np.random.default_rng(seed)
+
+    return(rng.uniform(-80.0, 80.0, count), rng.uniform(-180.0, 180.0, count))
+
+def random_links(count, seed = 0):
+    rng = np.random.default_rng(seed)
+    lats, lons = random_sites(count, seed)
+
+    return(rng.uniform(0.0, 2.0, count), rng.uniform(5.0, 80.0, count),
+           lats, lons, rng.choice([12.0, 20.0, 30.0, 40.0], count),
+           rng.choice([0.01, 0.1, 1.0], count), rng.choice(['v', 'h', 'c'],
+                                                           count))
+
+def run_benchmarks(maps_dir, batch_sizes = (1000, 100000, 1000000),
+                   repeat = 5):
+    '''
+    Time the hot paths against the maps in maps_dir. Returns a dictionary of
+    benchmark name -> {'seconds': best time per call, 'items': number of
+    points or links per call, 'per_item': seconds per point or link}.
+    '''
+
+    results = {}
+
+    def record(name, seconds, items = 1):
+        results[name] = {'seconds': seconds, 'items': items,
+                         'per_item': seconds / items}
+
+    maps = {
+        'p837': (ITU_R_P_837_7.get_directories(
+            os.path.join(maps_dir, ITU_R_P_618_13.p837_sub_dir, '')), False),
+        'p839': (ITU_R_P_839_4.get_directories(
+            os.path.join(maps_dir, ITU_R_P_618_13.p839_sub_dir, '')), True)
+    }
+
+    for name, (directories, convert_to_west) in maps.items():
+        # Cold load from the text files, with and without writing the cache
+        def load_text():
+            BilinearInterpolation.clear_grid_registry()
+            BilinearInterpolation.parse_grid(directories, convert_to_west)
+        record(name + '.cold_load.text', time_it(load_text, repeat))
+
+        BilinearInterpolation.convert_grid_to_binary(directories,
+                                                     convert_to_west)
+
+        def load_cache():
+            BilinearInterpolation.clear_grid_registry()
+            BilinearInterpolation.load_grid(directories, convert_to_west)
+        record(name + '.cold_load.cache', time_it(load_cache, repeat))
+
+        # Warm queries through the public API
+        grid = BilinearInterpolation.load_grid(directories, convert_to_west)
+
+        def single():
+            BilinearInterpolation.BilinearInterpolation(
+                12.3, 45.6, directories, convert_to_west).interpolate()
+        record(name + '.warm_query.single', time_it(single, repeat, 1000))
+
+        def locate():
+            grid.locate(12.3, 45.6)
+        record(name + '.cell_lookup.single', time_it(locate, repeat, 1000))
+
+        for size in batch_sizes:
+            lats, lons = random_sites(size)
+
+            def batch():
+                BilinearInterpolation.BilinearInterpolation.interpolate_many(
+                    lats, lons, directories, convert_to_west)
+            record(name + '.batch_query.' + str(size),
+                   time_it(batch, repeat), size)
+
+    # ITU-R P.838-3 coefficients
+    def coeffs():
+        ITU_R_P_838_3.compute_specific_attenuation_coeffs(20.0, 30.0, 'v',
+                                                          False)
+    record('p838.coeffs.single', time_it(coeffs, repeat, 1000))
+
+    for size in batch_sizes:
+        f = np.linspace(1.0, 100.0, size)
+
+        def coeffs_many():
+            ITU_R_P_838_3.compute_specific_attenuation_coeffs_many(f, 30.0,
+                                                                   'v')
+        record('p838.coeffs.' + str(size), time_it(coeffs_many, repeat), size)
+
+    # Full ITU-R P.618-13 chain
+    def link():
+        ITU_R_P_618_13.compute_rain_attenuation(0.1, 30.0, 12.3, 45.6, 20.0,
+                                                0.1, 'v', maps_dir = maps_dir)
+    record('p618.single', time_it(link, repeat, 200))
+
+    for size in batch_sizes:
+        links = random_links(size)
+
+        def links_many():
+            ITU_R_P_618_13.compute_rain_attenuation_many(*links,
+                                                         maps_dir = maps_dir)
+        record('p618.batch.' + str(size), time_it(links_many, repeat), size)
+
+    results.update(run_startup(maps_dir, repeat))
+
+    return(results)
+
+def run_startup(maps_dir, repeat = 5):
+    '''
+    Time short-lived command line runs, each in a fresh interpreter: a bare
+    interpreter, importing ITU_R_P_618_13, and evaluating one link through
+    --stream once the binary caches of the maps are built
+    '''
+
+    here   = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, 'ITU_R_P_618_13.py')
+    link   = json.dumps({'h_s': 0.1, 'theta': 30.0, 'lat': 12.3,
+                         'lon': 45.6, 'f': 20.0, 'p': 0.1, 'pol': 'v'})
+
+    subprocess.run([sys.executable, script, '--build-cache', '--maps-dir',
+                    maps_dir], cwd = here, check = True)
+
+    def run(args, stdin = None):
+        def call():
+            subprocess.run([sys.executable] + args, cwd = here, check = True,
+                           input = stdin, stdout = subprocess.DEVNULL,
+                           text = True)
+        return call
+
+    results = {}
+    for name, func in (
+        ('startup.interpreter', run(['-c', 'pass'])),
+        ('startup.import', run(['-c', 'import ITU_R_P_618_13'])),
+        ('startup.single_link', run([script, '--stream', '--maps-dir',
+                                     maps_dir], link + '\n'))):
+        seconds = time_it(func, repeat)
+        results[name] = {'seconds': seconds, 'items': 1, 'per_item': seconds}
+
+    return(results)
+
+def check_startup_budget(results):
+    # Start-up cost of a single-link run over a bare interpreter
+    spent = results['startup.single_link']['seconds'] -\
+            results['startup.interpreter']['seconds']
+
+    return {'seconds': startup_budget, 'spent': spent,
+            'met': spent <= startup_budget}
+
+def environment():
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'Benchmarks of the map loading, interpolation and '
+                      'P.618-13 hot paths, on synthetic maps')
+    parser.add_argument('--output', default = None,
+                        help = 'JSON file to write (default: stdout)')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--quick', action = 'store_true',
+                        help = 'skip the 1M point batches')
+    parser.add_argument('--maps-dir', default = None,
+                        help = 'benchmark these maps instead of synthetic '
+                               'ones')
+    parser.add_argument('--check-budget', action = 'store_true',
+                        help = 'exit with status 1 if a single-link run '
+                               'exceeds the start-up budget')
+    args = parser.parse_args(argv)
+
+    batch_sizes = (1000, 100000) if args.quick else (1000, 100000, 1000000)
+
+    tmp_dir = None
+    maps_dir = args.maps_dir
+    if maps_dir is None:
+        tmp_dir = maps_dir = tempfile.mkdtemp(prefix = 'itu-bench-')
+        make_synthetic_maps(maps_dir)
+
+    try:
+        results = run_benchmarks(maps_dir, batch_sizes, args.repeat)
+        report  = {'environment': environment(),
+                   'maps_dir': None if tmp_dir else maps_dir,
+                   'results': results,
+                   'startup_budget': check_startup_budget(results)}
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors = True)
+
+    text = json.dumps(report, indent = 2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as fp:
+            fp.write(text + '\n')
+
+    if args.check_budget and not report['startup_budget']['met']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,1132 @@
+import ast
+import io
+import json
 import math
+import mmap
 import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import Instrumentation
+from LazyImport import lazy_import
+
+np = lazy_import('numpy')
+
+# Process-wide registry of parsed grids. Each (Lat, Lon, Target) triple of
+# files is parsed once and reused until the modification time of one of the
+# files changes.
+_grid_registry = {}
+
+def grid_key(directories, convert_to_west):
+    '''
+    Build the registry key for a (Lat, Lon, Target) triple of files, along
+    with the modification times used to detect stale entries
+    '''
+
+    paths  = tuple(os.path.abspath(directories[name])
+                   for name in ('Lat', 'Lon', 'Target'))
+    mtimes = tuple(os.stat(path).st_mtime_ns for path in paths)
+
+    return (paths, bool(convert_to_west)), mtimes
+
+def clear_grid_registry():
+    '''
+    Drop all of the parsed grids held by the registry
+    '''
+
+    _grid_registry.clear()
+
+# Binary cache of the parsed maps. Each map set is written once as .npy files
+# (opened with memory-mapping, so every process shares one page-cached copy)
+# plus a JSON header describing the grid and the text files it came from. The
+# cache lives next to the Target file unless grid_cache_dir is set.
+use_grid_cache = True
+grid_cache_dir = os.environ.get('ITU_R_GRID_CACHE_DIR')
+
+GRID_CACHE_VERSION = 2
+
+# Number of threads parsing the text maps: the lines of each file that need
+# a full parse are split into that many chunks parsed concurrently. None (or
+# 1) parses everything on the calling thread.
+parse_threads = None
+
+def as_float_array(data):
+    # Keep floating arrays (including memory-maps and broadcast views) as they
+    # are, convert anything else to float64
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+
+    return(data)
+
+class Grid:
+    def __init__(self, lat_data, lon_data, target_data, lattice = None):
+        '''
+        Constructor
+
+        Holds the parsed Lat/Lon/Target matrices of one map as 2D NumPy float
+        arrays, along with the structures used to locate the grid cell
+        enclosing a requested lat/lon. If the lattice description (origin,
+        spacing and periodicity) is already known, e.g. from the binary
+        cache, the target data must be in ascending lat/lon order and the
+        detection is skipped.
+
+        A regular grid only keeps its target values, in ascending lat/lon
+        order: the Lat/Lon matrices become broadcast views of the 1D axes
+        and take no memory.
+        '''
+
+        self.lat_data    = as_float_array(lat_data)
+        self.lon_data    = as_float_array(lon_data)
+        self.target_data = as_float_array(target_data)
+
+        # Grids are shared by every interpolation in the process
+        for data in (self.lat_data, self.lon_data, self.target_data):
+            if data.flags.writeable:
+                data.flags.writeable = False
+
+        self.row_count, self.col_count = self.target_data.shape
+
+        # Regular lat/lon lattice description (origin, spacing and the target
+        # values reordered so that both axes are ascending)
+        self.regular  = False
+        self.lat0     = None
+        self.dlat     = None
+        self.lon0     = None
+        self.dlon     = None
+        self.periodic = False
+        self.values   = None
+        self.lat_axis = None
+        self.lon_axis = None
+
+        # Lat/lon range covered by a grid parsed from a regional window of a
+        # map, None for a whole map
+        self.window   = None
+
+        # Bucket index of the grid nodes, used when the grid is irregular
+        self.bucket_size   = None
+        self.bucket_origin = None
+        self.bucket_shape  = None
+        self.bucket_starts = None
+        self.bucket_nodes  = None
+
+        if lattice is not None:
+            self.set_lattice(self.target_data, **lattice)
+        elif not self.detect_lattice():
+            self.build_bucket_index()
+
+    def detect_lattice(self):
+        '''
+        Determine whether the grid is a regular lat/lon lattice. If it is,
+        record its origin and spacing so that the enclosing cell of any point
+        can be found by index arithmetic.
+        '''
+
+        if self.row_count < 2 or self.col_count < 2:
+            return False
+
+        # Every row must share one latitude and every column one longitude
+        lat_axis = self.lat_data[:, 0]
+        lon_axis = self.lon_data[0, :]
+        if not (np.allclose(self.lat_data, lat_axis[:, None]) and
+                np.allclose(self.lon_data, lon_axis[None, :])):
+            return False
+
+        # Sort both axes ascending, dropping repeated longitudes (e.g. 0 and
+        # 360 degrees both map to 0 after the conversion to west longitude)
+        row_order = np.argsort(lat_axis, kind = 'stable')
+        lon_sorted, col_order = np.unique(lon_axis, return_index = True)
+        lat_sorted = lat_axis[row_order]
+
+        if len(np.unique(lat_sorted)) != len(lat_sorted) or\
+           len(lon_sorted) < 2:
+            return False
+
+        dlat = (lat_sorted[-1] - lat_sorted[0]) / (len(lat_sorted) - 1)
+        dlon = (lon_sorted[-1] - lon_sorted[0]) / (len(lon_sorted) - 1)
+        if not (np.allclose(np.diff(lat_sorted), dlat) and
+                np.allclose(np.diff(lon_sorted), dlon)):
+            return False
+
+        values = self.target_data[row_order][:, col_order]
+
+        # If the longitudes cover the whole globe, repeat the first column
+        # 360 degrees further east so that cells across the seam exist (unless
+        # the map already ends with it, as with columns from 0 to 360)
+        span     = lon_sorted[-1] - lon_sorted[0]
+        closed   = bool(abs(span - 360.0) < 1e-6 * 360.0)
+        periodic = closed or bool(abs(span + dlon - 360.0) < 1e-6 * 360.0)
+        if periodic and not closed:
+            values = np.concatenate((values, values[:, :1]), axis = 1)
+
+        self.set_lattice(np.ascontiguousarray(values), lat_sorted[0], dlat,
+                         lon_sorted[0], dlon, periodic)
+
+        return True
+
+    def set_lattice(self, values, lat0, dlat, lon0, dlon, periodic):
+        '''
+        Record the description of a regular lattice and replace the parsed
+        matrices by the values and views of the lattice axes
+        '''
+
+        self.regular  = True
+        self.lat0     = float(lat0)
+        self.dlat     = float(dlat)
+        self.lon0     = float(lon0)
+        self.dlon     = float(dlon)
+        self.periodic = bool(periodic)
+        self.values   = values
+        if self.values.flags.writeable:
+            self.values.flags.writeable = False
+
+        self.row_count, self.col_count = values.shape
+        self.lat_axis = self.lat0 + self.dlat * np.arange(self.row_count)
+        self.lon_axis = self.lon0 + self.dlon * np.arange(self.col_count)
+
+        self.lat_data    = np.broadcast_to(self.lat_axis[:, None], values.shape)
+        self.lon_data    = np.broadcast_to(self.lon_axis[None, :], values.shape)
+        self.target_data = values
+
+    def lattice(self):
+        '''
+        Description of the regular lattice, as stored in the binary cache
+        '''
+
+        return {'lat0': self.lat0, 'dlat': self.dlat,
+                'lon0': self.lon0, 'dlon': self.dlon,
+                'periodic': self.periodic}
+
+    def build_bucket_index(self):
+        '''
+        Sort the grid nodes into square lat/lon buckets so that the nearest
+        node to a point can be found by searching a few nearby buckets
+        '''
+
+        lats = self.lat_data.ravel()
+        lons = self.lon_data.ravel()
+
+        lat_min, lon_min = lats.min(), lons.min()
+        extent = max(lats.max() - lat_min, lons.max() - lon_min, 1e-9)
+        size   = extent / max(math.sqrt(lats.size), 1.0)
+
+        shape = (int((lats.max() - lat_min) // size) + 1,
+                 int((lons.max() - lon_min) // size) + 1)
+        keys  = ((lats - lat_min) // size).astype(np.int64) * shape[1] +\
+                ((lons - lon_min) // size).astype(np.int64)
+
+        nodes = np.argsort(keys, kind = 'stable')
+
+        self.bucket_size   = size
+        self.bucket_origin = (lat_min, lon_min)
+        self.bucket_shape  = shape
+        self.bucket_starts = np.searchsorted(keys[nodes],
+                                             np.arange(shape[0]*shape[1] + 1))
+        self.bucket_nodes  = nodes
+
+    def bucket_ring(self, bucket_row, bucket_col, radius):
+        '''
+        Return the nodes held by the buckets at the given Chebyshev distance
+        from a bucket
+        '''
+
+        rows, cols = self.bucket_shape
+        found = []
+        for r in range(bucket_row - radius, bucket_row + radius + 1):
+            if r < 0 or r >= rows:
+                continue
+            if abs(r - bucket_row) == radius:
+                c_range = range(bucket_col - radius, bucket_col + radius + 1)
+            else:
+                c_range = (bucket_col - radius, bucket_col + radius)
+            for c in c_range:
+                if c < 0 or c >= cols:
+                    continue
+                b = r * cols + c
+                found.append(self.bucket_nodes[self.bucket_starts[b]:
+                                               self.bucket_starts[b+1]])
+
+        return found
+
+    def nearest_node(self, lat, lon):
+        '''
+        Find the (row, col) of the grid node closest to the requested lat/lon
+        using the bucket index
+        '''
+
+        size = self.bucket_size
+        rows, cols = self.bucket_shape
+        b_row = min(max(int((lat - self.bucket_origin[0]) // size), 0), rows-1)
+        b_col = min(max(int((lon - self.bucket_origin[1]) // size), 0), cols-1)
+
+        # Grow the search ring until a node is found, then keep going until
+        # no unsearched bucket can hold a closer node
+        candidates, radius, stop = [], 0, None
+        while stop is None or radius <= stop:
+            candidates.extend(self.bucket_ring(b_row, b_col, radius))
+            if stop is None and sum(len(c) for c in candidates) > 0:
+                stop = int(math.ceil((radius + 1) * math.sqrt(2.0)))
+            if radius > max(rows, cols):
+                break
+            radius = radius + 1
+
+        nodes = np.concatenate(candidates)
+        dist2 = (self.lat_data.ravel()[nodes] - lat)**2 +\
+                (self.lon_data.ravel()[nodes] - lon)**2
+        node  = int(nodes[np.argmin(dist2)])
+
+        return divmod(node, self.col_count)
+
+    def locate(self, lat, lon):
+        '''
+        Locate the cell of a regular grid that encloses the requested lat/lon.
+        Returns the row/col of the lower-left corner in the reordered values
+        matrix and the fractional position of the point within the cell.
+        Points outside the grid are clamped to its edge; a NaN or infinite
+        lat/lon gets NaN weights, so it interpolates to NaN.
+        '''
+
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return 0, 0, math.nan, math.nan
+
+        if self.periodic or self.window is not None:
+            lon = self.lon0 + (lon - self.lon0) % 360.0
+
+        x = (lat - self.lat0) / self.dlat
+        y = (lon - self.lon0) / self.dlon
+
+        rows, cols = self.values.shape
+        row = min(max(int(math.floor(x)), 0), rows - 2)
+        col = min(max(int(math.floor(y)), 0), cols - 2)
+
+        t = min(max(x - row, 0.0), 1.0)
+        u = min(max(y - col, 0.0), 1.0)
+
+        return row, col, t, u
+
+    def locate_many(self, lats, lons):
+        '''
+        Array version of locate() for a regular grid
+        '''
+
+        lats = np.asarray(lats, dtype = np.float64)
+        lons = np.asarray(lons, dtype = np.float64)
+
+        if self.periodic or self.window is not None:
+            with np.errstate(invalid = 'ignore'):
+                lons = self.lon0 + np.mod(lons - self.lon0, 360.0)
+
+        x = (lats - self.lat0) / self.dlat
+        y = (lons - self.lon0) / self.dlon
+
+        # Non-finite points take the first cell with NaN weights
+        finite = np.isfinite(x) & np.isfinite(y)
+        x = np.where(finite, x, 0.0)
+        y = np.where(finite, y, 0.0)
+
+        rows, cols = self.values.shape
+        row = np.clip(np.floor(x), 0, rows - 2).astype(np.intp)
+        col = np.clip(np.floor(y), 0, cols - 2).astype(np.intp)
+
+        t = np.where(finite, np.clip(x - row, 0.0, 1.0), np.nan)
+        u = np.where(finite, np.clip(y - col, 0.0, 1.0), np.nan)
+
+        return row, col, t, u
+
+    def covers(self, lats, lons):
+        '''
+        Whether every requested lat/lon can be interpolated from this grid,
+        i.e. always for a whole map and inside the window for a regional one
+        '''
+
+        if self.window is None:
+            return True
+
+        lat_min, lat_max, lon_min, lon_span = self.window
+        lats = np.asarray(lats, dtype = np.float64)
+        lons = np.asarray(lons, dtype = np.float64)
+
+        return bool(np.all((lats >= lat_min) & (lats <= lat_max) &
+                           (np.mod(lons - lon_min, 360.0) <= lon_span)))
+
+    def interpolate_many(self, lats, lons):
+        '''
+        Bilinear interpolation of the target data at arrays of lat/lon. The
+        result has the broadcast shape of the inputs.
+        '''
+
+        lats, lons = np.broadcast_arrays(np.asarray(lats, dtype = np.float64),
+                                         np.asarray(lons, dtype = np.float64))
+
+        if not self.regular:
+            res = [self.interpolate_irregular(lat, lon)
+                   for lat, lon in zip(lats.ravel(), lons.ravel())]
+            return np.array(res, dtype = np.float64).reshape(lats.shape)
+
+        return self.stencil(lats, lons).apply(self.values)
+
+    def geometry(self):
+        '''
+        Shape and lattice of a regular grid: grids with the same geometry can
+        share one stencil for a set of sites
+        '''
+
+        return (self.values.shape, self.lat0, self.dlat, self.lon0,
+                self.dlon, self.periodic or self.window is not None)
+
+    def stencil(self, lats, lons):
+        '''
+        Cell indices and bilinear weights of arrays of lat/lon on a regular
+        grid, to interpolate any layer of the same geometry
+        '''
+
+        if not self.regular:
+            raise ValueError('Stencils need a regular lat/lon grid')
+
+        lats, lons = np.broadcast_arrays(np.asarray(lats, dtype = np.float64),
+                                         np.asarray(lons, dtype = np.float64))
+
+        timing = Instrumentation.enabled
+        if timing:
+            start = Instrumentation.clock()
+
+        row, col, t, u = self.locate_many(lats, lons)
+        stencil = Stencil(row, col, t, u, self.values.shape)
+
+        if timing:
+            Instrumentation.lap('grid.cell_lookup', start, lats.size)
+
+        return stencil
+
+    def interpolate(self, lat, lon):
+        '''
+        Bilinear interpolation of the target data at the requested lat/lon
+        '''
+
+        if not self.regular:
+            return self.interpolate_irregular(lat, lon)
+
+        timing = Instrumentation.enabled
+        if timing:
+            start = Instrumentation.clock()
+
+        row, col, t, u = self.locate(lat, lon)
+        if timing:
+            start = Instrumentation.lap('grid.cell_lookup', start)
+
+        v = self.values
+        res = float((1.0-t)*(1.0-u)*v[row, col] + t*(1.0-u)*v[row+1, col] +
+                    (1.0-t)*u*v[row, col+1] + t*u*v[row+1, col+1])
+        if timing:
+            Instrumentation.lap('grid.interpolation', start)
+
+        return res
+
+    def interpolate_irregular(self, lat, lon):
+        '''
+        Perform a bilinear interpolation using 4 points on bounding box that
+        has the nearest point to the gound station as one corner. If the
+        requested lat/lon falls on a grid point, just return the target data
+        value at that point.
+
+        NOTE: Equations and variable names come from:
+                  https://en.wikipedia.org/wiki/Bilinear_interpolation
+        '''
+
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return math.nan
+
+        row, col = self.nearest_node(lat, lon)
+        lat_data, lon_data = self.lat_data, self.lon_data
+        target_data = self.target_data
+
+        if lat_data[row, col] == lat and lon_data[row, col] == lon:
+            return float(target_data[row, col])
+
+        # Keep the bounding box inside the grid
+        row = min(max(row, 1), self.row_count - 2)
+        col = min(max(col, 1), self.col_count - 2)
+        closest = tuple((lat_data[row, col], lon_data[row, col]))
+
+        # Define variables using bounding box defined by the closest grid point
+        if closest[0] < lat and closest[1] < lon:
+            # Closest grid point is lower-left corner of the bounding box
+            r1, c1, r2, c2 = row, col, row-1, col+1
+        elif closest[0] < lat and closest[1] > lon:
+            # Closest grid point is lower-right corner of the bounding box
+            r1, c1, r2, c2 = row, col-1, row-1, col
+        elif closest[0] > lat and closest[1] < lon:
+            # Closest grid point is top-left corner of the bounding box
+            r1, c1, r2, c2 = row+1, col, row, col+1
+        else:
+            # Closest grid point is top-right corner of the bounding box
+            r1, c1, r2, c2 = row+1, col-1, row, col
+
+        x1   = lat_data[r1, c1]
+        y1   = lon_data[r1, c1]
+        x2   = lat_data[r2, c2]
+        y2   = lon_data[r2, c2]
+        fQ11 = target_data[r1, c1]
+        fQ21 = target_data[r2, c1]
+        fQ12 = target_data[r1, c2]
+        fQ22 = target_data[r2, c2]
+
+        # Perform the interpolation
+        res = 1.0 / ((x2-x1)*(y2-y1)) *\
+             (fQ11*(x2-lat)*(y2-lon) +\
+              fQ21*(lat-x1)*(y2-lon) +\
+              fQ12*(x2-lat)*(lon-y1) +\
+              fQ22*(lat-x1)*(lon-y1))
+
+        return float(res)
+
+class Stencil:
+    def __init__(self, row, col, t, u, layer_shape):
+        '''
+        Constructor
+
+        Bilinear interpolation stencil of a set of sites on a regular grid:
+        the flat indices of the four corners of the cell enclosing each site
+        and their weights. Built once from the cell search, it interpolates
+        any number of target layers with the same geometry, each as a sparse
+        matrix-vector product with four entries per site.
+        '''
+
+        cols = layer_shape[1]
+        base = row * cols + col
+
+        self.shape       = np.shape(row)
+        self.layer_shape = tuple(layer_shape)
+        self.indices     = np.stack((base, base + cols, base + 1,
+                                     base + cols + 1), axis = -1)
+        self.weights     = np.stack(((1.0-t)*(1.0-u), t*(1.0-u), (1.0-t)*u,
+                                     t*u), axis = -1)
+
+    def apply(self, values):
+        '''
+        Interpolate a target layer (rows x cols), or a stack of layers
+        (... x rows x cols), at the sites. The result has the shape of the
+        sites, preceded by the stack dimensions.
+        '''
+
+        values = np.asarray(values)
+        if values.shape[-2:] != self.layer_shape:
+            raise ValueError('Layer shape ' + str(values.shape[-2:]) +
+                             ' does not match the stencil ' +
+                             str(self.layer_shape))
+
+        timing = Instrumentation.enabled
+        if timing:
+            start = Instrumentation.clock()
+
+        flat = values.reshape(values.shape[:-2] + (-1,))
+        res  = (flat[..., self.indices] * self.weights).sum(axis = -1)
+
+        if timing:
+            Instrumentation.lap('grid.interpolation', start,
+                                res.size)
+
+        return res
+
+    def matrix(self):
+        '''
+        The stencil as a scipy.sparse CSR matrix (sites x grid nodes); needs
+        SciPy
+        '''
+
+        from scipy.sparse import csr_matrix
+
+        count = self.indices.size // 4
+        return csr_matrix((self.weights.ravel(), self.indices.ravel(),
+                           np.arange(0, 4 * count + 1, 4)),
+                          shape = (count, self.layer_shape[0] *
+                                   self.layer_shape[1]))
+
+def interpolate_layers(lats, lons, layers, stencils = None):
+    '''
+    Interpolate several maps at the same lat/lons. layers is a sequence of
+    (directories, convert_to_west) pairs; the cell search and weights are
+    done once per distinct grid geometry and shared by every map with that
+    geometry. Returns one array per layer.
+
+    stencils is an optional dictionary (geometry -> Stencil) kept by the
+    caller to reuse the stencils over several calls with the same lat/lons;
+    it must not be shared between different sets of sites.
+    '''
+
+    if stencils is None:
+        stencils = {}
+
+    res = []
+    for directories, convert_to_west in layers:
+        grid = select_grid(directories, convert_to_west, lats, lons)
+        if not grid.regular:
+            res.append(grid.interpolate_many(lats, lons))
+            continue
+
+        key = grid.geometry()
+        if key not in stencils:
+            stencils[key] = grid.stencil(lats, lons)
+        res.append(stencils[key].apply(grid.values))
+
+    return res
+
+def grid_cache_path(directories, convert_to_west):
+    '''
+    Directory holding the binary cache of a map set
+    '''
+
+    target = os.path.abspath(directories['Target'])
+    name   = os.path.basename(target) + ('.west' if convert_to_west else '') +\
+             '.gridcache'
+
+    if grid_cache_dir is None:
+        return os.path.join(os.path.dirname(target), name)
+
+    # Keep caches of same-named maps from different directories apart
+    tag = '%08x' % zlib.crc32(os.path.dirname(target).encode())
+    return os.path.join(grid_cache_dir, tag + '-' + name)
+
+def replace_file(path, name, write, mode = 'wb'):
+    '''
+    Write the file name under path through write(fp) on a uniquely named
+    temporary file, then move it into place. Concurrent writers of the same
+    cache never share a temporary file, and a failed write leaves no trace.
+    '''
+
+    fd, tmp = tempfile.mkstemp(dir = path, prefix = name + '.',
+                               suffix = '.tmp')
+    try:
+        with os.fdopen(fd, mode) as fp:
+            write(fp)
+        os.replace(tmp, os.path.join(path, name))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def write_grid_cache(grid, directories, convert_to_west, mtimes,
+                     dtype = None):
+    '''
+    Write a parsed grid to its binary cache. The arrays are written first and
+    the header last, so a reader never accepts a partially written cache.
+    '''
+
+    path = grid_cache_path(directories, convert_to_west)
+    os.makedirs(path, exist_ok = True)
+
+    if grid.regular:
+        arrays = {'values': grid.values}
+    else:
+        arrays = {'lat': grid.lat_data, 'lon': grid.lon_data,
+                  'target': grid.target_data}
+
+    for name, data in arrays.items():
+        if dtype is not None:
+            data = data.astype(dtype)
+        data = np.ascontiguousarray(data)
+        replace_file(path, name + '.npy', lambda fp: np.save(fp, data))
+
+    header = {'version': GRID_CACHE_VERSION,
+              'convert_to_west': bool(convert_to_west),
+              'sources': [os.path.abspath(directories[name])
+                          for name in ('Lat', 'Lon', 'Target')],
+              'mtimes': list(mtimes),
+              'regular': grid.regular,
+              'lattice': grid.lattice() if grid.regular else None}
+
+    replace_file(path, 'header.json', lambda fp: json.dump(header, fp),
+                 mode = 'w')
+
+def read_grid_cache_header(directories, convert_to_west, mtimes):
+    '''
+    Header of the binary cache of a map set, or None if there is no cache or
+    if it was built from older versions of the files
+    '''
+
+    path = grid_cache_path(directories, convert_to_west)
+    try:
+        with open(os.path.join(path, 'header.json'), 'r') as fp:
+            header = json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(header, dict) or\
+       header.get('version') != GRID_CACHE_VERSION or\
+       header.get('mtimes') != list(mtimes):
+        return None
+
+    return header
+
+def read_grid_cache(directories, convert_to_west, mtimes):
+    '''
+    Open the binary cache of a map set with memory-mapping. Returns None if
+    there is no cache or if it was built from older versions of the files.
+    '''
+
+    header = read_grid_cache_header(directories, convert_to_west, mtimes)
+    if header is None:
+        return None
+
+    path = grid_cache_path(directories, convert_to_west)
+    try:
+        if header['regular']:
+            values = np.load(os.path.join(path, 'values.npy'),
+                             mmap_mode = 'r')
+            return lattice_grid(values, **header['lattice'])
+
+        return Grid(*[np.load(os.path.join(path, name + '.npy'),
+                              mmap_mode = 'r')
+                      for name in ('lat', 'lon', 'target')])
+    except (OSError, ValueError, EOFError, KeyError, TypeError):
+        return None
+
+class MappedValues:
+    def __init__(self, path):
+        '''
+        Constructor
+
+        Read-only access to the 2D float matrix of a .npy file through mmap
+        and struct, without NumPy. Only the values that are indexed are read.
+        '''
+
+        with open(path, 'rb') as fp:
+            self.buffer = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if self.buffer[:6] != b'\x93NUMPY':
+            raise ValueError('Not a .npy file: ' + path)
+
+        if self.buffer[6] == 1:
+            length = struct.unpack_from('<H', self.buffer, 8)[0]
+            self.offset = 10 + length
+        else:
+            length = struct.unpack_from('<I', self.buffer, 8)[0]
+            self.offset = 12 + length
+        header = ast.literal_eval(
+            self.buffer[self.offset - length:self.offset].decode('latin-1'))
+
+        formats = {'<f8': '<d', '<f4': '<f'}
+        if header['descr'] not in formats or header['fortran_order'] or\
+           len(header['shape']) != 2:
+            raise ValueError('Unsupported .npy layout: ' + path)
+
+        self.format   = formats[header['descr']]
+        self.itemsize = struct.calcsize(self.format)
+        self.shape    = tuple(header['shape'])
+
+        # A truncated file is rejected here rather than on the first lookup
+        # past its end
+        if len(self.buffer) < self.offset +\
+           self.shape[0] * self.shape[1] * self.itemsize:
+            raise ValueError('Truncated .npy file: ' + path)
+
+    def __getitem__(self, index):
+        row, col = index
+
+        offset = self.offset + (row * self.shape[1] + col) * self.itemsize
+
+        return struct.unpack_from(self.format, self.buffer, offset)[0]
+
+class GridSnapshot(Grid):
+    def __init__(self, values, lattice, directories, convert_to_west):
+        '''
+        Constructor
+
+        Regular grid served straight from its binary cache for single-point
+        interpolation, without importing NumPy. Anything needing whole
+        matrices (array interpolation, the Lat/Lon/Target data) falls through
+        to the full grid, loaded on first use.
+        '''
+
+        self.regular  = True
+        self.lat0     = float(lattice['lat0'])
+        self.dlat     = float(lattice['dlat'])
+        self.lon0     = float(lattice['lon0'])
+        self.dlon     = float(lattice['dlon'])
+        self.periodic = bool(lattice['periodic'])
+        self.values   = values
+        self.window   = None
+
+        self.row_count, self.col_count = values.shape
+
+        self.directories     = directories
+        self.convert_to_west = convert_to_west
+
+    def full(self):
+        return load_grid(self.directories, self.convert_to_west)
+
+    @property
+    def lat_data(self):
+        return self.full().lat_data
+
+    @property
+    def lon_data(self):
+        return self.full().lon_data
+
+    @property
+    def target_data(self):
+        return self.full().target_data
+
+    def locate_many(self, lats, lons):
+        return self.full().locate_many(lats, lons)
+
+    def interpolate_many(self, lats, lons):
+        return self.full().interpolate_many(lats, lons)
+
+    def geometry(self):
+        return self.full().geometry()
+
+    def stencil(self, lats, lons):
+        return self.full().stencil(lats, lons)
+
+def load_snapshot(directories, convert_to_west = True):
+    '''
+    Grid for single-point interpolation: the full grid if the registry
+    already holds it, otherwise a snapshot of the binary cache. Returns None
+    if the map has no up to date cache of a regular grid.
+    '''
+
+    key, mtimes = grid_key(directories, convert_to_west)
+
+    for entry in (_grid_registry.get(key),
+                  _grid_registry.get(key + ('snapshot',))):
+        if entry is not None and entry[0] == mtimes:
+            return entry[1]
+
+    timing = Instrumentation.enabled
+    if timing:
+        start = Instrumentation.clock()
+
+    header = read_grid_cache_header(directories, convert_to_west, mtimes)
+    if header is None or not header.get('regular'):
+        return None
+
+    # A damaged cache is a cache miss
+    path = grid_cache_path(directories, convert_to_west)
+    try:
+        values = MappedValues(os.path.join(path, 'values.npy'))
+        grid   = GridSnapshot(values, header['lattice'], directories,
+                              convert_to_west)
+    except (OSError, ValueError, SyntaxError, KeyError, TypeError,
+            struct.error):
+        return None
+
+    if timing:
+        Instrumentation.lap('grid.load.snapshot', start)
+
+    _grid_registry[key + ('snapshot',)] = (mtimes, grid)
+
+    return grid
+
+def lattice_grid(values, lat0, dlat, lon0, dlon, periodic):
+    '''
+    Build a grid from the target values of a regular lattice. The Lat/Lon
+    matrices are broadcast views of the axes and take no memory.
+    '''
+
+    rows, cols = values.shape
+    lat_axis = lat0 + dlat * np.arange(rows)
+    lon_axis = lon0 + dlon * np.arange(cols)
+
+    return Grid(np.broadcast_to(lat_axis[:, None], values.shape),
+                np.broadcast_to(lon_axis[None, :], values.shape),
+                values,
+                {'lat0': lat0, 'dlat': dlat, 'lon0': lon0, 'dlon': dlon,
+                 'periodic': periodic})
+
+def text_lines(buffer):
+    # Non-blank lines of a bytes buffer, without their surrounding whitespace
+    return [line for line in [line.strip() for line in buffer.split(b'\n')]
+            if line]
+
+def constant_row(line):
+    '''
+    The field of a line made of a single field repeated (as the rows of the
+    Lat files are), or None
+    '''
+
+    field = line.split(None, 1)[0]
+    if line.rsplit(None, 1)[-1] != field or\
+       line.replace(field, b'').strip() or field + field in line:
+        return None
+
+    return field
+
+def parse_text_lines(lines, threads = None, executor = None):
+    '''
+    Parse the lines of a whitespace separated text matrix in bulk. Each
+    distinct line is only parsed once, and a line repeating a single field
+    only has that field parsed, which makes the Lat and Lon files of a map
+    almost free. The other lines go through np.loadtxt() in one call, or in
+    line-aligned chunks on an executor when threads > 1.
+    '''
+
+    distinct = {}
+    inverse  = [distinct.setdefault(line, len(distinct)) for line in lines]
+
+    fields, full = [], []
+    for line in distinct:
+        field = constant_row(line)
+        fields.append(field)
+        if field is None:
+            full.append(line)
+
+    # Field count of the constant rows
+    counts = set(line.count(field) for line, field in zip(distinct, fields)
+                 if field is not None)
+
+    if full:
+        if threads and threads > 1 and executor is not None:
+            size   = -(-len(full) // threads)
+            chunks = [b'\n'.join(full[i:i + size])
+                      for i in range(0, len(full), size)]
+            parsed = np.vstack(list(executor.map(parse_text_matrix, chunks)))
+        else:
+            parsed = parse_text_matrix(b'\n'.join(full))
+        counts.add(parsed.shape[1])
+
+    if len(counts) > 1:
+        raise ValueError('Rows have different numbers of columns: ' +
+                         str(sorted(counts)))
+
+    values = np.empty((len(distinct), counts.pop() if counts else 0))
+    constant = [i for i, field in enumerate(fields) if field is not None]
+    if constant:
+        values[constant] = np.loadtxt(
+            io.BytesIO(b'\n'.join(fields[i] for i in constant)),
+            dtype = np.float64, ndmin = 1)[:, None]
+    if full:
+        values[[i for i, field in enumerate(fields) if field is None]] = parsed
+
+    return values[inverse]
+
+def parse_text_matrix(buffer):
+    '''
+    Parse a whitespace separated text matrix held in a bytes buffer in one
+    pass
+    '''
+
+    return np.loadtxt(io.BytesIO(buffer), dtype = np.float64, ndmin = 2)
+
+def convert_grid_to_binary(directories, convert_to_west = True,
+                           dtype = None):
+    '''
+    One-time conversion of a (Lat, Lon, Target) set of text files to the
+    binary cache, optionally storing the values as float32 (dtype) to halve
+    its size.
+    Later loads of the map memory-map the cache instead of parsing the text.
+    '''
+
+    key, mtimes = grid_key(directories, convert_to_west)
+    grid = parse_grid(directories, convert_to_west)
+    write_grid_cache(grid, directories, convert_to_west, mtimes, dtype)
+    _grid_registry.pop(key, None)
+
+    return grid_cache_path(directories, convert_to_west)
+
+def parse_grid(directories, convert_to_west):
+    '''
+    Parse a (Lat, Lon, Target) set of text files into a grid
+    '''
+
+    reader = BilinearInterpolation(None, None, directories, convert_to_west)
+    reader.open_files()
+    try:
+        reader.get_matrix_dimensions()
+        reader.read_data()
+    finally:
+        reader.close_files()
+
+    return Grid(reader.lat_data, reader.lon_data, reader.target_data)
+
+def load_grid(directories, convert_to_west = True):
+    '''
+    Return the grid for the given files. Grids are held by the registry for
+    the life of the process; the first load of a map memory-maps its binary
+    cache if it is up to date, and otherwise parses the text files and
+    (re)builds the cache.
+    '''
+
+    key, mtimes = grid_key(directories, convert_to_west)
+
+    entry = _grid_registry.get(key)
+    if entry is not None and entry[0] == mtimes:
+        return entry[1]
+
+    timing = Instrumentation.enabled
+    if timing:
+        start = Instrumentation.clock()
+
+    grid = None
+    if use_grid_cache:
+        grid = read_grid_cache(directories, convert_to_west, mtimes)
+        stage = 'grid.load.cache'
+
+    if grid is None:
+        grid = parse_grid(directories, convert_to_west)
+        stage = 'grid.load.text'
+        if use_grid_cache:
+            try:
+                write_grid_cache(grid, directories, convert_to_west, mtimes)
+            except OSError:
+                # Read-only map directory; keep going without the cache
+                pass
+
+    if timing:
+        Instrumentation.lap(stage, start)
+
+    _grid_registry[key] = (mtimes, grid)
+
+    return grid
+
+# Optional regional windows of the maps: (Lat, Lon, Target) paths -> bounding
+# box (lat_min, lat_max, lon_min, lon_max). Only the rows and columns of a
+# windowed map covering the box are parsed; the whole map is loaded on demand
+# the first time a query falls outside of it.
+_grid_windows = {}
+
+def set_grid_window(directories, bbox):
+    '''
+    Restrict the loading of a map to a bounding box (lat_min, lat_max,
+    lon_min, lon_max) in degrees, or lift the restriction if bbox is None.
+    The box may cross the antimeridian (lon_min > lon_max).
+    '''
+
+    paths = tuple(os.path.abspath(directories[name])
+                  for name in ('Lat', 'Lon', 'Target'))
+
+    if bbox is None:
+        _grid_windows.pop(paths, None)
+    else:
+        lat_min, lat_max, lon_min, lon_max = [float(x) for x in bbox]
+        if lat_min > lat_max:
+            raise ValueError('lat_min must not exceed lat_max')
+        _grid_windows[paths] = (lat_min, lat_max, lon_min, lon_max)
+
+def get_grid_window(directories):
+    # Bounding box a map is restricted to, or None
+    paths = tuple(os.path.abspath(directories[name])
+                  for name in ('Lat', 'Lon', 'Target'))
+
+    return _grid_windows.get(paths)
+
+def parse_window(directories, convert_to_west, bbox):
+    '''
+    Parse the part of a regular map covering a bounding box, plus a one-cell
+    halo so the bilinear stencil of every point of the box is complete. Rows
+    of the Target file outside of the window are skipped without being
+    parsed. Returns None if the map is not a regular lattice.
+    '''
+
+    lat_min, lat_max, lon_min, lon_max = bbox
+
+    # Latitude of every row and longitude of every column
+    with open(directories['Lat'], 'r') as fp:
+        lat_axis = np.array([float(line.split(None, 1)[0])
+                             for line in fp if line.strip()])
+    with open(directories['Lon'], 'r') as fp:
+        lon_axis = np.array(fp.readline().split(), dtype = np.float64)
+    if convert_to_west:
+        lon_axis = np.mod(lon_axis + 180.0, 360.0) - 180.0
+
+    if len(lat_axis) < 2 or len(lon_axis) < 2:
+        return None
+
+    lat_sorted = np.sort(lat_axis)
+    lon_sorted = np.unique(lon_axis)
+    dlat = (lat_sorted[-1] - lat_sorted[0]) / (len(lat_sorted) - 1)
+    dlon = (lon_sorted[-1] - lon_sorted[0]) / (len(lon_sorted) - 1)
+    if not (np.allclose(np.diff(lat_sorted), dlat) and
+            np.allclose(np.diff(lon_sorted), dlon)):
+        return None
+
+    # Rows within the box and its halo, in ascending latitude
+    rows = np.flatnonzero((lat_axis >= lat_min - dlat) &
+                          (lat_axis <= lat_max + dlat))
+    rows = rows[np.argsort(lat_axis[rows], kind = 'stable')]
+
+    # Columns within the box and its halo, measured eastwards from the west
+    # edge of the halo so that boxes across the antimeridian are contiguous
+    lon_start = lon_min - dlon
+    lon_span  = np.mod(lon_max - lon_min, 360.0) + 2.0 * dlon
+    offsets   = np.mod(lon_axis - lon_start, 360.0)
+    offsets, cols = np.unique(offsets, return_index = True)
+    keep    = offsets <= lon_span + 1e-9 * dlon
+    offsets = offsets[keep]
+    cols    = cols[keep]
+
+    if len(rows) < 2 or len(cols) < 2 or lon_span >= 360.0:
+        return None
+
+    # Parse the selected rows only
+    selected = dict((row, i) for i, row in enumerate(rows))
+    values   = np.empty((len(rows), len(cols)), dtype = np.float64)
+    with open(directories['Target'], 'r') as fp:
+        for row, line in enumerate(fp):
+            i = selected.get(row)
+            if i is not None:
+                values[i] = np.array(line.split(), dtype = np.float64)[cols]
+
+    grid = lattice_grid(values, lat_axis[rows[0]], dlat,
+                        lon_start + offsets[0], dlon, False)
+    grid.window = (float(lat_axis[rows[0]]), float(lat_axis[rows[-1]]),
+                   float(lon_start + offsets[0]),
+                   float(offsets[-1] - offsets[0]))
+
+    return grid
+
+def load_window(directories, convert_to_west, bbox):
+    '''
+    Return the grid of the window of a map, parsing it on first use. If the
+    binary cache of the whole map is up to date it is memory-mapped instead,
+    since only the pages that are touched get read.
+    '''
+
+    key, mtimes = grid_key(directories, convert_to_west)
+    key = key + (bbox,)
+
+    entry = _grid_registry.get(key)
+    if entry is not None and entry[0] == mtimes:
+        return entry[1]
+
+    timing = Instrumentation.enabled
+    if timing:
+        start = Instrumentation.clock()
+
+    grid = None
+    if use_grid_cache:
+        grid = read_grid_cache(directories, convert_to_west, mtimes)
+    if grid is None:
+        grid = parse_window(directories, convert_to_west, bbox)
+    if grid is None:
+        # Not a regular lattice; use the whole map
+        grid = load_grid(directories, convert_to_west)
+
+    if timing:
+        Instrumentation.lap('grid.load.window', start)
+
+    _grid_registry[key] = (mtimes, grid)
+
+    return grid
+
+def select_grid(directories, convert_to_west, lats, lons):
+    '''
+    Grid to interpolate the requested lat/lons from: the window of the map if
+    one is set and covers all of them, otherwise the whole map
+    '''
+
+    if _grid_windows:
+        bbox = get_grid_window(directories)
+        if bbox is not None:
+            grid = load_window(directories, convert_to_west, bbox)
+            if grid.covers(lats, lons):
+                return grid
+
+    return load_grid(directories, convert_to_west)
 
 class BilinearInterpolation:
     def __init__(self, lat, lon, directories, convert_to_west = True):
@@ -21,26 +1148,27 @@ class BilinearInterpolation:
         self.target_dir  = directories["Target"]
         self.target_fp   = -1
 
-        # Matrix dimensions
+        # Matrix dimensions, and the lines of the files read to find them
         self.row_count   = -1
         self.col_count   = -1
+        self.lines       = None
 
         # Matrix data
         self.lat_data    = -1
         self.lon_data    = -1
         self.target_data = -1
 
-        # Matrix of distances from grid points to desired lat/lon
-        self.distances   = []
+        # Parsed grid shared through the registry
+        self.grid        = None
 
     def open_files(self):
         '''
         Open the files
         '''
 
-        self.lat_fp    = open(self.lat_dir, 'r')
-        self.lon_fp    = open(self.lon_dir, 'r')
-        self.target_fp = open(self.target_dir, 'r')
+        self.lat_fp    = open(self.lat_dir, 'rb')
+        self.lon_fp    = open(self.lon_dir, 'rb')
+        self.target_fp = open(self.target_dir, 'rb')
 
     def close_files(self):
         '''
@@ -51,188 +1179,121 @@ class BilinearInterpolation:
         self.lon_fp.close()
         self.target_fp.close()
 
-    def reset_files(self):
-        '''
-        Rese the file pointers to beginning of the files
-        '''
-
-        self.lat_fp.seek(0)
-        self.lon_fp.seek(0)
-        self.target_fp.seek(0)
-
     def get_matrix_dimensions(self):
         '''
         Get the number of rows and columns, and make sure they are the same
         for all file types.
         '''
 
-        # Do a count of the number of rows and columns in the data. Do a cross-
-        # check to make sure all three matrices are the same dimensions.
+        # Each file is read once and split into lines, which read_data() then
+        # parses. Do a cross-check to make sure all three matrices are the
+        # same dimensions.
+        self.lines = [text_lines(fp.read()) for fp in (self.lat_fp,
+                                                       self.lon_fp,
+                                                       self.target_fp)]
+        dimensions = [(len(lines), len(lines[0].split()) if lines else 0)
+                      for lines in self.lines]
 
-        lat_row_count    = len(self.lat_fp.readlines())
-        lon_row_count    = len(self.lon_fp.readlines())
-        target_row_count = len(self.target_fp.readlines())
+        (lat_row_count, lat_col_count), (lon_row_count, lon_col_count),\
+            (target_row_count, target_col_count) = dimensions
 
-        self.reset_files()
-        
-        row_count, col_count = -1, -1
-        
-        if lat_row_count + lon_row_count + target_row_count == 3*lat_row_count:
-            self.row_count = lat_row_count
-    
-            lat_row    = [float(x) for x in self.lat_fp.readline().split()]
-            lon_row    = [float(x) for x in self.lon_fp.readline().split()]
-            target_row = [float(x) for x in self.target_fp.readline().split()]
-
-            if len(lat_row) + len(lon_row) + len(target_row) == 3*len(lat_row):
-                self.col_count = len(lat_row)
-            else:
-                row_error = 'Col count differs across files!' + os.linesep() +\
-                            '    Lat = ' + str(len(lat_row)) + os.linesep() +\
-                            '    Lon = ' + str(len(lon_row)) + os.linesep() +\
-                            '    Target = ' + str(len(target_row))
-                raise ValueError(col_error)        
-        else:
-            row_error = 'Row count differs across files!' + os.linesep() +\
-                        '    Lat = ' + str(lat_row_count) + os.linesep() +\
-                        '    Lon = ' + str(lon_row_count) + os.linesep() +\
+        if not lat_row_count == lon_row_count == target_row_count:
+            row_error = 'Row count differs across files!' + os.linesep +\
+                        '    Lat = ' + str(lat_row_count) + os.linesep +\
+                        '    Lon = ' + str(lon_row_count) + os.linesep +\
                         '    Target = ' + str(target_row_count)
             raise ValueError(row_error)
 
-        self.reset_files()
-                 
-    def read_data(self):
+        if not lat_col_count == lon_col_count == target_col_count:
+            col_error = 'Col count differs across files!' + os.linesep +\
+                        '    Lat = ' + str(lat_col_count) + os.linesep +\
+                        '    Lon = ' + str(lon_col_count) + os.linesep +\
+                        '    Target = ' + str(target_col_count)
+            raise ValueError(col_error)
+
+        self.row_count = lat_row_count
+        self.col_count = lat_col_count
+
+    def read_data(self, threads = None):
         '''
-        Read the data from the filie into 2D matrices
+        Read the data from the files into 2D matrices
         '''
-        
-        # Read in the provided data into three separate matrices
-        self.lat_data = [[0 for _ in range(self.col_count)]\
-                            for _ in range(self.row_count)]
-        self.lon_data = [[0 for _ in range(self.col_count)]\
-                            for _ in range(self.row_count)]
-        self.target_data = [[0 for _ in range(self.col_count)]\
-                               for _ in range(self.row_count)]
-
-        row = 0
-        while True:
-            lat_raw    = self.lat_fp.readline()
-            lon_raw    = self.lon_fp.readline()
-            target_raw = self.target_fp.readline()
-
-            if not (lat_raw and lon_raw and target_raw):
-                break
 
-            # Convert the string values into floats
-            # NOTE: longitude conversion reference: https://tinyurl.com/2s9hrnux
-            lat = [float(x) for x in lat_raw.split()]
-            if self.convert_to_west:
-                lon = [((float(x)+180.0)%360.0)-180.0 for x in lon_raw.split()]
-            else:
-                lon = [float(x) for x in lon_raw.split()]
-            target = [float(x) for x in target_raw.split()]
-    
-            for col in range(len(lat)):
-                self.lat_data[row][col]    = lat[col]
-                self.lon_data[row][col]    = lon[col]
-                self.target_data[row][col] = target[col]
+        if threads is None:
+            threads = parse_threads
+
+        # Parse the lines of each file in bulk into a float matrix; every row
+        # must have the same number of columns
+        if threads and threads > 1:
+            with ThreadPoolExecutor(max_workers = threads) as executor:
+                matrices = [parse_text_lines(lines, threads, executor)
+                            for lines in self.lines]
+        else:
+            matrices = [parse_text_lines(lines) for lines in self.lines]
+        self.lines = None
+
+        shape = (self.row_count, self.col_count)
+        for name, data in zip(('Lat', 'Lon', 'Target'), matrices):
+            if data.shape != shape:
+                raise ValueError(name + ' matrix is ' + str(data.shape) +
+                                 ', expected ' + str(shape))
 
-            row = row + 1
+        self.lat_data, self.lon_data, self.target_data = matrices
 
-    def compute_distances(self):
+        # NOTE: longitude conversion reference: https://tinyurl.com/2s9hrnux
+        if self.convert_to_west:
+            self.lon_data = np.mod(self.lon_data + 180.0, 360.0) - 180.0
+
+    def find_grid(self):
         '''
-        Compute the distances from the requested lat/lon position to each of
-        the grid points, and sort ascending so that the closest grid point is
-        at the beginning of the list
+        Get the grid for the requested lat/lon from the process-wide grid
+        registry, parsing the files only the first time they are requested
+        (only the regional window if one is set and covers the requested
+        lat/lon)
         '''
 
-        for row in range(self.row_count):
-            for col in range(self.col_count):
-                self.distances.append(tuple((
-                    row,
-                    col,
-                    math.sqrt(
-                        (self.lat_data[row][col] - self.lat)**2 +\
-                        (self.lon_data[row][col] - self.lon)**2))))
+        directories = {'Lat': self.lat_dir,
+                       'Lon': self.lon_dir,
+                       'Target': self.target_dir}
+
+        # A single point only needs four values: read them straight from the
+        # binary cache when there is one
+        grid = None
+        if use_grid_cache and get_grid_window(directories) is None:
+            grid = load_snapshot(directories, self.convert_to_west)
+        if grid is None:
+            grid = select_grid(directories, self.convert_to_west, self.lat,
+                               self.lon)
+
+        self.grid = grid
 
-        # Sort the list of tuples by the third element (which is the distance)
-        self.distances.sort(key = lambda x:x[2])
+        return grid
 
     def interpolate(self):
         '''
-        Perform a bilinear interpolation using 4 points on bounding box that
-        has the nearest point to the gound station as one corner. If the
-        requested lat/lon falls on a grid point, just return the target data
-        value at that point.
+        Perform a bilinear interpolation using the 4 grid points of the cell
+        that encloses the ground station. On a regular lat/lon lattice the
+        cell is found by index arithmetic from the grid origin and spacing;
+        otherwise the nearest grid point is found through a bucket index and
+        used as one corner of the bounding box.
 
         NOTE: Equations and variable names come from:
                   https://en.wikipedia.org/wiki/Bilinear_interpolation
         '''
 
-        # Read in the data and compute the distances from the requested lat/lon
-        # to each of the grid points
-        self.open_files()
-        self.get_matrix_dimensions()
-        self.read_data()
-        self.close_files()
-        self.compute_distances()
-        
-        if self.distances[0][2] == 0.0:
-            res = self.target_data[self.distances[0][0]][self.distances[0][1]]
-        else:
-            # Get lat/lon data for the closest point
-            row, col = self.distances[0][0], self.distances[0][1]
-            closest  = tuple((self.lat_data[row][col], self.lon_data[row][col]))
-
-            # Define variables using bounding box defined by the closest grid point
-            if closest[0] < self.lat and closest[1] < self.lon:
-                # Closest grid point is lower-left corner of the bounding box
-                x1   = self.lat_data[row][col]
-                y1   = self.lon_data[row][col]
-                x2   = self.lat_data[row-1][col+1]
-                y2   = self.lon_data[row-1][col+1]
-                fQ11 = self.target_data[row][col]
-                fQ21 = self.target_data[row][col+1]
-                fQ12 = self.target_data[row-1][col]
-                fQ22 = self.target_data[row-1][col+1]
-            elif closest[0] < self.lat and closest[1] > self.lon:
-                # Closest grid point is lower-right corner of the bounding box
-                x1   = self.lat_data[row][col-1]
-                y1   = self.lon_data[row][col-1]
-                x2   = self.lat_data[row-1][col]
-                y2   = self.lon_data[row-1][col]
-                fQ11 = self.target_data[row][col-1]
-                fQ21 = self.target_data[row][col]
-                fQ12 = self.target_data[row-1][col-1]
-                fQ22 = self.target_data[row-1][col]
-            elif closest[0] > self.lat and closest[1] < self.lon:
-                # Closest grid point is top-left corner of the bounding box
-                x1   = self.lat_data[row+1][col]
-                y1   = self.lon_data[row+1][col]
-                x2   = self.lat_data[row][col+1]
-                y2   = self.lon_data[row][col+1]
-                fQ11 = self.target_data[row+1][col]
-                fQ21 = self.target_data[row+1][col+1]
-                fQ12 = self.target_data[row][col]
-                fQ22 = self.target_data[row][col+1]
-            else:
-                # Closest grid point is top-right corner of the bounding box
-                x1   = self.lat_data[row+1][col-1]
-                y1   = self.lon_data[row+1][col-1]
-                x2   = self.lat_data[row][col]
-                y2   = self.lon_data[row][col]
-                fQ11 = self.target_data[row+1][col-1]
-                fQ21 = self.target_data[row+1][col]
-                fQ12 = self.target_data[row][col+1]
-                fQ22 = self.target_data[row][col]
-
-            # Perform the interpolation
-            res = 1.0 / ((x2-x1)*(y2-y1)) *\
-                 (fQ11*(x2-self.lat)*(y2-self.lon) +\
-                  fQ21*(self.lat-x1)*(y2-self.lon) +\
-                  fQ12*(x2-self.lat)*(self.lon-y1) +\
-                  fQ22*(self.lat-x1)*(self.lon-y1))
+        # Fetch the grid (parsed once per process) and interpolate in the
+        # cell enclosing the requested lat/lon
+        return self.find_grid().interpolate(self.lat, self.lon)
 
-        return res
+    @classmethod
+    def interpolate_many(cls, lats, lons, directories, convert_to_west = True):
+        '''
+        Interpolate the target data at many lat/lon positions in one call.
+        The cell location and the four-corner weighting are done as whole-
+        array operations, and the result is an array with the broadcast shape
+        of lats and lons.
+        '''
 
-        
+        grid = select_grid(directories, convert_to_west, lats, lons)
+
+        return grid.interpolate_many(lats, lons)
@@ -0,0 +1,268 @@
+import ITU_R_P_618_13
+from ITU_R_P_618_13 import step_1_rain_height, step_2_slant_path_length,\
+                           step_3_horizontal_projection, step_4_rainfall_rate,\
+                           step_5_specific_attenuation,\
+                           step_6_horizontal_reduction_factor,\
+                           step_7_vertical_adjustment_factor,\
+                           step_8_effective_path_length,\
+                           step_9_attenuation_0_01, step_10_attenuation
+from ITU_R_P_838_3 import compute_k_H_or_V, compute_alpha_H_or_V,\
+                          polarization_factor, combine_k, combine_alpha,\
+                          coeffs_k_H, coeffs_k_V, coeffs_alpha_H,\
+                          coeffs_alpha_V
+
+# Inputs of a link; R_0_01 is None to look it up from the ITU-R P.837-7 maps
+inputs = ('h_s', 'theta', 'lat', 'lon', 'f', 'p', 'pol', 'R_0_01')
+
+# Nodes of the ITU-R P.618-13 chain and the inputs or nodes each depends on,
+# in an order where every node comes after its dependencies. The node x is
+# computed by EvaluationGraph.compute_x(). Nodes past an early exit of the
+# chain (h_R - h_s <= 0 or R_0.01 = 0) evaluate to None.
+nodes = (
+    ('h_R',     ('lat', 'lon')),
+    ('wet',     ('h_R', 'h_s')),
+    ('L_s',     ('wet', 'h_R', 'h_s', 'theta')),
+    ('L_G',     ('L_s', 'theta')),
+    ('rain',    ('wet', 'lat', 'lon', 'R_0_01')),
+    ('coeffs',  ('f',)),
+    ('factor',  ('theta', 'pol')),
+    ('k_alpha', ('rain', 'coeffs', 'factor')),
+    ('gamma_R', ('rain', 'k_alpha')),
+    ('r_0_01',  ('L_G', 'gamma_R', 'f')),
+    ('step_7',  ('h_R', 'h_s', 'theta', 'lat', 'f', 'L_G', 'r_0_01',
+                 'gamma_R')),
+    ('L_E',     ('step_7',)),
+    ('A_0_01',  ('gamma_R', 'L_E')),
+    ('step_10', ('A_0_01', 'p', 'lat', 'theta'))
+)
+
+dependencies = dict(nodes)
+
+# Nodes that depend on each input or node, directly or not
+dependents = {}
+for name in inputs + tuple(node for node, _ in nodes):
+    found = {name}
+    for node, deps in nodes:
+        if found.intersection(deps):
+            found.add(node)
+    dependents[name] = frozenset(found - {name})
+
+def unchanged(old, new):
+    # Whether a value is the same as before, so that the nodes depending on
+    # it stay valid (NaN never is)
+    try:
+        return(bool(old == new))
+    except (TypeError, ValueError):
+        return(False)
+
+class EvaluationGraph:
+    def __init__(self, maps_dir = None, **values):
+        '''
+        Constructor
+
+        Rain attenuation of one link (ITU-R P.618-13) as a graph of memoized
+        nodes, for interactive use where one input changes at a time. Each
+        node keeps its value along with the versions of the inputs and
+        nodes it was computed from, and is only recomputed when one of them
+        changes. A node recomputed to the same value as before (e.g. the
+        rain height after a change of elevation) does not invalidate the
+        nodes depending on it. So changing the percentage only re-runs step
+        10, changing the polarization skips the map lookups and the
+        frequency coefficients, and so on.
+
+        INPUT PARAMETERS:
+            maps_dir : directory holding the ITU-R P.839-4 and P.837-7 map
+                       directories (defaults to ITU_R_P_618_13.base_dir)
+            values   : initial inputs (h_s, theta, lat, lon, f, p, pol,
+                       R_0_01), see ITU_R_P_618_13.compute_rain_attenuation()
+        '''
+
+        if maps_dir is None:
+            maps_dir = ITU_R_P_618_13.base_dir
+
+        self.maps_dir = maps_dir
+        self.values   = dict.fromkeys(inputs)
+        self.versions = dict.fromkeys(inputs, 0)
+
+        # node -> versions of its dependencies when it was last computed, and
+        # the nodes downstream of the inputs changed since the last evaluation
+        self.computed  = {}
+        self.stale     = set(dependencies)
+        self.functions = {name: getattr(self, 'compute_' + name)
+                          for name in dependencies}
+
+        self.evaluations = 0
+        self.misses      = dict.fromkeys(dependencies, 0)
+
+        self.set(**values)
+
+    def set(self, **values):
+        '''
+        Change some of the inputs; the nodes depending on them are
+        recomputed by the next evaluate()
+        '''
+
+        for name, value in values.items():
+            if name not in self.versions:
+                raise ValueError('Unknown input: ' + name)
+            if name == 'pol' and value is not None:
+                value = value.lower()
+            if not unchanged(self.values[name], value):
+                self.values[name]   = value
+                self.versions[name] = self.versions[name] + 1
+                self.stale.update(dependents[name])
+
+    def evaluate(self, **values):
+        '''
+        Change some of the inputs (if given) and return the result
+        dictionary of ITU_R_P_618_13.compute_rain_attenuation()
+        '''
+
+        self.set(**values)
+
+        missing = [name for name in inputs
+                   if name != 'R_0_01' and self.values[name] is None]
+        if missing:
+            raise ValueError('Missing inputs: ' + ', '.join(missing))
+
+        self.evaluations = self.evaluations + 1
+        if self.stale:
+            for name, _ in nodes:
+                if name in self.stale:
+                    self.pull(name)
+            self.stale.clear()
+
+        return(self.result())
+
+    def pull(self, name):
+        # Bring one node up to date, assuming that its dependencies are
+        deps     = dependencies[name]
+        versions = self.versions
+        dep_versions = tuple([versions[dep] for dep in deps])
+        if self.computed.get(name) == dep_versions:
+            return
+
+        self.misses[name] = self.misses[name] + 1
+        value = self.functions[name](*[self.values[dep] for dep in deps])
+
+        if name not in self.computed or\
+           not unchanged(self.values[name], value):
+            self.versions[name] = self.versions.get(name, 0) + 1
+        self.values[name]   = value
+        self.computed[name] = dep_versions
+
+    def result(self):
+        # Result dictionary in the form of compute_rain_attenuation()
+        v   = self.values
+        res = dict.fromkeys(ITU_R_P_618_13.result_keys)
+
+        res['h_R'], res['L_s'], res['L_G'] = v['h_R'], v['L_s'], v['L_G']
+        res['R_0_01'] = None if v['rain'] is None else v['rain'][0]
+        if v['k_alpha'] is not None:
+            res['k'], res['alpha'] = v['k_alpha']
+            res['nu_0_01'], res['zeta'], res['L_R'], res['chi'] = v['step_7']
+        res['gamma_R'], res['r_0_01'] = v['gamma_R'], v['r_0_01']
+        res['L_E'], res['A_0_01'] = v['L_E'], v['A_0_01']
+        res['A_p'], res['beta'] = v['step_10']
+
+        return(res)
+
+    def stats(self):
+        '''
+        Cache hits (evaluations served from the memoized value) and misses
+        (recomputations) of each node and in total
+        '''
+
+        res = {'nodes': {name: {'hits': self.evaluations - misses,
+                                'misses': misses}
+                         for name, misses in self.misses.items()}}
+        res['hits']   = sum(n['hits'] for n in res['nodes'].values())
+        res['misses'] = sum(self.misses.values())
+
+        return(res)
+
+    def reset_stats(self):
+        self.evaluations = 0
+        self.misses      = dict.fromkeys(dependencies, 0)
+
+    # Node functions (see nodes)
+
+    def compute_h_R(self, lat, lon):
+        return(step_1_rain_height(lat, lon, self.maps_dir))
+
+    def compute_wet(self, h_R, h_s):
+        return(h_R - h_s > 0.0)
+
+    def compute_L_s(self, wet, h_R, h_s, theta):
+        return(step_2_slant_path_length(h_R, h_s, theta) if wet else None)
+
+    def compute_L_G(self, L_s, theta):
+        if L_s is None:
+            return(None)
+
+        return(step_3_horizontal_projection(L_s, theta))
+
+    def compute_rain(self, wet, lat, lon, R_0_01):
+        # (R_0.01, whether it rains), None if the chain stops before step 4
+        if not wet:
+            return(None)
+        if R_0_01 is None:
+            R_0_01 = step_4_rainfall_rate(lat, lon, self.maps_dir)
+
+        return(R_0_01, R_0_01 != 0)
+
+    def compute_coeffs(self, f):
+        return(compute_k_H_or_V(f, coeffs_k_H),
+               compute_k_H_or_V(f, coeffs_k_V),
+               compute_alpha_H_or_V(f, coeffs_alpha_H),
+               compute_alpha_H_or_V(f, coeffs_alpha_V))
+
+    def compute_factor(self, theta, pol):
+        return(polarization_factor(theta, pol))
+
+    def compute_k_alpha(self, rain, coeffs, factor):
+        if rain is None or not rain[1]:
+            return(None)
+
+        k_H, k_V, alpha_H, alpha_V = coeffs
+        k = combine_k(k_H, k_V, factor)
+
+        return(k, combine_alpha(k_H, k_V, alpha_H, alpha_V, k, factor))
+
+    def compute_gamma_R(self, rain, k_alpha):
+        if k_alpha is None:
+            return(None)
+
+        return(step_5_specific_attenuation(rain[0], *k_alpha))
+
+    def compute_r_0_01(self, L_G, gamma_R, f):
+        if gamma_R is None:
+            return(None)
+
+        return(step_6_horizontal_reduction_factor(L_G, gamma_R, f))
+
+    def compute_step_7(self, h_R, h_s, theta, lat, f, L_G, r_0_01, gamma_R):
+        if gamma_R is None:
+            return(None)
+
+        return(step_7_vertical_adjustment_factor(h_R, h_s, theta, lat, f, L_G,
+                                                 r_0_01, gamma_R))
+
+    def compute_L_E(self, step_7):
+        if step_7 is None:
+            return(None)
+
+        nu_0_01, _, L_R, _ = step_7
+        return(step_8_effective_path_length(L_R, nu_0_01))
+
+    def compute_A_0_01(self, gamma_R, L_E):
+        if gamma_R is None:
+            return(None)
+
+        return(step_9_attenuation_0_01(gamma_R, L_E))
+
+    def compute_step_10(self, A_0_01, p, lat, theta):
+        if A_0_01 is None:
+            return(0.0, None)
+
+        return(step_10_attenuation(A_0_01, p, lat, theta))
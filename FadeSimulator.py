@@ -0,0 +1,238 @@
+import argparse
+import csv
+from math import erfc, exp, log, sqrt
+
+import numpy as np
+
+import ITU_R_P_618_13
+import Instrumentation
+
+def exceedance(x):
+    # Percentage of time a standard Gaussian variable exceeds x
+    return(50.0 * erfc(x / sqrt(2.0)))
+
+def gaussian_threshold(p):
+    '''
+    Level x exceeded for p% of the time by a standard Gaussian variable,
+    found by bisection
+    '''
+
+    lo, hi = -40.0, 40.0
+    for _ in range(200):
+        mid = (lo + hi) / 2
+        if exceedance(mid) > p:
+            lo = mid
+        else:
+            hi = mid
+
+    return((lo + hi) / 2)
+
+class FadeSimulator:
+    def __init__(self, h_s, theta, lat, lon, f, pol, R_0_01 = None,
+                 maps_dir = None, dt = 1.0, beta = 2e-4, p_min = 0.001,
+                 p_max = 5.0, points = 1024, seed = None):
+        '''
+        Constructor
+
+        Synthetic rain fade time series for many links at once. Each link is
+        driven by a stationary Gaussian process with the exponential
+        autocorrelation exp(-beta * tau) of ITU-R P.1853 (a discrete AR(1)
+        process at the time step dt), and every sample is mapped to an
+        attenuation through the long-term statistics of the link: a sample
+        exceeded for p% of the time gives the attenuation A_p exceeded for
+        p% of an average year (ITU-R P.618-13). Samples above p_max give no
+        attenuation and samples beyond p_min are held at A_p(p_min).
+
+        The attenuation as a function of the Gaussian level is tabulated
+        once per link on points levels between the p_max and p_min
+        thresholds, so generating a sample costs a table lookup.
+
+        INPUT PARAMETERS:
+            h_s, theta, lat, lon, f, pol, R_0_01 : link parameters as for
+                       ITU_R_P_618_13.compute_rain_attenuation_many() (arrays
+                       broadcast against each other, one entry per link)
+            maps_dir : directory holding the ITU-R P.839-4 and P.837-7 map
+                       directories
+            dt       : time step of the series (s)
+            beta     : rate of the autocorrelation of the rain process (1/s)
+            p_min    : smallest percentage of the A_p(p) curve (%)
+            p_max    : percentage of time with rain attenuation (%)
+            points   : number of levels of the attenuation tables
+            seed     : seed of the random generator
+        '''
+
+        res = ITU_R_P_618_13.compute_rain_attenuation_many(
+            h_s, theta, lat, lon, f, 0.01, pol,
+            np.nan if R_0_01 is None else R_0_01, maps_dir)
+
+        self.lat    = np.ravel(np.broadcast_to(lat, res['A_p'].shape))
+        self.theta  = np.ravel(np.broadcast_to(theta, res['A_p'].shape))
+        self.A_0_01 = np.nan_to_num(np.ravel(res['A_0_01']), nan = 0.0)
+        self.links  = self.A_0_01.size
+
+        self.dt    = float(dt)
+        self.beta  = float(beta)
+        self.rho   = exp(-self.beta * self.dt)
+        self.p_min = float(p_min)
+        self.p_max = float(p_max)
+
+        # Attenuation at evenly spaced Gaussian levels between the thresholds
+        self.x_lo = gaussian_threshold(self.p_max)
+        self.x_hi = gaussian_threshold(self.p_min)
+        self.dx   = (self.x_hi - self.x_lo) / (points - 1)
+
+        levels = self.x_lo + self.dx * np.arange(points)
+        p      = np.array([exceedance(x) for x in levels])
+        self.table = np.ravel(self.curve(p))
+        self.row   = np.arange(self.links)[:, None] * points
+        self.last  = points - 1
+
+        self.rng   = np.random.default_rng(seed)
+        self.state = self.rng.standard_normal(self.links)
+
+    def curve(self, p):
+        '''
+        Attenuation exceeded for each percentage p (%) on each link; the
+        result has one row per link
+        '''
+
+        p = np.asarray(p, dtype = np.float64)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            A_p, _ = ITU_R_P_618_13.step_10_attenuation_many(
+                self.A_0_01[:, None], p[None, :], self.lat[:, None],
+                self.theta[:, None])
+
+        return(np.where(self.A_0_01[:, None] > 0.0, A_p, 0.0))
+
+    def gaussian(self, samples):
+        '''
+        Next samples of the Gaussian process of each link (links x samples)
+        '''
+
+        w = self.rng.standard_normal((self.links, samples))
+        if self.rho == 0.0:
+            self.state = w[:, -1].copy()
+            return(w)
+
+        # The recursion x[t] = rho x[t-1] + s w[t] is unrolled as a cumulative
+        # sum of the innovations scaled by rho^-k, in blocks short enough for
+        # the scaling to stay within 1e8
+        s     = sqrt(1.0 - self.rho**2)
+        block = max(1, int(log(1e8) / -log(self.rho))) if self.rho < 1.0\
+                else samples
+        for start in range(0, samples, block):
+            stop   = min(start + block, samples)
+            powers = self.rho**np.arange(1, stop - start + 1)
+
+            x = w[:, start:stop]
+            x *= s / powers
+            np.cumsum(x, axis = 1, out = x)
+            x += self.state[:, None]
+            x *= powers
+
+            self.state = x[:, -1].copy()
+
+        return(w)
+
+    def attenuation(self, x):
+        '''
+        Attenuation (dB) of the Gaussian levels x of each link (links x n)
+        '''
+
+        # Only the levels above the p_max threshold (a few percent of the
+        # samples) see any attenuation
+        A = np.zeros(x.shape)
+        link, col = np.nonzero(x >= self.x_lo)
+
+        y = (x[link, col] - self.x_lo) / self.dx
+        i = np.minimum(y.astype(np.intp), self.last - 1)
+        t = np.minimum(y - i, 1.0)
+        i += self.row[link, 0]
+
+        A[link, col] = self.table[i] * (1.0 - t) + self.table[i + 1] * t
+
+        return(A)
+
+    def chunks(self, samples, chunk_size = 3600):
+        '''
+        Generate samples time steps of attenuation for every link, yielding
+        arrays of links x chunk_size samples (the last one may be shorter).
+        Only one chunk is held in memory at a time, and the process carries
+        on from one chunk to the next.
+        '''
+
+        timing = Instrumentation.enabled
+
+        for start in range(0, int(samples), chunk_size):
+            n = min(chunk_size, int(samples) - start)
+            if timing:
+                t = Instrumentation.clock()
+
+            x = self.gaussian(n)
+            if timing:
+                t = Instrumentation.lap('fade.gaussian', t, x.size)
+
+            A = self.attenuation(x)
+            if timing:
+                Instrumentation.lap('fade.attenuation', t, x.size)
+
+            yield A
+
+def read_links(path):
+    # Link parameters of a CSV file with a header row: h_s, theta, lat, lon,
+    # f, pol and optionally R_0_01
+    with open(path, 'r', newline = '') as fp:
+        rows = list(csv.DictReader(fp))
+
+    columns = {name: np.array([float(row[name]) for row in rows])
+               for name in ('h_s', 'theta', 'lat', 'lon', 'f')}
+    columns['pol']    = np.array([row['pol'].lower() for row in rows])
+    columns['R_0_01'] = np.array([float(row.get('R_0_01') or 'nan')
+                                  for row in rows])
+
+    return(columns)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'Synthetic rain fade time series driven by the '
+                      'ITU-R P.618-13 attenuation statistics')
+    parser.add_argument('links', help = 'CSV file of links (h_s, theta, lat, '
+                                        'lon, f, pol and optionally R_0_01)')
+    parser.add_argument('output', help = '.npy file of samples x links '
+                                         '(float32, dB)')
+    parser.add_argument('--duration', type = float, default = 86400.0,
+                        help = 'length of the series (s)')
+    parser.add_argument('--dt', type = float, default = 1.0,
+                        help = 'time step (s)')
+    parser.add_argument('--beta', type = float, default = 2e-4)
+    parser.add_argument('--chunk-size', type = int, default = 3600)
+    parser.add_argument('--seed', type = int, default = None)
+    parser.add_argument('--maps-dir', default = None)
+    parser.add_argument('--stats', action = 'store_true',
+                        help = 'print per-stage timings to stderr')
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        Instrumentation.enable()
+
+    links = read_links(args.links)
+    simulator = FadeSimulator(links['h_s'], links['theta'], links['lat'],
+                              links['lon'], links['f'], links['pol'],
+                              links['R_0_01'], args.maps_dir, args.dt,
+                              args.beta, seed = args.seed)
+
+    samples = int(round(args.duration / args.dt))
+    out = np.lib.format.open_memmap(args.output, mode = 'w+',
+                                    dtype = np.float32,
+                                    shape = (samples, simulator.links))
+    row = 0
+    for A in simulator.chunks(samples, args.chunk_size):
+        out[row:row + A.shape[1]] = A.T
+        row = row + A.shape[1]
+    out.flush()
+
+    if args.stats:
+        Instrumentation.report()
+
+if __name__ == '__main__':
+    main()
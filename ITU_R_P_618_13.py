@@ -1,41 +1,107 @@
-from ITU_R_P_837_7 import compute_rainfall_rate
-from ITU_R_P_838_3 import compute_specific_attenuation_coeffs 
-from ITU_R_P_839_4 import compute_rain_height
+from ITU_R_P_838_3 import compute_specific_attenuation_coeffs,\
+                           compute_specific_attenuation_coeffs_many,\
+                           compute_k_and_alpha_H_and_V_many,\
+                           polarization_factor_many, combine_k, combine_alpha
 
-from math import sin, cos, atan2, radians, degrees, sqrt, exp, log
+from collections.abc import Mapping
+from math import sin, cos, atan2, radians, degrees, sqrt, exp, log, isnan,\
+                 isfinite
+import os
+import sys
 
-base_dir = 'C:\\Users\\willi\\Documents\\nasa-project\\'
+import Instrumentation
+from LazyImport import lazy_import
 
-keep_going = True
-logging = True
+# The map readers and NumPy are only imported once a link needs them, so short
+# command line runs that never reach a step do not pay for it
+ITU_R_P_837_7 = lazy_import('ITU_R_P_837_7')
+ITU_R_P_839_4 = lazy_import('ITU_R_P_839_4')
+BilinearInterpolation = lazy_import('BilinearInterpolation')
+np            = lazy_import('numpy')
 
-#################################################################################
-#                               INPUT PARAMETERS                                #
-#################################################################################
+# Location of the ITU digital maps. The P.839-4 and P.837-7 files are expected
+# in the sub-directories below, as unpacked from the ITU downloads.
+base_dir = os.environ.get('ITU_R_MAPS_DIR',
+                          os.path.dirname(os.path.abspath(__file__)))
 
-h_s   = float(input('Enter the height above mean sea level of the GS (km): '))
-theta = float(input('Enter the elevation angle (degrees): '))
-lat   = float(input('Enter the latitude of the GS: '))
-lon   = float(input('Enger the longitude of the GS: '))
-f     = float(input('Enter the frequency of the channel (GHz): '))
-p     = float(input('Enter the percentage time to be exceeded (e.g. 0.1%): '))
-pol   = input('Enter the polarization of the signal (V, H, C): ').lower()
+p839_sub_dir = 'R-REC-P.839-4-201309-I!!ZIP-E'
+p837_sub_dir = 'R-REC-P.837-7_Maps'
 
 R_e = 8500.0     # effective radius of the Earth
 
+# Quantities returned for each link
+result_keys = ('A_p', 'h_R', 'L_s', 'L_G', 'R_0_01', 'k', 'alpha', 'gamma_R',
+               'r_0_01', 'zeta', 'L_R', 'chi', 'nu_0_01', 'L_E', 'A_0_01',
+               'beta')
+
+# Fields of a link record read by the streaming mode
+link_fields = ('h_s', 'theta', 'lat', 'lon', 'f', 'p', 'pol')
+
 #################################################################################
 # STEP 1: Determine the rain height, hR, as given in Recommendation ITU-R P.839 #
 #################################################################################
 
-if keep_going:
-    sub_dir = 'R-REC-P.839-4-201309-I!!ZIP-E\\'
-    h_R = compute_rain_height(base_dir + sub_dir, lat, lon, logging)
-    if logging:
-        print('[ITU-R P.618-13] h_R = ' + str(h_R) + ' km')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 1 not executed!')
-    
+def load_maps(maps_dir = None, region = None):
+    '''
+    Load the ITU-R P.839-4 and P.837-7 maps into the process-wide grid
+    registry (building their binary caches if needed), so that the first
+    link evaluated does not pay for it. If a region (lat_min, lat_max,
+    lon_min, lon_max) is given, only that part of the P.837-7 maps is loaded
+    until a link falls outside of it.
+    '''
+
+    if maps_dir is None:
+        maps_dir = base_dir
+
+    p837_dir = os.path.join(maps_dir, p837_sub_dir, '')
+    if region is not None:
+        ITU_R_P_837_7.set_region(p837_dir, region)
+
+    # Warm the P.837-7 map at a point of its region, if it has one
+    region   = ITU_R_P_837_7.get_region(p837_dir)
+    lat, lon = 0.0, 0.0
+    if region is not None:
+        lat = (region[0] + region[1]) / 2
+        lon = region[2] + ((region[3] - region[2]) % 360.0) / 2
+
+    # Go through the array steps, which hold the whole grids
+    step_1_rain_height_many(np.zeros(1), np.zeros(1), maps_dir)
+    step_4_rainfall_rate_many(np.full(1, lat), np.full(1, lon), maps_dir)
+
+def map_versions(maps_dir = None):
+    '''
+    Version tag of the P.839-4 and P.837-7 map files under maps_dir: the
+    path, size and modification time of each file, as a JSON string. Stored
+    results computed from the maps are tagged with it.
+    '''
+
+    import json
+
+    if maps_dir is None:
+        maps_dir = base_dir
+
+    versions = []
+    for module, sub_dir in ((ITU_R_P_839_4, p839_sub_dir),
+                            (ITU_R_P_837_7, p837_sub_dir)):
+        directories = module.get_directories(os.path.join(maps_dir, sub_dir,
+                                                          ''))
+        for name in ('Lat', 'Lon', 'Target'):
+            path = os.path.abspath(directories[name])
+            try:
+                st = os.stat(path)
+                versions.append([path, st.st_size, st.st_mtime_ns])
+            except OSError:
+                versions.append([path, None, None])
+
+    return(json.dumps(versions))
+
+def step_1_rain_height(lat, lon, maps_dir):
+    return ITU_R_P_839_4.compute_rain_height(
+        os.path.join(maps_dir, p839_sub_dir, ''), lat, lon, False)
+
+def step_1_rain_height_many(lats, lons, maps_dir):
+    return ITU_R_P_839_4.compute_rain_height_many(
+        os.path.join(maps_dir, p839_sub_dir, ''), lats, lons, False)
 
 #################################################################################
 # STEP 2: For θ >= 5 degrees compute the slant-path length, Ls, below the rain  #
@@ -48,25 +114,25 @@ else:
 #         L_s = 2(h_R - h_s) / ((sin^2(θ) + 2(h_R - h_s) / R_e)^(1/2) + sin(θ)) #
 #################################################################################
 
-if keep_going:
-    if h_R - h_s <= 0.0:
-        A_p = 0.0
-        keep_going = False
-        if logging:
-            print('[ITU-R P.618-13] h_R - h_s <= 0.0, so A_p = 0.0. Done.')
+def step_2_slant_path_length(h_R, h_s, theta):
+    if theta >= 5:
+        L_s = (h_R - h_s) / sin(radians(theta))
     else:
-        if theta >= 5:
-            L_s = (h_R - h_s) / sin(radians(theta))
-        else:
-            L_s = 2 * (h_R - h_s) /\
-                  (sqrt(sin(radians(theta))**2 + 2 * (h_R - h_s) / R_e) +\
-                   sin(radians(theta)))
+        L_s = 2 * (h_R - h_s) /\
+              (sqrt(sin(radians(theta))**2 + 2 * (h_R - h_s) / R_e) +\
+               sin(radians(theta)))
+
+    return(L_s)
 
-        if logging:
-            print('[ITU-R P.618-13] L_s = ' + str(L_s) + ' km')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 2 not executed!')
+def step_2_slant_path_length_many(h_R, h_s, theta):
+    sin_theta = np.sin(np.radians(theta))
+
+    L_s = np.where(theta >= 5,
+                   (h_R - h_s) / sin_theta,
+                   2 * (h_R - h_s) /\
+                   (np.sqrt(sin_theta**2 + 2 * (h_R - h_s) / R_e) + sin_theta))
+
+    return(L_s)
 
 #################################################################################
 # STEP 3: Calculate the horizontal projection, L_G, of the slant-path length    #
@@ -75,13 +141,11 @@ else:
 #         L_G = L_s cos(θ)                                                      #
 #################################################################################
 
-if keep_going:
-    L_G = L_s * cos(radians(theta))
-    if logging:
-        print('[ITU-R P.618-13] L_G = ' + str(L_G) + ' km')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 3 not executed!')
+def step_3_horizontal_projection(L_s, theta):
+    return(L_s * cos(radians(theta)))
+
+def step_3_horizontal_projection_many(L_s, theta):
+    return(L_s * np.cos(np.radians(theta)))
 
 #################################################################################
 # STEP 4: Obtain the rainfall rate, R_0.01, exceed for 0.01% of an average year #
@@ -90,25 +154,39 @@ else:
 #         are not required.                                                     #
 #################################################################################
 
-if keep_going:
-    q = input('Is rainfall rate (exceeded for 0.01% of an avg year) available? ')
-    if q.lower() == 'y':
-        R_0_01 = float(input('Enter the value for R_0.01: '))
-    else:
-        sub_dir = 'R-REC-P.837-7_Maps\\'
-        R_0_01 = compute_rainfall_rate(base_dir + sub_dir, p, lat, lon, logging)
+def step_4_rainfall_rate(lat, lon, maps_dir):
+    return ITU_R_P_837_7.compute_rainfall_rate(
+        os.path.join(maps_dir, p837_sub_dir, ''), 0.01, lat, lon, False)
 
-    if logging:
-        print('[ITU-R P.618-13] R_0.01 = ' + str(R_0_01) + ' mm/hr')
-        
-    if R_0_01 == 0:
-        A_p = 0.0
-        keep_going = False
-        if logging:
-            print('[ITU-R P.618-13] R_0.01 = 0, so A_p = 0.0. Done.')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 4 not executed!')
+def step_4_rainfall_rate_many(lats, lons, maps_dir):
+    return ITU_R_P_837_7.compute_rainfall_rate_many(
+        os.path.join(maps_dir, p837_sub_dir, ''), 0.01, lats, lons, False)
+
+def site_quantities_many(lats, lons, maps_dir = None, stencils = None):
+    '''
+    Rain heights (step 1) and rainfall rates R_0.01 (step 4) at many sites.
+    Both maps are interpolated through shared stencils: the cell search and
+    bilinear weights are computed once per grid geometry and applied to
+    every map with that geometry. Pass a dictionary as stencils to reuse them
+    in later calls for the same sites.
+
+    OUTPUT PARAMETERS:
+        h_R    : rain heights (km)
+        R_0_01 : rainfall rates exceeded for 0.01% of an average year (mm/h)
+    '''
+
+    if maps_dir is None:
+        maps_dir = base_dir
+
+    h_0, R_0_01 = BilinearInterpolation.interpolate_layers(
+        lats, lons,
+        ((ITU_R_P_839_4.get_directories(os.path.join(maps_dir, p839_sub_dir,
+                                                     '')), True),
+         (ITU_R_P_837_7.get_directories(os.path.join(maps_dir, p837_sub_dir,
+                                                     '')), False)),
+        stencils)
+
+    return(h_0 + 0.36, R_0_01)
 
 #################################################################################
 # STEP 5: Obtain the specific attenuation gamma_R, using the frequency-         #
@@ -118,17 +196,8 @@ else:
 #         gamma_R = k(R_0.01)^alpha                                             #
 #################################################################################
 
-if keep_going:
-    k, alpha = compute_specific_attenuation_coeffs(f, theta, pol, logging)
-    gamma_R = k * R_0_01**alpha
-
-    if logging:
-        print('[ITU-R P.618-13] gamma_R = ' + str(gamma_R) + ' dB/km')
-        print('[ITU-R P.618-13]   k = ' + str(k))
-        print('[ITU-R P.618-13]   alpha = ' + str(alpha)) 
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 5 not executed!')
+def step_5_specific_attenuation(R_0_01, k, alpha):
+    return(k * R_0_01**alpha)
 
 #################################################################################
 # STEP 6: Calculate the horizontal reduction factor, r_0_01, for 0.01% of the   #
@@ -137,15 +206,14 @@ else:
 #         r_0.01 = 1 / (1 + 0.78 * sqrt((L_G*gamma_R/f) - 0.38*(1-e^(-2*L_G)))  #
 #################################################################################
 
-if keep_going:
-    r_0_01 = 1.0 /\
-             (1.0 + 0.78 * sqrt(L_G * gamma_R / f) - 0.38*(1 - exp(-2.0 * L_G)))
+def step_6_horizontal_reduction_factor(L_G, gamma_R, f):
+    return 1.0 /\
+           (1.0 + 0.78 * sqrt(L_G * gamma_R / f) - 0.38*(1 - exp(-2.0 * L_G)))
 
-    if logging:
-        print('[ITU-R P.618-13] r_0.01 = ' + str(r_0_01) + ' mm/hr')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 6 not executed!')
+def step_6_horizontal_reduction_factor_many(L_G, gamma_R, f):
+    return 1.0 /\
+           (1.0 + 0.78 * np.sqrt(L_G * gamma_R / f) -\
+            0.38*(1 - np.exp(-2.0 * L_G)))
 
 #################################################################################
 # STEP 7: Calculate the vertical adjustment factor, v_0.01, for 0.01% of the    #
@@ -156,7 +224,8 @@ else:
 #                       sqrt(L_R*gamma_R)/f^2 - 0.45)                           #
 #################################################################################
 
-if keep_going:
+def step_7_vertical_adjustment_factor(h_R, h_s, theta, lat, f, L_G, r_0_01,
+                                      gamma_R):
     zeta = degrees(atan2(h_R - h_s, L_G * r_0_01))
 
     if zeta > theta:
@@ -174,14 +243,26 @@ if keep_going:
               (31.0 * (1.0 - exp(-(theta / (1.0 + chi)))) *\
               sqrt(L_R * gamma_R)/f**2 - 0.45))
 
-    if logging:
-        print('[ITU-R P.618-13] nu_0.01 = ' + str(nu_0_01))
-        print('[ITU-R P.618-13]   zeta = ' + str(zeta) + ' degrees')
-        print('[ITU-R P.618-13]   L_R = ' + str(L_R) + ' km')
-        print('[ITU-R P.618-13]   chi = ' + str(chi) + ' degrees')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 7 not executed!')
+    return(nu_0_01, zeta, L_R, chi)
+
+def step_7_vertical_adjustment_factor_many(h_R, h_s, theta, lat, f, L_G,
+                                           r_0_01, gamma_R):
+    sin_theta = np.sin(np.radians(theta))
+
+    zeta = np.degrees(np.arctan2(h_R - h_s, L_G * r_0_01))
+
+    L_R = np.where(zeta > theta,
+                   L_G * r_0_01 / np.cos(np.radians(theta)),
+                   (h_R - h_s) / sin_theta)
+
+    chi = np.where(np.abs(lat) < 36.0, 36.0 - np.abs(lat), 0.0)
+
+    nu_0_01 = 1.0 /\
+              (1.0 + np.sqrt(sin_theta) *\
+              (31.0 * (1.0 - np.exp(-(theta / (1.0 + chi)))) *\
+              np.sqrt(L_R * gamma_R)/f**2 - 0.45))
+
+    return(nu_0_01, zeta, L_R, chi)
 
 #################################################################################
 # STEP 8: The effective path length is:                                         #
@@ -189,14 +270,8 @@ else:
 #         L_E = L_R * nu_0.01                                                   #
 #################################################################################
 
-if keep_going:
-    L_E = L_R * nu_0_01
-
-    if logging:
-        print('[ITU-R P.618-13] L_E = ' + str(L_E) + ' km')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 8 not executed!')
+def step_8_effective_path_length(L_R, nu_0_01):
+    return(L_R * nu_0_01)
 
 #################################################################################
 # STEP 9: The predicted attenuation exceeded for 0.01% of an average year is    #
@@ -205,14 +280,8 @@ else:
 #         A_0.01 = gamma_R * L_E                                                #
 #################################################################################
 
-if keep_going:
-    A_0_01 = gamma_R * L_E
-
-    if logging:
-        print('[ITU-R P.618-13] A_0.01 = ' + str(A_0_01) + ' dB')
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 9 not executed!')
+def step_9_attenuation_0_01(gamma_R, L_E):
+    return(gamma_R * L_E)
 
 #################################################################################
 # STEP 10: The estimated attenuation to be exceeded for other percentages of an #
@@ -230,7 +299,7 @@ else:
 #            X = -(0.655+0.033*ln(p) - 0.045*ln(A_0.01) - beta*(1-p)*sin(theta))#
 #################################################################################
 
-if keep_going:
+def step_10_attenuation(A_0_01, p, lat, theta):
     if p >= 1.0 or abs(lat) >= 36.0:
         beta = 0.0
     elif p < 1.0 and abs(lat) < 36.0 and theta >= 25.0:
@@ -241,9 +310,924 @@ if keep_going:
     A_p = A_0_01 * (p / 0.01)**\
           -(0.655+0.033*log(p)-0.045*log(A_0_01)-beta*(1-p)*sin(radians(theta)))
 
-    if logging:
-        print('[ITU-R P.618-13] A_p = ' + str(A_p) + ' dB')
-        print('[ITU-R P.618-13]   beta = ' + str(beta))
-else:
-    if logging:
-        print('[ITU-R P.618-13] *** Step 10 not executed!')
+    return(A_p, beta)
+
+def step_10_attenuation_many(A_0_01, p, lat, theta):
+    sin_theta = np.sin(np.radians(theta))
+    abs_lat   = np.abs(lat)
+
+    beta = np.where((p >= 1.0) | (abs_lat >= 36.0), 0.0,
+           np.where(theta >= 25.0, -0.005 * (abs_lat - 36.0),
+                    -0.005 * (abs_lat - 36.0) + 1.8 - 4.25 * sin_theta))
+
+    A_p = A_0_01 * (p / 0.01)**\
+          -(0.655+0.033*np.log(p)-0.045*np.log(A_0_01)-beta*(1-p)*sin_theta)
+
+    return(A_p, beta)
+
+def bisect_many(evaluate, target, lo, hi, tol = 1e-9, max_iter = 100):
+    '''
+    Vectorized bisection: solves evaluate(x, links) = target for each link,
+    with evaluate() increasing in x over [lo, hi] and taking the indices of
+    the links still being searched. Links stop iterating as soon as their
+    bracket is narrower than tol.
+
+    OUTPUT PARAMETERS:
+        x          : solutions (the middle of the final brackets)
+        iterations : number of iterations of each link
+        converged  : whether the bracket of each link is narrower than tol
+    '''
+
+    lo, hi = np.array(lo, dtype = np.float64), np.array(hi, dtype = np.float64)
+    iterations = np.zeros(lo.shape, dtype = np.int64)
+
+    active = np.flatnonzero(hi - lo > tol)
+    for _ in range(max_iter):
+        if not active.size:
+            break
+
+        mid   = (lo[active] + hi[active]) / 2
+        above = evaluate(mid, active) > target[active]
+        hi[active] = np.where(above, mid, hi[active])
+        lo[active] = np.where(above, lo[active], mid)
+        iterations[active] = iterations[active] + 1
+
+        active = active[hi[active] - lo[active] > tol]
+
+    return((lo + hi) / 2, iterations, hi - lo <= tol)
+
+def step_10_percentage_many(A_0_01, A_p, lat, theta, p_min = 0.001,
+                            p_max = 5.0, tol = 1e-9, max_iter = 100,
+                            rtol = 1e-9):
+    # Inverse of step 10: the percentage of time p for which the attenuation
+    # A_p is exceeded, found by bisection on log(p) over [p_min, p_max] (see
+    # bisect_many()). NaN where A_p lies outside the attenuations of that
+    # range, give or take rtol (relative) so that the attenuations at p_min
+    # and p_max themselves give p_min and p_max. Also returns the iterations
+    # of each search and whether it reached tol, with the shape of p.
+    A_0_01, A_p, lat, theta = np.broadcast_arrays(
+        *[np.asarray(x, dtype = np.float64) for x in (A_0_01, A_p, lat, theta)])
+    shape = A_p.shape
+    A_0_01, A_p, lat, theta = [np.ravel(x) for x in (A_0_01, A_p, lat, theta)]
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        A_lo, _ = step_10_attenuation_many(A_0_01, p_max, lat, theta)
+        A_hi, _ = step_10_attenuation_many(A_0_01, p_min, lat, theta)
+    search = (A_p >= A_lo * (1.0 - rtol)) & (A_p <= A_hi * (1.0 + rtol))
+
+    # A_p decreases with p: search on x = -log(p) to have it increasing
+    lo = np.full(A_p.shape, -log(p_max))
+    hi = np.where(search, -log(p_min), lo)
+
+    def evaluate(x, links):
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            A_x, _ = step_10_attenuation_many(A_0_01[links], np.exp(-x),
+                                              lat[links], theta[links])
+        return(A_x)
+
+    x, iterations, converged = bisect_many(evaluate, A_p, lo, hi, tol,
+                                           max_iter)
+    p = np.where(search, np.exp(-x), np.nan)
+    p = np.where(search & (A_p <= A_lo), p_max, p)
+    p = np.where(search & (A_p >= A_hi), p_min, p)
+
+    return(p.reshape(shape), iterations.reshape(shape),
+           converged.reshape(shape))
+
+def compute_rain_attenuation(h_s, theta, lat, lon, f, p, pol, R_0_01 = None,
+                             maps_dir = None, logging = False):
+    '''
+    Compute the rain attenuation exceeded for a given percentage of an average
+    year on an Earth-space path.
+
+    REFERENCE: ITU Recommendation ITU-R P.618-13 (Section 2.2.1.1)
+
+    INPUT PARAMETERS:
+        h_s      : height above mean sea level of the ground station (km)
+        theta    : elevation angle (degrees)
+        lat      : latitude of the ground station (N)
+        lon      : longitude of the ground station (E)
+        f        : frequency of the channel (GHz)
+        p        : percentage of an average year to be exceeded (%)
+        pol      : polarization of the signal ('v', 'h' or 'c')
+        R_0_01   : rainfall rate exceeded for 0.01% of an average year (mm/h),
+                   looked up from the ITU-R P.837-7 maps if not provided
+        maps_dir : directory holding the ITU-R P.839-4 and P.837-7 map
+                   directories (defaults to base_dir)
+        logging  : print the intermediate quantities (see also
+                   Instrumentation.enable())
+
+    OUTPUT PARAMETER:
+        res      : dictionary with the attenuation exceeded for p% of an
+                   average year, A_p (dB), and the intermediate quantities
+                   h_R, L_s, L_G, R_0_01, k, alpha, gamma_R, r_0_01, zeta,
+                   L_R, chi, nu_0_01, L_E, A_0_01 and beta. Quantities of the
+                   steps not executed are None.
+    '''
+
+    if maps_dir is None:
+        maps_dir = base_dir
+    pol = pol.lower()
+
+    res = dict.fromkeys(result_keys)
+    res['A_p'] = 0.0
+
+    # Tracing is only set up when asked for, so the default path is untouched
+    trace = None
+    if logging or Instrumentation.enabled:
+        trace = Instrumentation.Tracer('ITU-R P.618-13', logging)
+
+    # STEP 1
+    h_R = step_1_rain_height(lat, lon, maps_dir)
+    res['h_R'] = h_R
+    if trace:
+        trace.step('p618.step_1', h_R = h_R)
+
+    # STEP 2
+    if h_R - h_s <= 0.0:
+        if trace:
+            trace.branch('p618.exit.h_R_below_h_s',
+                         'h_R - h_s <= 0.0, so A_p = 0.0. Done.')
+        return(res)
+
+    L_s = step_2_slant_path_length(h_R, h_s, theta)
+    res['L_s'] = L_s
+    if trace:
+        if theta < 5:
+            trace.branch('p618.step_2.low_elevation',
+                         'theta < 5 degrees, low-elevation slant path')
+        trace.step('p618.step_2', L_s = L_s)
+
+    # STEP 3
+    L_G = step_3_horizontal_projection(L_s, theta)
+    res['L_G'] = L_G
+    if trace:
+        trace.step('p618.step_3', L_G = L_G)
+
+    # STEP 4
+    if R_0_01 is None:
+        R_0_01 = step_4_rainfall_rate(lat, lon, maps_dir)
+    res['R_0_01'] = R_0_01
+    if trace:
+        trace.step('p618.step_4', R_0_01 = R_0_01)
+
+    if R_0_01 == 0:
+        if trace:
+            trace.branch('p618.exit.R_0_01_zero',
+                         'R_0.01 = 0, so A_p = 0.0. Done.')
+        return(res)
+
+    # STEP 5
+    k, alpha = compute_specific_attenuation_coeffs(f, theta, pol, logging)
+    gamma_R = step_5_specific_attenuation(R_0_01, k, alpha)
+    res['k'], res['alpha'], res['gamma_R'] = k, alpha, gamma_R
+    if trace:
+        trace.step('p618.step_5', gamma_R = gamma_R, k = k, alpha = alpha)
+
+    # STEP 6
+    r_0_01 = step_6_horizontal_reduction_factor(L_G, gamma_R, f)
+    res['r_0_01'] = r_0_01
+    if trace:
+        trace.step('p618.step_6', r_0_01 = r_0_01)
+
+    # STEP 7
+    nu_0_01, zeta, L_R, chi = step_7_vertical_adjustment_factor(
+        h_R, h_s, theta, lat, f, L_G, r_0_01, gamma_R)
+    res['nu_0_01'], res['zeta'], res['L_R'], res['chi'] =\
+        nu_0_01, zeta, L_R, chi
+    if trace:
+        trace.step('p618.step_7', nu_0_01 = nu_0_01, zeta = zeta, L_R = L_R,
+                   chi = chi)
+
+    # STEP 8
+    L_E = step_8_effective_path_length(L_R, nu_0_01)
+    res['L_E'] = L_E
+    if trace:
+        trace.step('p618.step_8', L_E = L_E)
+
+    # STEP 9
+    A_0_01 = step_9_attenuation_0_01(gamma_R, L_E)
+    res['A_0_01'] = A_0_01
+    if trace:
+        trace.step('p618.step_9', A_0_01 = A_0_01)
+
+    # STEP 10
+    A_p, beta = step_10_attenuation(A_0_01, p, lat, theta)
+    res['A_p'], res['beta'] = A_p, beta
+    if trace:
+        trace.step('p618.step_10', A_p = A_p, beta = beta)
+
+    return(res)
+
+def compute_rain_attenuation_many(h_s, theta, lat, lon, f, p, pol,
+                                  R_0_01 = None, maps_dir = None, h_R = None,
+                                  coeffs = None):
+    '''
+    Array version of compute_rain_attenuation(). All of the inputs are
+    broadcast against each other, so any mix of sites, frequencies,
+    percentages and polarizations can be evaluated in one pass. The early
+    exits of the scalar version (h_R - h_s <= 0 and R_0.01 = 0) are handled
+    with masks instead of branches.
+
+    INPUT PARAMETERS:
+        h_s      : heights above mean sea level of the ground stations (km)
+        theta    : elevation angles (degrees)
+        lat      : latitudes of the ground stations (N)
+        lon      : longitudes of the ground stations (E)
+        f        : frequencies of the channels (GHz)
+        p        : percentages of an average year to be exceeded (%)
+        pol      : polarizations of the signals ('v', 'h' or 'c')
+        R_0_01   : rainfall rates exceeded for 0.01% of an average year
+                   (mm/h), looked up from the ITU-R P.837-7 maps if not
+                   provided (or where NaN)
+        maps_dir : directory holding the ITU-R P.839-4 and P.837-7 map
+                   directories (defaults to base_dir)
+        h_R      : rain heights (km), looked up from the ITU-R P.839-4 maps
+                   if not provided
+        coeffs   : frequency-dependent ITU-R P.838-3 coefficients (k_H, k_V,
+                   alpha_H, alpha_V) for f, computed if not provided
+
+    OUTPUT PARAMETER:
+        res      : dictionary of arrays with the same keys as the one
+                   returned by compute_rain_attenuation(). Quantities of the
+                   steps not executed for a link are NaN, and A_p is 0.0.
+                   Links outside of the domain of the model, on which
+                   compute_rain_attenuation() raises, come out as NaN.
+    '''
+
+    if maps_dir is None:
+        maps_dir = base_dir
+
+    site_lat = np.asarray(lat, dtype = np.float64)
+    site_lon = np.asarray(lon, dtype = np.float64)
+    h_s, theta, lat, lon, f, p = np.broadcast_arrays(
+        *[np.asarray(x, dtype = np.float64)
+          for x in (h_s, theta, lat, lon, f, p)])
+    if R_0_01 is not None:
+        R_0_01 = np.asarray(R_0_01, dtype = np.float64)
+    if h_R is not None:
+        h_R = np.asarray(h_R, dtype = np.float64)
+    pol   = np.char.lower(np.asarray(pol, dtype = str))
+    shape = np.broadcast_shapes(h_s.shape, pol.shape,
+                                () if R_0_01 is None else R_0_01.shape,
+                                () if h_R is None else h_R.shape)
+
+    h_s, theta, lat, lon, f, p = [np.broadcast_to(x, shape)
+                                  for x in (h_s, theta, lat, lon, f, p)]
+    pol = np.broadcast_to(pol, shape)
+
+    # The maps are interpolated over the sites alone, before their lat/lon
+    # are broadcast against the frequencies, percentages and so on
+    site_lat, site_lon = np.broadcast_arrays(site_lat, site_lon)
+
+    res = {}
+
+    # Per-step timers and branch counters, aggregated over the links
+    timing = Instrumentation.enabled
+    if timing:
+        items = h_s.size
+        t     = Instrumentation.clock()
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        # STEP 1
+        if h_R is None:
+            h_R = step_1_rain_height_many(site_lat, site_lon, maps_dir)
+        h_R = np.array(np.broadcast_to(h_R, shape))
+        res['h_R'] = h_R
+        if timing:
+            t = Instrumentation.lap('p618.step_1', t, items)
+
+        # STEP 2 (links with h_R - h_s <= 0 have no rain attenuation)
+        wet = h_R - h_s > 0.0
+        L_s = np.where(wet, step_2_slant_path_length_many(h_R, h_s, theta),
+                       np.nan)
+        res['L_s'] = L_s
+        if timing:
+            Instrumentation.count('p618.exit.h_R_below_h_s',
+                                  np.count_nonzero(~wet))
+            Instrumentation.count('p618.step_2.low_elevation',
+                                  np.count_nonzero(wet & (theta < 5)))
+            t = Instrumentation.lap('p618.step_2', t, items)
+
+        # STEP 3
+        L_G = step_3_horizontal_projection_many(L_s, theta)
+        res['L_G'] = L_G
+        if timing:
+            t = Instrumentation.lap('p618.step_3', t, items)
+
+        # STEP 4 (only look up the links that get this far)
+        if R_0_01 is None:
+            R_0_01 = np.nan
+        R_0_01 = np.where(wet, np.broadcast_to(R_0_01, shape), np.nan)
+        lookup = wet & np.isnan(R_0_01)
+        needed = np.count_nonzero(lookup)
+        if needed > site_lat.size:
+            R_site = step_4_rainfall_rate_many(site_lat, site_lon, maps_dir)
+            R_0_01[lookup] = np.broadcast_to(R_site, shape)[lookup]
+        elif needed:
+            R_0_01[lookup] = step_4_rainfall_rate_many(lat[lookup],
+                                                       lon[lookup], maps_dir)
+        res['R_0_01'] = R_0_01
+
+        # Links with R_0.01 = 0 have no rain attenuation either
+        if timing:
+            Instrumentation.count('p618.exit.R_0_01_zero',
+                                  np.count_nonzero(R_0_01 == 0))
+            t = Instrumentation.lap('p618.step_4', t, items)
+        wet = wet & (R_0_01 != 0)
+
+        # STEP 5
+        if coeffs is None:
+            k, alpha = compute_specific_attenuation_coeffs_many(f, theta, pol)
+        else:
+            k_H, k_V, alpha_H, alpha_V = coeffs
+            factor = polarization_factor_many(theta, pol)
+            k      = combine_k(k_H, k_V, factor)
+            alpha  = combine_alpha(k_H, k_V, alpha_H, alpha_V, k, factor)
+        k, alpha = np.where(wet, k, np.nan), np.where(wet, alpha, np.nan)
+        gamma_R  = step_5_specific_attenuation(R_0_01, k, alpha)
+        res['k'], res['alpha'], res['gamma_R'] = k, alpha, gamma_R
+        if timing:
+            t = Instrumentation.lap('p618.step_5', t, items)
+
+        # STEP 6
+        r_0_01 = step_6_horizontal_reduction_factor_many(L_G, gamma_R, f)
+        res['r_0_01'] = r_0_01
+        if timing:
+            t = Instrumentation.lap('p618.step_6', t, items)
+
+        # STEP 7 (r_0.01 is NaN outside of the domain of the model, e.g. for
+        # elevation angles beyond 90 degrees, where the scalar chain raises)
+        nu_0_01, zeta, L_R, chi = [np.where(wet & ~np.isnan(r_0_01), x,
+                                            np.nan) for x in
+            step_7_vertical_adjustment_factor_many(h_R, h_s, theta, lat, f,
+                                                   L_G, r_0_01, gamma_R)]
+        res['nu_0_01'], res['zeta'], res['L_R'], res['chi'] =\
+            nu_0_01, zeta, L_R, chi
+        if timing:
+            t = Instrumentation.lap('p618.step_7', t, items)
+
+        # STEP 8
+        L_E = step_8_effective_path_length(L_R, nu_0_01)
+        res['L_E'] = L_E
+        if timing:
+            t = Instrumentation.lap('p618.step_8', t, items)
+
+        # STEP 9
+        A_0_01 = step_9_attenuation_0_01(gamma_R, L_E)
+        res['A_0_01'] = A_0_01
+        if timing:
+            t = Instrumentation.lap('p618.step_9', t, items)
+
+        # STEP 10
+        A_p, beta = step_10_attenuation_many(A_0_01, p, lat, theta)
+        res['A_p']  = np.where(wet, A_p, 0.0)
+        res['beta'] = np.where(wet, beta, np.nan)
+        if timing:
+            Instrumentation.lap('p618.step_10', t, items)
+
+    return(res)
+
+def compute_attenuation_curve(h_s, theta, lat, lon, f, p, pol, R_0_01 = None,
+                              maps_dir = None):
+    '''
+    Attenuation exceeded for a whole vector of percentages of an average year
+    on one link. Steps 1 to 9 (the map lookups and the P.838-3 coefficients)
+    run once, and step 10 is evaluated over all of the percentages as a single
+    array operation.
+
+    INPUT PARAMETERS:
+        h_s, theta, lat, lon, f, pol, R_0_01, maps_dir : as for
+                   compute_rain_attenuation()
+        p        : array of percentages of an average year to be exceeded (%),
+                   nominally in the range 0.001% to 5%
+
+    OUTPUT PARAMETER:
+        A_p      : array of attenuations exceeded for each p (dB)
+    '''
+
+    res = compute_rain_attenuation(h_s, theta, lat, lon, f, 0.01, pol, R_0_01,
+                                   maps_dir)
+
+    p = np.asarray(p, dtype = np.float64)
+    if res['A_0_01'] is None:
+        return(np.zeros(p.shape))
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        A_p, _ = step_10_attenuation_many(res['A_0_01'], p, lat, theta)
+
+    return(A_p)
+
+def compute_percentage_exceeded(A_p, h_s, theta, lat, lon, f, pol,
+                                R_0_01 = None, maps_dir = None, p_min = 0.001,
+                                p_max = 5.0):
+    '''
+    Inverse of compute_attenuation_curve(): the percentage of an average year
+    for which one or more fade margins are exceeded on one link. Steps 1 to 9
+    run once and step 10 is inverted for all of the margins together.
+
+    INPUT PARAMETERS:
+        A_p      : fade margin(s) (dB)
+        h_s, theta, lat, lon, f, pol, R_0_01, maps_dir : as for
+                   compute_rain_attenuation()
+        p_min    : smallest percentage searched (%)
+        p_max    : largest percentage searched (%)
+
+    OUTPUT PARAMETER:
+        p        : percentage(s) of time the margin is exceeded (%). 0.0 if
+                   the link sees no rain attenuation, NaN if the margin is
+                   exceeded for less than p_min or more than p_max.
+    '''
+
+    res = compute_rain_attenuation(h_s, theta, lat, lon, f, 0.01, pol, R_0_01,
+                                   maps_dir)
+
+    A_p = np.asarray(A_p, dtype = np.float64)
+    if res['A_0_01'] is None:
+        return(np.where(A_p >= 0.0, 0.0, np.nan))
+
+    p, _, _ = step_10_percentage_many(res['A_0_01'], A_p, lat, theta, p_min,
+                                      p_max)
+
+    return(p)
+
+class ElevationSweep:
+    def __init__(self, h_s, lat, lon, f, pol, R_0_01 = None, maps_dir = None):
+        '''
+        Constructor
+
+        Rain attenuation of one site and carrier over many elevation angles,
+        e.g. along the passes of a non-geostationary satellite. The rain
+        height (ITU-R P.839-4), the rainfall rate (ITU-R P.837-7) and the
+        frequency-dependent ITU-R P.838-3 coefficients do not depend on the
+        elevation angle, so they are computed once here; evaluate() then only
+        runs the elevation-dependent steps, as array operations.
+        '''
+
+        if maps_dir is None:
+            maps_dir = base_dir
+
+        self.h_s      = float(h_s)
+        self.lat      = float(lat)
+        self.lon      = float(lon)
+        self.f        = float(f)
+        self.pol      = pol.lower()
+        self.maps_dir = maps_dir
+
+        # Site-invariant quantities (R_0.01 is only needed for a wet site)
+        self.h_R    = step_1_rain_height(self.lat, self.lon, maps_dir)
+        self.R_0_01 = R_0_01
+        if self.R_0_01 is None and self.h_R - self.h_s > 0.0:
+            self.R_0_01 = step_4_rainfall_rate(self.lat, self.lon, maps_dir)
+
+        # Frequency-invariant quantities
+        self.coeffs = tuple(float(c) for c in
+                            compute_k_and_alpha_H_and_V_many(self.f))
+
+    def evaluate(self, theta, p):
+        '''
+        Attenuation exceeded for p% of an average year at each of the
+        elevation angles theta (degrees); p may also be an array broadcast
+        against theta. Returns a dictionary of arrays with the same keys as
+        compute_rain_attenuation_many().
+        '''
+
+        return compute_rain_attenuation_many(
+            self.h_s, theta, self.lat, self.lon, self.f, p, self.pol,
+            np.nan if self.R_0_01 is None else self.R_0_01, self.maps_dir,
+            self.h_R, self.coeffs)
+
+def compute_elevation_sweep(h_s, theta, lat, lon, f, p, pol, R_0_01 = None,
+                            maps_dir = None):
+    '''
+    Attenuation exceeded for p% of an average year at one site over an array
+    of elevation angles theta (degrees). See ElevationSweep.
+
+    OUTPUT PARAMETER:
+        A_p      : array of attenuations exceeded for each theta (dB)
+    '''
+
+    sweep = ElevationSweep(h_s, lat, lon, f, pol, R_0_01, maps_dir)
+
+    return(sweep.evaluate(theta, p)['A_p'])
+
+class InverseSolver:
+    def __init__(self, h_s, theta, lat, lon, pol, R_0_01 = None,
+                 maps_dir = None):
+        '''
+        Constructor
+
+        Inverse problems of the rain attenuation over many links at once:
+        the percentage of time a fade margin is exceeded (solve_percentage())
+        and the highest frequency that keeps the attenuation within a fade
+        margin for a given percentage (solve_frequency()). The rain heights
+        and R_0.01 of the sites are looked up once here and reused by every
+        evaluation of the search.
+
+        INPUT PARAMETERS:
+            h_s, theta, lat, lon, pol, R_0_01, maps_dir : as for
+                       compute_rain_attenuation_many(), one entry per link
+                       (arrays broadcast against each other)
+        '''
+
+        if maps_dir is None:
+            maps_dir = base_dir
+
+        h_s, theta, lat, lon = np.broadcast_arrays(
+            *[np.asarray(x, dtype = np.float64)
+              for x in (h_s, theta, lat, lon)])
+        pol   = np.char.lower(np.asarray(pol, dtype = str))
+        shape = np.broadcast_shapes(h_s.shape, pol.shape,
+                                    np.shape(R_0_01) if R_0_01 is not None
+                                    else ())
+
+        self.shape    = shape
+        self.maps_dir = maps_dir
+        self.h_s, self.theta, self.lat, self.lon =\
+            [np.ravel(np.broadcast_to(x, shape)) for x in (h_s, theta, lat,
+                                                           lon)]
+        self.pol = np.ravel(np.broadcast_to(pol, shape))
+
+        # Site quantities, shared by all of the evaluations
+        self.h_R, map_R_0_01 = site_quantities_many(self.lat, self.lon,
+                                                    maps_dir)
+        if R_0_01 is None:
+            self.R_0_01 = map_R_0_01
+        else:
+            R_0_01 = np.ravel(np.broadcast_to(np.asarray(R_0_01,
+                                                         dtype = np.float64),
+                                              shape))
+            self.R_0_01 = np.where(np.isnan(R_0_01), map_R_0_01, R_0_01)
+
+    def attenuation(self, f, p, links = None, coeffs = None):
+        '''
+        Attenuation exceeded for p% of an average year at the frequencies f
+        on the given links (all of them by default); returns the result
+        dictionary of compute_rain_attenuation_many()
+        '''
+
+        if links is None:
+            links = slice(None)
+
+        return compute_rain_attenuation_many(
+            self.h_s[links], self.theta[links], self.lat[links],
+            self.lon[links], f, p, self.pol[links], self.R_0_01[links],
+            self.maps_dir, self.h_R[links], coeffs)
+
+    def links_array(self, x):
+        return(np.ravel(np.broadcast_to(np.asarray(x, dtype = np.float64),
+                                        self.shape)).copy())
+
+    def result(self, res):
+        # Reshape the flat arrays of a result to the shape of the links
+        return {name: value.reshape(self.shape) for name, value in res.items()}
+
+    def solve_percentage(self, A, f, p_min = 0.001, p_max = 5.0, tol = 1e-9,
+                         max_iter = 100):
+        '''
+        Percentage of an average year for which the fade margins A (dB) are
+        exceeded at the frequencies f (GHz). Steps 1 to 9 run once, and
+        step 10 is inverted by step_10_percentage_many().
+
+        OUTPUT PARAMETER:
+            res : dictionary of arrays with the shape of the links:
+                  p            : percentage of time the margin is exceeded
+                                 (%), 0.0 where the link sees no rain
+                                 attenuation and NaN outside [p_min, p_max]
+                  availability : 100 - p (%)
+                  iterations   : bisection iterations
+                  converged    : whether the search reached tol (in log(p))
+                  residual     : A_p(p) - A (dB)
+                  status       : 'ok', 'no_rain', 'below_p_min' (margin
+                                 exceeded less often than p_min) or
+                                 'above_p_max'
+        '''
+
+        A = self.links_array(A)
+        f = self.links_array(f)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            A_0_01 = self.attenuation(f, 0.01)['A_0_01']
+
+        p, iterations, converged = step_10_percentage_many(
+            A_0_01, A, self.lat, self.theta, p_min, p_max, tol, max_iter)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            A_p, _  = step_10_attenuation_many(A_0_01, p, self.lat,
+                                               self.theta)
+            A_hi, _ = step_10_attenuation_many(A_0_01, p_min, self.lat,
+                                               self.theta)
+
+        dry      = np.isnan(A_0_01)
+        search   = ~np.isnan(p)
+        status   = np.select([dry, search, A > A_hi],
+                             ['no_rain', 'ok', 'below_p_min'],
+                             'above_p_max').astype(object)
+        residual = A_p - A
+        p        = np.where(dry, 0.0, p)
+
+        return self.result({'p': p, 'availability': 100.0 - p,
+                            'iterations': iterations, 'converged': converged,
+                            'residual': residual, 'status': status})
+
+    def solve_frequency(self, A, p, f_min = 1.0, f_max = 55.0, tol = 1e-9,
+                        max_iter = 100):
+        '''
+        Highest frequency (GHz) in [f_min, f_max] at which the attenuation
+        exceeded for p% of an average year stays within the fade margins A
+        (dB), found by bisection on log(f). The attenuation is taken to
+        increase with frequency over the range.
+
+        OUTPUT PARAMETER:
+            res : dictionary of arrays with the shape of the links:
+                  f          : highest frequency meeting the margin (GHz);
+                               f_max where even f_max meets it and NaN where
+                               f_min does not
+                  iterations : bisection iterations
+                  converged  : whether the search reached tol (in log(f))
+                  residual   : A_p(f) - A (dB)
+                  status     : 'ok', 'no_rain', 'f_max' (met at f_max) or
+                               'infeasible' (not met at f_min)
+        '''
+
+        A = self.links_array(A)
+        p = self.links_array(p)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            A_lo = self.attenuation(f_min, p)
+            A_hi = self.attenuation(f_max, p)['A_p']
+
+        dry    = np.isnan(A_lo['A_0_01'])
+        status = np.select([dry, A_hi <= A, A_lo['A_p'] > A],
+                           ['no_rain', 'f_max', 'infeasible'],
+                           'ok').astype(object)
+        search = status == 'ok'
+
+        lo = np.full(A.shape, log(f_min))
+        hi = np.where(search, log(f_max), lo)
+
+        def evaluate(x, links):
+            return(self.attenuation(np.exp(x), p[links], links)['A_p'])
+
+        x, iterations, converged = bisect_many(evaluate, A, lo, hi, tol,
+                                               max_iter)
+
+        f = np.where(search, np.exp(x),
+                     np.where(status == 'infeasible', np.nan, f_max))
+        residual = np.full(A.shape, np.nan)
+        idx      = np.flatnonzero(search)
+        if idx.size:
+            residual[idx] = evaluate(x[idx], idx) - A[idx]
+
+        return self.result({'f': f, 'iterations': iterations,
+                            'converged': converged | ~search,
+                            'residual': residual, 'status': status})
+
+def parse_link(record):
+    '''
+    Convert a link record (dictionary of strings or numbers) to the argument
+    tuple of compute_rain_attenuation_many(). Raises ValueError if the record
+    is not a dictionary, or if a field is missing, malformed, unexpected or
+    out of range (NaN or infinite values, f or p not positive, R_0.01
+    negative).
+    '''
+
+    if not isinstance(record, Mapping):
+        raise ValueError('not a record object: ' + repr(record)[:40])
+
+    # Values beyond the header of a CSV row are gathered under the key None
+    extra = record.get(None)
+    if extra:
+        raise ValueError(str(len(extra)) + ' field(s) beyond the header')
+
+    missing = [name for name in link_fields if record.get(name) in ('', None)]
+    if missing:
+        raise ValueError('missing ' + ', '.join(missing))
+
+    values = [float(record[name]) for name in link_fields[:-1]]
+    bad    = [name for name, value in zip(link_fields, values)
+              if not isfinite(value)]
+    if bad:
+        raise ValueError('non-finite ' + ', '.join(bad))
+
+    for name in ('f', 'p'):
+        if values[link_fields.index(name)] <= 0.0:
+            raise ValueError(name + ' must be positive')
+
+    pol = str(record['pol']).lower()
+    if pol not in ('v', 'h', 'c'):
+        raise ValueError('unknown polarization ' + repr(record['pol']))
+
+    # A missing R_0.01 is NaN, to be looked up from the maps
+    R_0_01 = record.get('R_0_01')
+    if R_0_01 in ('', None):
+        R_0_01 = float('nan')
+    else:
+        R_0_01 = float(R_0_01)
+        if not (isfinite(R_0_01) and R_0_01 >= 0.0):
+            raise ValueError('R_0_01 must be finite and not negative')
+
+    return(tuple(values) + (pol, R_0_01))
+
+def evaluate_links(records, maps_dir):
+    '''
+    Evaluate a batch of link records in one pass of the array chain (a lone
+    link goes through the scalar chain, which does not need NumPy). Returns
+    one result dictionary per record, in order; records that cannot be parsed
+    get an 'error' entry instead of the results.
+    '''
+
+    links, errors = [], {}
+    for i, record in enumerate(records):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            links.append(parse_link(record))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors[i] = str(e)
+
+    res = None
+    if len(links) == 1:
+        h_s, theta, lat, lon, f, p, pol, R_0_01 = links[0]
+        try:
+            res = compute_rain_attenuation(h_s, theta, lat, lon, f, p, pol,
+                                           None if isnan(R_0_01) else R_0_01,
+                                           maps_dir)
+            res = {name: [float('nan') if res[name] is None else res[name]]
+                   for name in result_keys}
+        except (ValueError, ZeroDivisionError, OverflowError):
+            # Out of domain inputs come out as NaN from the array chain
+            res = None
+
+    if links and res is None:
+        args = [np.array(column) for column in zip(*links)]
+        res  = compute_rain_attenuation_many(*args, maps_dir = maps_dir)
+        res  = {name: res[name].tolist() for name in result_keys}
+
+    results, j = [], 0
+    for i, record in enumerate(records):
+        if isinstance(record, Mapping):
+            out = {name: value for name, value in record.items()
+                   if name is not None}
+        else:
+            out = {}
+        if i in errors:
+            out['error'] = errors[i]
+        else:
+            for name in result_keys:
+                value = res[name][j]
+                out[name] = None if isnan(value) else value
+            j = j + 1
+        results.append(out)
+
+    return(results)
+
+def read_json_records(fp):
+    # Newline-delimited JSON records; malformed lines are passed on as the
+    # exception so that they get an error result in their place
+    import json
+
+    for line in fp:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError('invalid JSON: ' + str(e))
+
+def stream_rain_attenuation(in_fp, out_fp, fmt = 'json', batch_size = 256,
+                            maps_dir = None):
+    '''
+    Read link records from in_fp and write one result record per link to
+    out_fp, in the same order. Records are newline-delimited JSON objects or
+    CSV rows with a header line, with the fields h_s, theta, lat, lon, f, p,
+    pol and optionally R_0_01. The maps are loaded when first needed and
+    kept, and at most batch_size records are held in memory at a time (use a
+    batch size of 1 for request/response use over a pipe).
+
+    OUTPUT PARAMETER:
+        count : number of records processed
+    '''
+
+    import csv
+    import json
+
+    if maps_dir is None:
+        maps_dir = base_dir
+
+    if fmt == 'csv':
+        reader = csv.DictReader(in_fp)
+    else:
+        reader = read_json_records(in_fp)
+
+    writer = None
+
+    def write_results(batch):
+        nonlocal writer
+
+        for out in evaluate_links(batch, maps_dir):
+            if fmt != 'csv':
+                out_fp.write(json.dumps(out) + '\n')
+                continue
+
+            if writer is None:
+                fields = list(reader.fieldnames)
+                fields.extend(k for k in result_keys if k not in fields)
+                writer = csv.DictWriter(out_fp, fields + ['error'],
+                                        extrasaction = 'ignore')
+                writer.writeheader()
+            writer.writerow(out)
+
+        out_fp.flush()
+
+    count, batch = 0, []
+    for record in reader:
+        batch.append(record)
+        if len(batch) == batch_size:
+            write_results(batch)
+            count, batch = count + len(batch), []
+
+    if batch:
+        write_results(batch)
+        count = count + len(batch)
+
+    return(count)
+
+def prompt():
+    '''
+    Interactive prompt for a single link
+    '''
+
+    h_s   = float(input('Enter the height above mean sea level of the GS '
+                        '(km): '))
+    theta = float(input('Enter the elevation angle (degrees): '))
+    lat   = float(input('Enter the latitude of the GS: '))
+    lon   = float(input('Enter the longitude of the GS: '))
+    f     = float(input('Enter the frequency of the channel (GHz): '))
+    p     = float(input('Enter the percentage time to be exceeded '
+                        '(e.g. 0.1%): '))
+    pol   = input('Enter the polarization of the signal (V, H, C): ').lower()
+
+    q = input('Is rainfall rate (exceeded for 0.01% of an avg year) available? ')
+    if q.lower() == 'y':
+        R_0_01 = float(input('Enter the value for R_0.01: '))
+    else:
+        R_0_01 = None
+
+    compute_rain_attenuation(h_s, theta, lat, lon, f, p, pol, R_0_01,
+                             logging = True)
+
+def main(argv = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description = 'Rain attenuation on Earth-space paths (ITU-R P.618-13)')
+    parser.add_argument('--stream', nargs = '?', const = '-', default = None,
+                        metavar = 'FILE',
+                        help = 'read link records from FILE (default: stdin) '
+                               'and write one result per record to stdout')
+    parser.add_argument('--format', choices = ('json', 'csv'),
+                        default = 'json',
+                        help = 'record format of the stream (newline-'
+                               'delimited JSON or CSV with a header)')
+    parser.add_argument('--batch-size', type = int, default = 256,
+                        help = 'records evaluated together in stream mode')
+    parser.add_argument('--maps-dir', default = None,
+                        help = 'directory holding the ITU map directories')
+    parser.add_argument('--region', type = float, nargs = 4, default = None,
+                        metavar = ('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'),
+                        help = 'only load the P.837-7 maps over this region')
+    parser.add_argument('--stats', action = 'store_true',
+                        help = 'print aggregated stage timers and branch '
+                               'counters to stderr when done')
+    parser.add_argument('--build-cache', action = 'store_true',
+                        help = 'parse the maps into their binary caches, '
+                               'which later runs read without parsing (or '
+                               'importing NumPy for a single link), and exit')
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        Instrumentation.enable()
+
+    # The binary caches are built from the whole maps, so a region only
+    # applies to the links evaluated
+    if args.region is not None and not args.build_cache:
+        load_maps(args.maps_dir, args.region)
+
+    if args.build_cache:
+        load_maps(args.maps_dir)
+    elif args.stream is None:
+        prompt()
+    elif args.stream == '-':
+        stream_rain_attenuation(sys.stdin, sys.stdout, args.format,
+                                args.batch_size, args.maps_dir)
+    else:
+        with open(args.stream, 'r', newline = '') as fp:
+            stream_rain_attenuation(fp, sys.stdout, args.format,
+                                    args.batch_size, args.maps_dir)
+
+    if args.stats:
+        Instrumentation.report()
+
+if __name__ == '__main__':
+    main()
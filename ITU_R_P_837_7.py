@@ -1,4 +1,6 @@
-from BilinearInterpolation import BilinearInterpolation
+from BilinearInterpolation import BilinearInterpolation, set_grid_window,\
+                                  get_grid_window
+import Instrumentation
 
 def compute_rainfall_rate(directory, p, lat, lon, logging):
 
@@ -16,12 +18,63 @@ def compute_rainfall_rate(directory, p, lat, lon, logging):
         p         : desired probability of exceedance (%)
         lat       : latitude of the desired location (N)
         lon       : longitude of the desired location (E)
+        logging   : print the interpolated rainfall rate
 
     OUTPUT PARAMETER:
         R_p       : rainfall rate exceed for the desired probability of
                     exceedance (mm/h)
     '''
 
+    directories = get_directories(directory)
+
+    R_p = BilinearInterpolation(lat, lon, directories, False).interpolate()
+
+    if logging:
+        Instrumentation.Tracer('ITU-R P.837-7', logging).event(
+            'p837.rainfall_rate', R_p = R_p)
+
+    return R_p
+
+def compute_rainfall_rate_many(directory, p, lats, lons, logging):
+
+    '''
+    Array version of compute_rainfall_rate() for many locations at once.
+
+    INPUT PARAMETERS:
+        directory : location of the text files containing the rainfall and
+                    surface temperature data, supplied by the ITU with
+                    ITU-R P.837-7
+        p         : desired probability of exceedance (%)
+        lats      : array of latitudes of the desired locations (N)
+        lons      : array of longitudes of the desired locations (E)
+
+    OUTPUT PARAMETER:
+        R_p       : array of rainfall rates exceeded for the desired
+                    probability of exceedance (mm/h)
+    '''
+
+    directories = get_directories(directory)
+
+    return BilinearInterpolation.interpolate_many(lats, lons, directories,
+                                                  False)
+
+def set_region(directory, bbox):
+    '''
+    Only load the part of the R_0.01 map covering a bounding box (lat_min,
+    lat_max, lon_min, lon_max) in degrees; queries outside of it load the
+    whole map on demand. A bbox of None loads the whole map again.
+    '''
+
+    set_grid_window(get_directories(directory), bbox)
+
+def get_region(directory):
+    return get_grid_window(get_directories(directory))
+
+def get_directories(directory):
+    '''
+    Paths to the Lat/Lon/Target files of the R_0.01 map
+    '''
+
     lat_dir = directory + 'LAT_R001.TXT'
     lon_dir = directory + 'LON_R001.TXT'
     R001_dir = directory + 'R001.TXT'
@@ -31,4 +84,4 @@ def compute_rainfall_rate(directory, p, lat, lon, logging):
         'Target': R001_dir
     }
 
-    return BilinearInterpolation(lat, lon, directories, False).interpolate()
+    return directories
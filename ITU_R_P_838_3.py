@@ -1,4 +1,11 @@
+from functools import lru_cache
 from math import log10, cos, radians, exp
+from numbers import Real
+
+import Instrumentation
+from LazyImport import lazy_import
+
+np = lazy_import('numpy')
 
 # Table 1 (from ITU-R P.838-3)
 coeffs_k_H = {
@@ -36,38 +43,80 @@ coeffs_alpha_V = {
     'c': 0.83433
 }
 
+def make_table(coeffs):
+    '''
+    Pack one of the coefficient tables into a matrix (one row each for a_j,
+    b_j and c_j) for array evaluation
+    '''
+
+    return((tuple(coeffs['a_j']), tuple(coeffs['b_j']), tuple(coeffs['c_j'])),
+           coeffs['m'], coeffs['c'])
+
+@lru_cache(maxsize = None)
+def table_arrays(table):
+    # NumPy rows a_j, b_j and c_j of a packed table, built on first use so
+    # that scalar runs never import NumPy
+    a_j, b_j, c_j = np.array(table[0])
+
+    return(a_j, b_j, c_j)
+
+table_k_H     = make_table(coeffs_k_H)
+table_k_V     = make_table(coeffs_k_V)
+table_alpha_H = make_table(coeffs_alpha_H)
+table_alpha_V = make_table(coeffs_alpha_V)
+
 def compute_k_H_or_V(f, coeffs):
+    log_f = log10(f)
+
     sum = 0.0
-    for j in range(4):
-        a_j = coeffs['a_j'][j]
-        b_j = coeffs['b_j'][j]
-        c_j = coeffs['c_j'][j]
-        
-        sum = sum + (a_j * exp(-((log10(f)-b_j)/c_j)**2))
+    for a_j, b_j, c_j in zip(coeffs['a_j'], coeffs['b_j'], coeffs['c_j']):
+        sum = sum + (a_j * exp(-((log_f-b_j)/c_j)**2))
 
     m_k = coeffs['m']
     c_k = coeffs['c']
 
-    k = 10**(sum + m_k * log10(f) + c_k)
+    k = 10**(sum + m_k * log_f + c_k)
     
     return(k)
 
 def compute_alpha_H_or_V(f, coeffs):
-    sum = 0.0
-    for j in range(5):
-        a_j = coeffs['a_j'][j]
-        b_j = coeffs['b_j'][j]
-        c_j = coeffs['c_j'][j]
+    log_f = log10(f)
 
-        sum = sum + (a_j * exp(-((log10(f)-b_j)/c_j)**2))
+    sum = 0.0
+    for a_j, b_j, c_j in zip(coeffs['a_j'], coeffs['b_j'], coeffs['c_j']):
+        sum = sum + (a_j * exp(-((log_f-b_j)/c_j)**2))
 
     m_alpha = coeffs['m']
     c_alpha = coeffs['c']
 
-    alpha = sum + m_alpha * log10(f) + c_alpha
+    alpha = sum + m_alpha * log_f + c_alpha
     
     return(alpha)
 
+def compute_table_sum_many(log_f, table):
+    # Sum of the Gaussian terms plus the linear term, for an array of log10(f)
+    _, m, c = table
+    a_j, b_j, c_j = table_arrays(table)
+
+    terms = a_j * np.exp(-((log_f[..., None] - b_j) / c_j)**2)
+
+    return(terms.sum(axis = -1) + m * log_f + c)
+
+def compute_k_and_alpha_H_and_V_many(f):
+    '''
+    Frequency-dependent coefficients k_H, k_V, alpha_H and alpha_V for an
+    array of frequencies (GHz)
+    '''
+
+    log_f = np.log10(np.asarray(f, dtype = np.float64))
+
+    k_H     = 10**compute_table_sum_many(log_f, table_k_H)
+    k_V     = 10**compute_table_sum_many(log_f, table_k_V)
+    alpha_H = compute_table_sum_many(log_f, table_alpha_H)
+    alpha_V = compute_table_sum_many(log_f, table_alpha_V)
+
+    return(k_H, k_V, alpha_H, alpha_V)
+
 def determine_tau(polarization):
     # Determine tau from the polarization
     if polarization == 'v':
@@ -79,41 +128,141 @@ def determine_tau(polarization):
 
     return(tau)
 
-def compute_k(f, theta, polarization, logging):
+def determine_tau_many(polarization):
+    # Array version of determine_tau()
+    polarization = np.asarray(polarization)
+
+    return(np.where(polarization == 'v', 90.0,
+           np.where(polarization == 'h', 0.0, 45.0)))
+
+def polarization_factor(theta, polarization):
+    # cos^2(theta) * cos(2 tau), shared by the k and alpha combinations
     tau = determine_tau(polarization)
 
+    return(cos(radians(theta))**2 * cos(radians(2*tau)))
+
+def polarization_factor_many(theta, polarization):
+    # Array version of polarization_factor()
+    tau = determine_tau_many(polarization)
+
+    return(np.cos(np.radians(theta))**2 * np.cos(np.radians(2*tau)))
+
+def combine_k(k_H, k_V, factor):
+    return((k_H + k_V + (k_H - k_V) * factor) / 2)
+
+def combine_alpha(k_H, k_V, alpha_H, alpha_V, k, factor):
+    return((k_H*alpha_H + k_V*alpha_V +\
+            (k_H*alpha_H - k_V*alpha_V) * factor) / (2 * k))
+
+def compute_k(f, theta, polarization, logging):
     k_H = compute_k_H_or_V(f, coeffs_k_H)
     k_V = compute_k_H_or_V(f, coeffs_k_V)
 
-    k = (k_H + k_V + (k_H - k_V) * cos(radians(theta))**2 *\
-         cos(radians(2*tau))) / 2
+    k = combine_k(k_H, k_V, polarization_factor(theta, polarization))
 
     if logging:
-        print('[ITU-R P.838-3] k_H = ' + str(k_H))
-        print('[ITU-R P.838-3] k_V = ' + str(k_V))
-        print('[ITU-R P.838-3] k = ' + str(k))
+        Instrumentation.Tracer('ITU-R P.838-3', logging).event(
+            'p838.k', k_H = k_H, k_V = k_V, k = k)
         
     return(k, k_H, k_V)
 
 def compute_alpha(f, theta, polarization, k, k_H, k_V, logging):
-    tau = determine_tau(polarization)
-
     alpha_H = compute_alpha_H_or_V(f, coeffs_alpha_H)
     alpha_V = compute_alpha_H_or_V(f, coeffs_alpha_V)
     
-    alpha = (k_H*alpha_H + k_V*alpha_V +\
-             (k_H*alpha_H - k_V*alpha_V) * cos(radians(theta))**2 *\
-             cos(radians(2*tau))) / (2 * k)
+    alpha = combine_alpha(k_H, k_V, alpha_H, alpha_V, k,
+                          polarization_factor(theta, polarization))
 
     if logging:
-        print('[ITU-R P.838-3] alpha_H = ' + str(alpha_H))
-        print('[ITU-R P.838-3] alpha_V = ' + str(alpha_V))
-        print('[ITU-R P.838-3] alpha = ' + str(alpha))
+        Instrumentation.Tracer('ITU-R P.838-3', logging).event(
+            'p838.alpha', alpha_H = alpha_H, alpha_V = alpha_V, alpha = alpha)
         
     return(alpha)
 
+def compute_coeffs(f, theta, polarization):
+    # k and alpha for a single link, with the polarization term computed once
+    factor = polarization_factor(theta, polarization)
+
+    k_H = compute_k_H_or_V(f, coeffs_k_H)
+    k_V = compute_k_H_or_V(f, coeffs_k_V)
+    k   = combine_k(k_H, k_V, factor)
+
+    alpha_H = compute_alpha_H_or_V(f, coeffs_alpha_H)
+    alpha_V = compute_alpha_H_or_V(f, coeffs_alpha_V)
+    alpha   = combine_alpha(k_H, k_V, alpha_H, alpha_V, k, factor)
+
+    return(k, alpha)
+
+# Optional memoization of compute_coeffs(), for services that keep evaluating
+# the same few carriers. Disabled until enable_coeffs_cache() is called.
+coeffs_cache = None
+
+def enable_coeffs_cache(maxsize = 256):
+    '''
+    Memoize the (f, theta, polarization) -> (k, alpha) evaluation in a cache
+    holding at most maxsize entries, evicting the least recently used
+    '''
+
+    global coeffs_cache
+    coeffs_cache = lru_cache(maxsize = maxsize)(compute_coeffs)
+
+def disable_coeffs_cache():
+    global coeffs_cache
+    coeffs_cache = None
+
+def coeffs_cache_info():
+    # Hits, misses, maxsize and current size of the cache (None if disabled)
+    if coeffs_cache is None:
+        return(None)
+
+    return(coeffs_cache.cache_info())
+
+def compute_specific_attenuation_coeffs_many(f, theta, polarization):
+    '''
+    Array version of compute_specific_attenuation_coeffs(). f, theta and
+    polarization are broadcast against each other and the coefficient tables
+    are evaluated as NumPy matrices.
+    '''
+
+    timing = Instrumentation.enabled
+    if timing:
+        start = Instrumentation.clock()
+
+    f, theta, polarization = np.broadcast_arrays(
+        np.asarray(f, dtype = np.float64), np.asarray(theta, dtype = np.float64),
+        np.char.lower(np.asarray(polarization, dtype = str)))
+
+    factor = polarization_factor_many(theta, polarization)
+
+    k_H, k_V, alpha_H, alpha_V = compute_k_and_alpha_H_and_V_many(f)
+
+    k     = combine_k(k_H, k_V, factor)
+    alpha = combine_alpha(k_H, k_V, alpha_H, alpha_V, k, factor)
+
+    if timing:
+        Instrumentation.lap('p838.coeffs', start, f.size)
+
+    return(k, alpha)
+
 def compute_specific_attenuation_coeffs(f, theta, polarization, logging):
-    k, k_H, k_V = compute_k(f, theta, polarization, logging)
-    alpha = compute_alpha(f, theta, polarization, k, k_H, k_V, logging)
+    # Arrays of links are evaluated in one pass
+    if not (isinstance(polarization, str) and isinstance(f, Real) and
+            isinstance(theta, Real)):
+        return compute_specific_attenuation_coeffs_many(f, theta, polarization)
+
+    timing = Instrumentation.enabled
+    if timing:
+        start = Instrumentation.clock()
+
+    if logging:
+        k, k_H, k_V = compute_k(f, theta, polarization, logging)
+        alpha = compute_alpha(f, theta, polarization, k, k_H, k_V, logging)
+    elif coeffs_cache is not None:
+        k, alpha = coeffs_cache(f, theta, polarization)
+    else:
+        k, alpha = compute_coeffs(f, theta, polarization)
+
+    if timing:
+        Instrumentation.lap('p838.coeffs', start)
 
     return(k, alpha)
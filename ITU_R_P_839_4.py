@@ -1,4 +1,5 @@
 from BilinearInterpolation  import BilinearInterpolation
+import Instrumentation
 
 def compute_rain_height(directory, lat, lon, logging):
     '''
@@ -12,12 +13,49 @@ def compute_rain_height(directory, lat, lon, logging):
                     isotherm data, supplied by the ITU with ITU-R P.839-4
         lat       : latitude of the desired location (N)
         lon       : longitude of the desired location (E)
+        logging   : print the interpolated rain height
 
     OUTPUT PARAMETER:
         h_R       : mean annual height above sea level from the 0 degree C
                     isotherm (km)
     '''
 
+    directories = get_directories(directory)
+
+    h_R = BilinearInterpolation(lat, lon, directories).interpolate() + 0.36
+
+    if logging:
+        Instrumentation.Tracer('ITU-R P.839-4', logging).event(
+            'p839.rain_height', h_R = h_R)
+
+    return h_R
+
+def compute_rain_height_many(directory, lats, lons, logging):
+    '''
+    Array version of compute_rain_height() for many locations at once.
+
+    INPUT PARAMETERS:
+        directory : location of the text files containing the 0 degree C
+                    isotherm data, supplied by the ITU with ITU-R P.839-4
+        lats      : array of latitudes of the desired locations (N)
+        lons      : array of longitudes of the desired locations (E)
+
+    OUTPUT PARAMETER:
+        h_R       : array of mean annual heights above sea level from the
+                    0 degree C isotherm (km)
+    '''
+
+    directories = get_directories(directory)
+
+    h_0 = BilinearInterpolation.interpolate_many(lats, lons, directories)
+
+    return h_0 + 0.36
+
+def get_directories(directory):
+    '''
+    Paths to the Lat/Lon/Target files of the 0 degree C isotherm map
+    '''
+
     lat_dir = directory + 'Lat.txt'
     lon_dir = directory + 'Lon.txt'
     h0_dir  = directory + 'h0.txt'
@@ -27,4 +65,4 @@ def compute_rain_height(directory, lat, lon, logging):
         'Target': h0_dir
     }
 
-    return BilinearInterpolation(lat, lon, directories).interpolate() + 0.36
+    return directories
@@ -0,0 +1,212 @@
+import sys
+import time
+
+# Master switch of the instrumentation. The hot paths test this flag before
+# doing any timing or counting, so while it is off the cost is one attribute
+# lookup per stage.
+enabled = False
+
+# Callable receiving each event (a dictionary with the keys 'source', 'stage'
+# and 'values', plus 'seconds' for timed steps), or None to only aggregate
+sink = None
+
+# Aggregated statistics: stage -> [calls, items, seconds] and name -> count
+timers   = {}
+counters = {}
+
+clock = time.perf_counter
+
+# Units of the quantities reported by the models, used by print_sink()
+units = {
+    'h_R':     'km',
+    'L_s':     'km',
+    'L_G':     'km',
+    'R_0_01':  'mm/h',
+    'R_p':     'mm/h',
+    'gamma_R': 'dB/km',
+    'zeta':    'degrees',
+    'L_R':     'km',
+    'chi':     'degrees',
+    'L_E':     'km',
+    'A_0_01':  'dB',
+    'A_p':     'dB'
+}
+
+def enable(event_sink = None):
+    '''
+    Start collecting timers and counters; events are also passed to
+    event_sink if given
+    '''
+
+    global enabled, sink
+    enabled = True
+    sink    = event_sink
+
+def disable():
+    global enabled, sink
+    enabled = False
+    sink    = None
+
+def reset():
+    '''
+    Drop the aggregated timers and counters
+    '''
+
+    timers.clear()
+    counters.clear()
+
+def add_time(stage, seconds, items = 1):
+    entry = timers.get(stage)
+    if entry is None:
+        timers[stage] = [1, items, seconds]
+    else:
+        entry[0] = entry[0] + 1
+        entry[1] = entry[1] + items
+        entry[2] = entry[2] + seconds
+
+def lap(stage, start, items = 1):
+    '''
+    Charge the time elapsed since start to a stage; returns the current clock
+    so that consecutive stages can be chained
+    '''
+
+    now = clock()
+    add_time(stage, now - start, items)
+
+    return(now)
+
+def count(name, n = 1):
+    counters[name] = counters.get(name, 0) + int(n)
+
+def print_sink(event, file = None):
+    '''
+    Sink printing each event in the format of the old per-step logging
+    '''
+
+    if file is None:
+        file = sys.stdout
+
+    prefix = '[' + event['source'] + '] '
+    if 'message' in event:
+        print(prefix + event['message'], file = file)
+    for name, value in event['values'].items():
+        unit = units.get(name)
+        print(prefix + name.replace('_0_01', '_0.01') + ' = ' + str(value) +
+              ('' if unit is None else ' ' + unit), file = file)
+
+class Tracer:
+    def __init__(self, source, echo = False):
+        '''
+        Constructor
+
+        Trace of one scalar evaluation. Only created when the instrumentation
+        is enabled or the caller asked for logging; with echo set the events
+        are printed (the logging argument of the model functions).
+        '''
+
+        self.source = source
+        self.timing = enabled
+        self.sinks  = []
+        if enabled and sink is not None:
+            self.sinks.append(sink)
+        if echo:
+            self.sinks.append(print_sink)
+        self.last = clock()
+
+    def emit(self, event):
+        for event_sink in self.sinks:
+            event_sink(event)
+
+    def event(self, stage, message = None, **values):
+        event = {'source': self.source, 'stage': stage, 'values': values}
+        if message is not None:
+            event['message'] = message
+        self.emit(event)
+
+    def step(self, stage, **values):
+        '''
+        End a step: charge the time since the previous step to stage and emit
+        the quantities it computed
+        '''
+
+        now     = clock()
+        seconds = now - self.last
+        if self.timing:
+            add_time(stage, seconds)
+        if self.sinks:
+            self.emit({'source': self.source, 'stage': stage,
+                       'seconds': seconds, 'values': values})
+        # Time spent in the sinks is not charged to the next step
+        self.last = clock()
+
+    def branch(self, name, message):
+        # Count a branch decision
+        if self.timing:
+            count(name)
+        self.event(name, message)
+
+def stats():
+    '''
+    Aggregated statistics: {'timers': {stage: {'calls', 'items', 'seconds',
+    'per_item'}}, 'counters': {name: count}}
+    '''
+
+    return {'timers': {stage: {'calls': calls, 'items': items,
+                               'seconds': seconds,
+                               'per_item': seconds / items if items else 0.0}
+                       for stage, (calls, items, seconds)
+                       in sorted(timers.items())},
+            'counters': dict(sorted(counters.items()))}
+
+def collect():
+    '''
+    Return the raw statistics gathered so far and reset them, so that worker
+    processes can ship them back to the parent (see merge()). Returns None
+    while disabled.
+    '''
+
+    if not enabled:
+        return(None)
+
+    snapshot = ({stage: list(entry) for stage, entry in timers.items()},
+                dict(counters))
+    reset()
+
+    return(snapshot)
+
+def merge(snapshot):
+    '''
+    Add statistics returned by collect() to the ones of this process
+    '''
+
+    if snapshot is None:
+        return
+
+    snapshot_timers, snapshot_counters = snapshot
+    for stage, (calls, items, seconds) in snapshot_timers.items():
+        entry = timers.setdefault(stage, [0, 0, 0.0])
+        entry[0] = entry[0] + calls
+        entry[1] = entry[1] + items
+        entry[2] = entry[2] + seconds
+    for name, n in snapshot_counters.items():
+        count(name, n)
+
+def report(file = None):
+    '''
+    Print a table of the aggregated statistics
+    '''
+
+    if file is None:
+        file = sys.stderr
+
+    res = stats()
+    print('%-32s %10s %12s %12s %12s' % ('stage', 'calls', 'items',
+                                         'seconds', 'us/item'), file = file)
+    for stage, entry in res['timers'].items():
+        print('%-32s %10d %12d %12.6f %12.3f' % (stage, entry['calls'],
+                                                 entry['items'],
+                                                 entry['seconds'],
+                                                 entry['per_item'] * 1e6),
+              file = file)
+    for name, n in res['counters'].items():
+        print('%-32s %10d' % (name, n), file = file)
@@ -0,0 +1,26 @@
+import importlib.util
+import sys
+
+def lazy_import(name):
+    '''
+    Import a module lazily: the module object is returned straight away but
+    its code only runs the first time one of its attributes is used. Keeps
+    heavy imports (NumPy, the map readers) off the start-up path of short
+    command line runs that never reach them.
+    '''
+
+    module = sys.modules.get(name)
+    if module is not None:
+        return(module)
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError('No module named ' + repr(name), name = name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return(module)
@@ -0,0 +1,273 @@
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import ITU_R_P_618_13
+from ITU_R_P_618_13 import map_versions
+
+RASTER_VERSION = 2
+
+R_earth = 6378.137    # equatorial radius of the Earth (km)
+r_geo   = 42164.0     # radius of the geostationary orbit (km)
+
+def elevation_angles(model, lats, lons):
+    '''
+    Elevation angles (degrees) of the Earth-space path at each location for
+    an elevation model:
+        {'type': 'fixed', 'theta': t} : the same elevation angle everywhere
+        {'type': 'geo', 'sat_lon': l} : looking at a geostationary satellite
+                                        at longitude l (E); NaN where the
+                                        satellite is below the horizon
+    '''
+
+    if model['type'] == 'fixed':
+        return(np.full(np.shape(lats), float(model['theta'])))
+
+    if model['type'] == 'geo':
+        cos_gamma = np.cos(np.radians(lats)) *\
+                    np.cos(np.radians(lons - model['sat_lon']))
+        sin_gamma = np.sqrt(1.0 - cos_gamma**2)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            theta = np.degrees(np.arctan2(cos_gamma - R_earth / r_geo,
+                                          sin_gamma))
+        return(np.where(theta > 0.0, theta, np.nan))
+
+    raise ValueError('Unknown elevation model: ' + str(model['type']))
+
+class RasterLayout:
+    def __init__(self, resolution, tile_size):
+        '''
+        Constructor
+
+        Global lat/lon mesh of pixel centres at the given resolution
+        (degrees), split into square tiles of tile_size x tile_size pixels.
+        Row 0 is the southernmost row and column 0 starts at -180 degrees.
+        '''
+
+        self.resolution = float(resolution)
+        self.tile_size  = int(tile_size)
+        self.rows       = int(round(180.0 / self.resolution))
+        self.cols       = int(round(360.0 / self.resolution))
+        self.tile_rows  = int(math.ceil(self.rows / self.tile_size))
+        self.tile_cols  = int(math.ceil(self.cols / self.tile_size))
+
+    def tiles(self):
+        return [(r, c) for r in range(self.tile_rows)
+                       for c in range(self.tile_cols)]
+
+    def tile_mesh(self, tile_row, tile_col):
+        # Latitudes and longitudes of the pixel centres of one tile
+        r0, c0 = tile_row * self.tile_size, tile_col * self.tile_size
+        rows   = np.arange(r0, min(r0 + self.tile_size, self.rows))
+        cols   = np.arange(c0, min(c0 + self.tile_size, self.cols))
+
+        lats = -90.0 + (rows + 0.5) * self.resolution
+        lons = -180.0 + (cols + 0.5) * self.resolution
+
+        lon_mesh, lat_mesh = np.meshgrid(lons, lats)
+
+        return(lat_mesh, lon_mesh)
+
+    def pixel(self, lats, lons):
+        # Row/col of the pixel nearest to each location
+        lons = np.mod(np.asarray(lons, dtype = np.float64) + 180.0, 360.0)
+        lats = np.asarray(lats, dtype = np.float64) + 90.0
+
+        row = np.clip(np.floor(lats / self.resolution), 0, self.rows - 1)
+        col = np.clip(np.floor(lons / self.resolution), 0, self.cols - 1)
+
+        return(row.astype(np.intp), col.astype(np.intp))
+
+def tile_path(path, tile_row, tile_col):
+    return os.path.join(path, 'tile_' + str(tile_row) + '_' +
+                        str(tile_col) + '.npy')
+
+def compute_tile(path, manifest, tile_row, tile_col, maps_dir):
+    '''
+    Compute A_p over one tile and write it to disk. The tile is written under
+    a temporary name and renamed when complete, so an interrupted run never
+    leaves a partial tile behind.
+    '''
+
+    layout = RasterLayout(manifest['resolution'], manifest['tile_size'])
+    lats, lons = layout.tile_mesh(tile_row, tile_col)
+
+    theta = elevation_angles(manifest['elevation'], lats, lons)
+
+    # Both maps are read through one stencil per grid geometry
+    h_R, R_0_01 = ITU_R_P_618_13.site_quantities_many(lats, lons, maps_dir)
+    with np.errstate(invalid = 'ignore'):
+        res = ITU_R_P_618_13.compute_rain_attenuation_many(
+            manifest['h_s'], np.nan_to_num(theta, nan = 90.0), lats, lons,
+            manifest['f'], manifest['p'], manifest['pol'], R_0_01,
+            maps_dir = maps_dir, h_R = h_R)
+    A_p = np.where(np.isnan(theta), np.nan, res['A_p']).astype(np.float32)
+
+    final = tile_path(path, tile_row, tile_col)
+    tmp   = final[:-len('.npy')] + '.tmp.npy'
+    np.save(tmp, A_p)
+    os.replace(tmp, final)
+
+    return(tile_row, tile_col)
+
+def generate_raster(path, f, p, pol, elevation, h_s = 0.0, resolution = 0.1,
+                    tile_size = 256, workers = None, maps_dir = None):
+    '''
+    Generate a global raster of the attenuation exceeded for p% of an average
+    year at a fixed frequency, polarization and elevation model. The globe is
+    swept in tiles; each tile runs the P.839-4 and P.837-7 interpolations and
+    the P.618-13 chain as array operations, and the tiles are computed in
+    parallel worker processes.
+
+    The raster is a directory holding a manifest.json and one .npy file per
+    tile (float32, NaN where the path is not visible). Tiles already on disk
+    are skipped, so an interrupted run resumes where it stopped. The manifest
+    records the version of the map files, and a run does not resume on tiles
+    computed from other maps.
+
+    INPUT PARAMETERS:
+        path       : raster directory
+        f          : frequency (GHz)
+        p          : percentage of an average year to be exceeded (%)
+        pol        : polarization ('v', 'h' or 'c')
+        elevation  : elevation model, see elevation_angles()
+        h_s        : height above mean sea level of the ground stations (km)
+        resolution : pixel size (degrees)
+        tile_size  : tile width and height (pixels)
+        workers    : number of worker processes (defaults to the CPU count)
+        maps_dir   : directory holding the ITU-R P.839-4 and P.837-7 map
+                     directories
+
+    OUTPUT PARAMETER:
+        computed   : number of tiles computed by this call
+    '''
+
+    if maps_dir is None:
+        maps_dir = ITU_R_P_618_13.base_dir
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    manifest = {'version': RASTER_VERSION, 'f': float(f), 'p': float(p),
+                'pol': pol.lower(), 'elevation': elevation, 'h_s': float(h_s),
+                'resolution': float(resolution), 'tile_size': int(tile_size),
+                'maps': map_versions(maps_dir)}
+
+    os.makedirs(path, exist_ok = True)
+    manifest_path = os.path.join(path, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as fp:
+            existing = json.load(fp)
+        if existing.get('maps') != manifest['maps'] and\
+           dict(existing, maps = None) == dict(manifest, maps = None):
+            raise ValueError('The map files have changed since the raster in '
+                             + path + ' was started; remove it to recompute '
+                             'it from the current maps')
+        if existing != manifest:
+            raise ValueError('A raster with different parameters already '
+                             'exists in ' + path)
+    else:
+        with open(manifest_path, 'w') as fp:
+            json.dump(manifest, fp, indent = 2)
+
+    layout = RasterLayout(resolution, tile_size)
+    todo   = [(r, c) for r, c in layout.tiles()
+              if not os.path.exists(tile_path(path, r, c))]
+    if not todo:
+        return(0)
+
+    ITU_R_P_618_13.load_maps(maps_dir)
+
+    with ProcessPoolExecutor(max_workers = workers,
+                             initializer = ITU_R_P_618_13.load_maps,
+                             initargs = (maps_dir,)) as pool:
+        futures = [pool.submit(compute_tile, path, manifest, r, c, maps_dir)
+                   for r, c in todo]
+        for future in as_completed(futures):
+            future.result()
+
+    return(len(todo))
+
+class AttenuationRaster:
+    def __init__(self, path):
+        '''
+        Constructor
+
+        Read access to a raster written by generate_raster(). Tiles are
+        memory-mapped the first time a query falls on them.
+        '''
+
+        with open(os.path.join(path, 'manifest.json'), 'r') as fp:
+            self.manifest = json.load(fp)
+
+        self.path   = path
+        self.layout = RasterLayout(self.manifest['resolution'],
+                                   self.manifest['tile_size'])
+        self.tiles  = {}
+
+    def tile(self, tile_row, tile_col):
+        key = (tile_row, tile_col)
+        if key not in self.tiles:
+            self.tiles[key] = np.load(tile_path(self.path, tile_row, tile_col),
+                                      mmap_mode = 'r')
+
+        return(self.tiles[key])
+
+    def query(self, lats, lons):
+        '''
+        Attenuation (dB) at the raster pixel nearest to each location
+        '''
+
+        lats, lons = np.broadcast_arrays(np.asarray(lats, dtype = np.float64),
+                                         np.asarray(lons, dtype = np.float64))
+        row, col = self.layout.pixel(lats.ravel(), lons.ravel())
+
+        size = self.layout.tile_size
+        keys = (row // size) * self.layout.tile_cols + col // size
+
+        res = np.empty(row.shape)
+        for key in np.unique(keys):
+            idx  = np.flatnonzero(keys == key)
+            tile = self.tile(*divmod(int(key), self.layout.tile_cols))
+            res[idx] = tile[row[idx] % size, col[idx] % size]
+
+        return(res.reshape(lats.shape))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'Global raster of the rain attenuation exceeded for p% '
+                      'of an average year (ITU-R P.618-13)')
+    parser.add_argument('path', help = 'raster directory')
+    parser.add_argument('--f', type = float, required = True,
+                        help = 'frequency (GHz)')
+    parser.add_argument('--p', type = float, required = True,
+                        help = 'percentage of an average year (%%)')
+    parser.add_argument('--pol', default = 'c', choices = ('v', 'h', 'c'))
+    elevation = parser.add_mutually_exclusive_group(required = True)
+    elevation.add_argument('--theta', type = float,
+                           help = 'fixed elevation angle (degrees)')
+    elevation.add_argument('--geo', type = float, metavar = 'SAT_LON',
+                           help = 'longitude of a geostationary satellite')
+    parser.add_argument('--h-s', type = float, default = 0.0)
+    parser.add_argument('--resolution', type = float, default = 0.1)
+    parser.add_argument('--tile-size', type = int, default = 256)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--maps-dir', default = None)
+    args = parser.parse_args(argv)
+
+    if args.theta is not None:
+        model = {'type': 'fixed', 'theta': args.theta}
+    else:
+        model = {'type': 'geo', 'sat_lon': args.geo}
+
+    computed = generate_raster(args.path, args.f, args.p, args.pol, model,
+                               args.h_s, args.resolution, args.tile_size,
+                               args.workers, args.maps_dir)
+    print('Computed ' + str(computed) + ' tiles', file = sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+import json
+import math
+import sqlite3
+import time
+
+import numpy as np
+
+import ITU_R_P_618_13
+from ITU_R_P_618_13 import map_versions
+
+# Default quantization step of each link parameter. Links that round to the
+# same steps share one cache entry, which is computed at the rounded values.
+default_precision = {
+    'lat':    1e-3,    # degrees
+    'lon':    1e-3,    # degrees
+    'h_s':    1e-3,    # km
+    'theta':  1e-2,    # degrees
+    'f':      1e-3,    # GHz
+    'p':      1e-5,    # %
+    'R_0_01': 1e-2     # mm/h
+}
+
+key_fields = ('lat', 'lon', 'h_s', 'theta', 'f', 'p', 'R_0_01')
+
+class ResultCache:
+    def __init__(self, path, precision = None, max_entries = 1000000,
+                 maps_dir = None, check_interval = 1.0):
+        '''
+        Constructor
+
+        Persistent cache of rain attenuation results, stored in a SQLite
+        database at path. Entries are keyed by the link parameters quantized
+        to the given precision and tagged with the version of the map files;
+        when the P.839-4 or P.837-7 files change the whole cache is dropped.
+        The cache holds at most max_entries results, evicting the least
+        recently used.
+        '''
+
+        if maps_dir is None:
+            maps_dir = ITU_R_P_618_13.base_dir
+
+        self.precision = dict(default_precision)
+        if precision is not None:
+            self.precision.update(precision)
+
+        self.path           = path
+        self.maps_dir       = maps_dir
+        self.max_entries    = int(max_entries)
+        self.check_interval = check_interval
+        self.checked        = 0.0
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta '
+                        '(name TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS results ('
+                        'lat INTEGER, lon INTEGER, h_s INTEGER, '
+                        'theta INTEGER, f INTEGER, p INTEGER, '
+                        'R_0_01 INTEGER, pol TEXT, res TEXT, '
+                        'last_used INTEGER, '
+                        'PRIMARY KEY (lat, lon, h_s, theta, f, p, R_0_01, '
+                        'pol)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_last_used '
+                        'ON results (last_used)')
+
+        # Entries made at another precision cannot be reused
+        precision_tag = json.dumps(self.precision, sort_keys = True)
+        if self.get_meta('precision') != precision_tag:
+            self.clear()
+            self.set_meta('precision', precision_tag)
+
+        self.check_maps(force = True)
+
+        self.clock   = self.db.execute('SELECT COALESCE(MAX(last_used), 0) '
+                                       'FROM results').fetchone()[0]
+        self.entries = self.db.execute('SELECT COUNT(*) '
+                                       'FROM results').fetchone()[0]
+        self.db.commit()
+
+    def get_meta(self, name):
+        row = self.db.execute('SELECT value FROM meta WHERE name = ?',
+                              (name,)).fetchone()
+
+        return(None if row is None else row[0])
+
+    def set_meta(self, name, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                        (name, value))
+
+    def clear(self):
+        '''
+        Drop every cached result
+        '''
+
+        self.db.execute('DELETE FROM results')
+        self.entries = 0
+        self.db.commit()
+
+    def check_maps(self, force = False):
+        '''
+        Drop the cache if the map files changed since it was filled. The
+        files are checked at most once every check_interval seconds.
+        '''
+
+        now = time.monotonic()
+        if not force and now - self.checked < self.check_interval:
+            return
+        self.checked = now
+
+        versions = map_versions(self.maps_dir)
+        if self.get_meta('maps') != versions:
+            self.clear()
+            self.set_meta('maps', versions)
+            self.db.commit()
+
+    def quantize(self, name, value):
+        # A missing R_0.01 (None or NaN) is keyed as -1, to be looked up from
+        # the maps. Any other parameter must be finite (and R_0.01 not
+        # negative), or it would not round to a key of its own.
+        if name == 'R_0_01' and (value is None or value != value):
+            return(-1)
+        if value is None or not math.isfinite(value) or\
+           (name == 'R_0_01' and value < 0.0):
+            raise ValueError('invalid ' + name + ': ' + repr(value))
+
+        return(int(round(value / self.precision[name])))
+
+    def dequantize(self, name, value):
+        if name == 'R_0_01' and value == -1:
+            return(None)
+
+        return(value * self.precision[name])
+
+    def key(self, h_s, theta, lat, lon, f, p, pol, R_0_01):
+        # Quantized link parameters; raises ValueError for NaN or infinite
+        # values
+        values = {'lat': lat, 'lon': lon, 'h_s': h_s, 'theta': theta, 'f': f,
+                  'p': p, 'R_0_01': R_0_01}
+
+        return(tuple(self.quantize(name, values[name])
+                     for name in key_fields) + (pol.lower(),))
+
+    def lookup(self, key):
+        row = self.db.execute('SELECT res FROM results WHERE lat = ? AND '
+                              'lon = ? AND h_s = ? AND theta = ? AND f = ? '
+                              'AND p = ? AND R_0_01 = ? AND pol = ?',
+                              key).fetchone()
+        if row is None:
+            return(None)
+
+        self.clock = self.clock + 1
+        self.db.execute('UPDATE results SET last_used = ? WHERE lat = ? AND '
+                        'lon = ? AND h_s = ? AND theta = ? AND f = ? AND '
+                        'p = ? AND R_0_01 = ? AND pol = ?',
+                        (self.clock,) + key)
+
+        return(json.loads(row[0]))
+
+    def store(self, key, res):
+        self.clock = self.clock + 1
+        cursor = self.db.execute('INSERT OR REPLACE INTO results VALUES '
+                                 '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 key + (json.dumps(res), self.clock))
+        self.entries = self.entries + cursor.rowcount
+
+        if self.entries > self.max_entries:
+            # Evict the least recently used tenth of the cache in one go
+            count = self.entries - self.max_entries + self.max_entries // 10
+            cursor = self.db.execute('DELETE FROM results WHERE last_used IN '
+                                     '(SELECT last_used FROM results ORDER '
+                                     'BY last_used LIMIT ?)', (count,))
+            self.entries   = self.entries - cursor.rowcount
+            self.evictions = self.evictions + cursor.rowcount
+
+    def link_args(self, key):
+        # Link parameters at the centre of the quantization cell of a key
+        values = dict(zip(key_fields, (self.dequantize(name, value)
+                                       for name, value in zip(key_fields,
+                                                              key))))
+
+        return(values['h_s'], values['theta'], values['lat'], values['lon'],
+               values['f'], values['p'], key[-1], values['R_0_01'])
+
+    def compute_rain_attenuation(self, h_s, theta, lat, lon, f, p, pol,
+                                 R_0_01 = None):
+        '''
+        compute_rain_attenuation() through the cache
+        '''
+
+        self.check_maps()
+
+        key = self.key(h_s, theta, lat, lon, f, p, pol, R_0_01)
+        res = self.lookup(key)
+        if res is not None:
+            self.hits = self.hits + 1
+        else:
+            self.misses = self.misses + 1
+            res = ITU_R_P_618_13.compute_rain_attenuation(
+                *self.link_args(key), maps_dir = self.maps_dir)
+            res = {name: None if value is None else float(value)
+                   for name, value in res.items()}
+            self.store(key, res)
+
+        self.db.commit()
+
+        return(res)
+
+    def compute_rain_attenuation_many(self, h_s, theta, lat, lon, f, p, pol,
+                                      R_0_01 = None):
+        '''
+        compute_rain_attenuation_many() through the cache; the misses are
+        evaluated together in one pass of the array chain
+        '''
+
+        self.check_maps()
+
+        h_s, theta, lat, lon, f, p, pol = [np.ravel(x) for x in
+            np.broadcast_arrays(h_s, theta, lat, lon, f, p,
+                                np.asarray(pol, dtype = str))]
+        R_0_01 = np.broadcast_to(np.nan if R_0_01 is None else R_0_01,
+                                 h_s.shape)
+
+        keys = [self.key(*link) for link in zip(h_s.tolist(), theta.tolist(),
+                                                lat.tolist(), lon.tolist(),
+                                                f.tolist(), p.tolist(),
+                                                pol.tolist(),
+                                                R_0_01.tolist())]
+
+        found   = {}
+        missing = []
+        for key in set(keys):
+            res = self.lookup(key)
+            if res is None:
+                missing.append(key)
+            else:
+                found[key] = res
+        self.hits   = self.hits + sum(1 for key in keys if key in found)
+        self.misses = self.misses + sum(1 for key in keys if key not in found)
+
+        if missing:
+            args = list(zip(*[self.link_args(key) for key in missing]))
+            R_0_01_args = np.array([np.nan if x is None else x
+                                    for x in args[7]])
+            res = ITU_R_P_618_13.compute_rain_attenuation_many(
+                *[np.array(a) for a in args[:7]], R_0_01_args,
+                maps_dir = self.maps_dir)
+            for i, key in enumerate(missing):
+                found[key] = {name: None if np.isnan(res[name][i])
+                              else float(res[name][i]) for name in res}
+                self.store(key, found[key])
+
+        self.db.commit()
+
+        out = {}
+        for name in ITU_R_P_618_13.result_keys:
+            out[name] = np.array([np.nan if found[key][name] is None
+                                  else found[key][name] for key in keys])
+
+        return(out)
+
+    def stats(self):
+        '''
+        Hit/miss/eviction counters of this process and the number of entries
+        '''
+
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': self.entries}
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
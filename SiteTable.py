@@ -0,0 +1,186 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+import ITU_R_P_618_13
+from ITU_R_P_618_13 import map_versions
+
+SITE_TABLE_VERSION = 1
+
+def read_stations(path):
+    '''
+    Station catalog of a CSV file with a header row and the columns id, lat
+    and lon. Returns the arrays (ids, lats, lons).
+    '''
+
+    with open(path, 'r', newline = '') as fp:
+        rows = list(csv.DictReader(fp))
+
+    ids  = np.array([row['id'] for row in rows], dtype = str)
+    lats = np.array([float(row['lat']) for row in rows])
+    lons = np.array([float(row['lon']) for row in rows])
+
+    return(ids, lats, lons)
+
+def stations_tag(ids, lats, lons):
+    # Digest of a station list, to tell when a table needs rebuilding
+    digest = hashlib.sha1()
+    digest.update(json.dumps(np.asarray(ids, dtype = str).tolist()).encode())
+    digest.update(np.ascontiguousarray(lats, dtype = np.float64).tobytes())
+    digest.update(np.ascontiguousarray(lons, dtype = np.float64).tobytes())
+
+    return(digest.hexdigest())
+
+def build_site_table(path, ids, lats, lons, maps_dir = None):
+    '''
+    Interpolate the ITU-R P.839-4 rain height and the ITU-R P.837-7 R_0.01
+    at every station and write them to the table file at path (a NumPy .npz
+    archive). The file is written under a temporary name and renamed when
+    complete.
+    '''
+
+    if maps_dir is None:
+        maps_dir = ITU_R_P_618_13.base_dir
+
+    ids  = np.asarray(ids, dtype = str)
+    lats = np.asarray(lats, dtype = np.float64)
+    lons = np.asarray(lons, dtype = np.float64)
+    if len(set(ids.tolist())) != ids.size:
+        raise ValueError('Duplicate station IDs in the station list')
+
+    h_R, R_0_01 = ITU_R_P_618_13.site_quantities_many(lats, lons, maps_dir)
+
+    meta = {'version': SITE_TABLE_VERSION,
+            'stations': stations_tag(ids, lats, lons),
+            'maps': map_versions(maps_dir)}
+
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, meta = np.array(json.dumps(meta)), ids = ids, lat = lats,
+             lon = lons, h_R = h_R, R_0_01 = R_0_01)
+    os.replace(tmp, path)
+
+class SiteTable:
+    def __init__(self, path, stations = None, maps_dir = None):
+        '''
+        Constructor
+
+        Rain heights (ITU-R P.839-4) and rainfall rates R_0.01 (ITU-R P.837-7)
+        of a fixed station catalog, precomputed once and stored in the file
+        at path, so that links from these stations need no map interpolation
+        at all. The table is rebuilt when the station list or the map files
+        change; stations is the station list, either a CSV file (see
+        read_stations()) or a tuple (ids, lats, lons). Without a station
+        list the one stored in the table is used.
+        '''
+
+        if maps_dir is None:
+            maps_dir = ITU_R_P_618_13.base_dir
+
+        self.path     = path
+        self.maps_dir = maps_dir
+        self.rebuilt  = False
+        self.ids      = None
+
+        if isinstance(stations, str):
+            stations = read_stations(stations)
+
+        if not self.load(stations):
+            if stations is None:
+                if self.ids is None:
+                    raise ValueError('No site table at ' + path + ' and no '
+                                     'station list to build it from')
+                stations = (self.ids, self.lat, self.lon)
+            build_site_table(path, *stations, maps_dir = maps_dir)
+            self.rebuilt = True
+            self.load(stations)
+
+        self.index = {station: i for i, station in
+                      enumerate(self.ids.tolist())}
+
+    def load(self, stations):
+        # Read the table file; returns whether it is up to date
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data['meta']))
+                self.ids, self.lat, self.lon, self.h_R, self.R_0_01 =\
+                    [data[name] for name in ('ids', 'lat', 'lon', 'h_R',
+                                             'R_0_01')]
+        except (OSError, KeyError, ValueError):
+            return(False)
+
+        if meta.get('version') != SITE_TABLE_VERSION:
+            return(False)
+        if stations is not None and\
+           meta['stations'] != stations_tag(*stations):
+            return(False)
+
+        return(meta['maps'] == map_versions(self.maps_dir))
+
+    def lookup(self, stations):
+        '''
+        Rows of the table of one or more station IDs; raises KeyError for an
+        unknown station
+        '''
+
+        stations = np.asarray(stations, dtype = str)
+        rows = [self.index[station] for station in stations.ravel().tolist()]
+
+        return(np.array(rows, dtype = np.intp).reshape(stations.shape))
+
+    def site(self, station):
+        '''
+        Location and precomputed quantities of one station
+        '''
+
+        i = self.index[station]
+
+        return {'lat': float(self.lat[i]), 'lon': float(self.lon[i]),
+                'h_R': float(self.h_R[i]), 'R_0_01': float(self.R_0_01[i])}
+
+    def compute_rain_attenuation_many(self, stations, h_s, theta, f, p, pol):
+        '''
+        ITU_R_P_618_13.compute_rain_attenuation_many() for links given by the
+        ID of their ground station instead of its latitude and longitude.
+        The rain heights and R_0.01 come from the table.
+        '''
+
+        rows = self.lookup(stations)
+
+        return ITU_R_P_618_13.compute_rain_attenuation_many(
+            h_s, theta, self.lat[rows], self.lon[rows], f, p, pol,
+            self.R_0_01[rows], self.maps_dir, self.h_R[rows])
+
+    def compute_rain_attenuation(self, station, h_s, theta, f, p, pol):
+        '''
+        Attenuation of a single link from a station of the table; returns
+        the result dictionary of ITU_R_P_618_13.compute_rain_attenuation(),
+        with None for the quantities of the steps not executed
+        '''
+
+        res = self.compute_rain_attenuation_many([station], h_s, theta, f, p,
+                                                 pol)
+
+        return {name: None if np.isnan(value[0]) else float(value[0])
+                for name, value in res.items()}
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'Build the table of ITU-R P.839-4 rain heights and '
+                      'ITU-R P.837-7 R_0.01 of a station catalog')
+    parser.add_argument('stations', help = 'CSV file of stations (id, lat, '
+                                           'lon)')
+    parser.add_argument('table', help = 'site table file (.npz)')
+    parser.add_argument('--maps-dir', default = None)
+    args = parser.parse_args(argv)
+
+    table = SiteTable(args.table, args.stations, args.maps_dir)
+    print(('Built ' if table.rebuilt else 'Up to date: ') +
+          str(table.ids.size) + ' stations', file = sys.stderr)
+
+if __name__ == '__main__':
+    main()
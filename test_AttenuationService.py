@@ -0,0 +1,107 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import unittest
+
+import BilinearInterpolation
+from AttenuationService import start_service
+from test_ITU_R_P_618_13 import write_maps
+
+record = {'h_s': 0.1, 'theta': 30, 'lat': 40, 'lon': -3, 'f': 20, 'p': 0.01,
+          'pol': 'v', 'R_0_01': 42}
+
+async def post(port, body, path = '/attenuation'):
+    # One request on its own connection; returns the status and the payload
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(('POST ' + path + ' HTTP/1.1\r\n' +
+                  'Content-Length: ' + str(len(body)) + '\r\n' +
+                  'Connection: close\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, payload = response.partition(b'\r\n\r\n')
+    status = int(head.split(b' ')[1])
+
+    # The response must be strict JSON, without NaN or Infinity
+    def reject(constant):
+        raise ValueError(constant + ' in the response')
+
+    return(status, json.loads(payload, parse_constant = reject))
+
+class AttenuationServiceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.maps_dir = tempfile.mkdtemp()
+        write_maps(cls.maps_dir)
+        BilinearInterpolation.clear_grid_registry()
+
+    @classmethod
+    def tearDownClass(cls):
+        BilinearInterpolation.clear_grid_registry()
+        shutil.rmtree(cls.maps_dir)
+
+    def serve(self, test, **kwargs):
+        # Run test(port, coalescer) against a service on a free port
+        async def main():
+            server, coalescer = await start_service(
+                port = 0, maps_dir = self.maps_dir, **kwargs)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                await test(port, coalescer)
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(main())
+
+    def test_coalescing(self):
+        async def test(port, coalescer):
+            bodies = [json.dumps(dict(record, f = f)).encode()
+                      for f in (10, 20, 30, 40)]
+            results = await asyncio.gather(*[post(port, body)
+                                             for body in bodies])
+
+            for status, payload in results:
+                self.assertEqual(status, 200)
+                self.assertGreater(payload['A_p'], 0.0)
+            self.assertEqual(coalescer.requests, 4)
+            self.assertLess(coalescer.batches, 4)
+
+            # The batch tasks are kept until they finish, then dropped
+            self.assertEqual(coalescer.tasks, set())
+
+        self.serve(test, window = 0.05)
+
+    def test_non_finite(self):
+        # Records passed through with NaN or infinite fields get an error,
+        # and the response stays valid JSON
+        async def test(port, coalescer):
+            body = json.dumps([record, dict(record, h_s = float('nan'),
+                                            lat = float('inf'))]).encode()
+            status, payload = await post(port, body)
+
+            self.assertEqual(status, 200)
+            self.assertNotIn('error', payload[0])
+            self.assertIn('error', payload[1])
+            self.assertIsNone(payload[1]['h_s'])
+            self.assertIsNone(payload[1]['lat'])
+
+        self.serve(test)
+
+    def test_body_limit(self):
+        async def test(port, coalescer):
+            body = json.dumps([record] * 100).encode()
+            status, payload = await post(port, body)
+            self.assertEqual(status, 413)
+            self.assertEqual(coalescer.requests, 0)
+
+            status, payload = await post(port, json.dumps(record).encode())
+            self.assertEqual(status, 200)
+
+        self.serve(test, max_body = 1000)
+
+if __name__ == '__main__':
+    unittest.main()
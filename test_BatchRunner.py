@@ -0,0 +1,80 @@
+import csv
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import BilinearInterpolation
+from BatchRunner import read_chunks, evaluate_chunk, run_batch
+from test_ITU_R_P_618_13 import write_maps
+
+header = ['name', 'h_s', 'theta', 'lat', 'lon', 'f', 'p', 'pol', 'R_0_01']
+rows   = [['a', '0.1', '30', '40', '-3', '20', '0.01', 'v', '42'],
+          ['b', '0.1', '30', 'nan', '-3', '20', '0.01', 'v', ''],
+          ['c', '0.1', '30', '40', '-3', '20', '0.01', 'v'],
+          ['d', '0.1', '30', '40', '-3', '20', '0.01', 'v', '42', 'x'],
+          ['e', '0.2', '45', '10', '100', '12', '0.1', 'h', '-1'],
+          ['f', '0.2', '45', '10', '100', 'inf', '0.1', 'h', ''],
+          ['g', '0.2', '45', '10', '100', '12', '0.1', 'c', '']]
+
+class BatchRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.path     = tempfile.mkdtemp()
+        self.maps_dir = os.path.join(self.path, 'maps')
+        write_maps(self.maps_dir)
+        BilinearInterpolation.clear_grid_registry()
+
+        self.input = os.path.join(self.path, 'links.csv')
+        with open(self.input, 'w', newline = '') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def tearDown(self):
+        BilinearInterpolation.clear_grid_registry()
+        shutil.rmtree(self.path)
+
+    def test_read_chunks(self):
+        # Rows with too few or too many fields stay aligned with the header
+        # and are flagged
+        chunks = list(read_chunks(self.input, 3))
+        self.assertEqual([len(errors) for _, errors in chunks], [3, 3, 1])
+
+        chunk, errors = chunks[0]
+        self.assertEqual(chunk['name'], ['a', 'b', 'c'])
+        self.assertEqual(chunk['R_0_01'], ['42', '', ''])
+        self.assertEqual(errors[:2], [None, None])
+        self.assertIn('8 field(s)', errors[2])
+
+        chunk, errors = chunks[1]
+        self.assertEqual(chunk['R_0_01'], ['42', '-1', ''])
+        self.assertIn('10 field(s)', errors[0])
+
+    def test_evaluate_chunk(self):
+        chunk, errors = next(read_chunks(self.input, len(rows)))
+        out, _ = evaluate_chunk(5, chunk, self.maps_dir, errors = errors)
+
+        self.assertEqual(out['row'], list(range(5, 5 + len(rows))))
+        for i in (0, 6):
+            self.assertIsNone(out['error'][i])
+            self.assertGreater(out['A_p'][i], 0.0)
+        for i in (1, 2, 3, 4, 5):
+            self.assertIsNotNone(out['error'][i], rows[i][0])
+            self.assertTrue(math.isnan(out['A_p'][i]))
+
+    def test_run_batch(self):
+        output = os.path.join(self.path, 'results.csv')
+        count  = run_batch(self.input, output, workers = 2, chunk_size = 2,
+                           maps_dir = self.maps_dir)
+        self.assertEqual(count, len(rows))
+
+        with open(output, 'r', newline = '') as fp:
+            results = sorted(csv.DictReader(fp), key = lambda r: int(r['row']))
+        self.assertEqual([r['name'] for r in results],
+                         [row[0] for row in rows])
+        self.assertEqual([r['error'] == '' for r in results],
+                         [True, False, False, False, False, False, True])
+
+if __name__ == '__main__':
+    unittest.main()
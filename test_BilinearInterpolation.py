@@ -0,0 +1,222 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import BilinearInterpolation
+from BilinearInterpolation import clear_grid_registry, convert_grid_to_binary,\
+                                  load_snapshot, parse_window, set_grid_window
+
+# Nodes of a tiny synthetic map, laid out like the ITU files: latitudes from
+# north to south down the rows, longitudes eastwards from 0 to 360 degrees
+# along the columns (the 360 column repeats the 0 column)
+lats   = [60.0, 30.0, 0.0, -30.0, -60.0]
+lons   = [0.0, 30.0, 60.0, 90.0, 120.0, 150.0, 180.0, 210.0, 240.0, 270.0,
+          300.0, 330.0, 360.0]
+values = [[ 3.0,  8.0,  1.0,  9.0,  4.0,  7.0,  2.0,  6.0,  5.0, 11.0,  0.0,
+           10.0,  3.0],
+          [12.0,  5.0, 14.0,  2.0, 13.0,  6.0, 15.0,  1.0,  9.0,  4.0,  8.0,
+            7.0, 12.0],
+          [ 6.0, 17.0,  4.0, 11.0,  0.0, 16.0,  3.0, 12.0,  8.0,  2.0, 13.0,
+            9.0,  6.0],
+          [ 1.0,  9.0, 18.0,  5.0, 10.0,  2.0, 14.0,  7.0, 19.0,  3.0,  6.0,
+           15.0,  1.0],
+          [ 7.0,  2.0,  8.0, 13.0,  4.0, 11.0,  6.0,  0.0, 10.0, 16.0,  5.0,
+            4.0,  7.0]]
+
+def bilinear(node_lats, node_lons, node_values, lat, lon):
+    '''
+    Reference bilinear interpolation in the cell of the node lattice that
+    encloses lat/lon, with the longitude taken modulo 360 degrees
+    '''
+
+    lon = lon % 360.0
+
+    i = max(k for k in range(len(node_lats)) if node_lats[k] >= lat)
+    j = max(k for k in range(len(node_lons) - 1) if node_lons[k] <= lon)
+    i = min(i, len(node_lats) - 2)
+
+    # Row i is north of the point and row i+1 south of it
+    t = (node_lats[i] - lat) / (node_lats[i] - node_lats[i+1])
+    u = (lon - node_lons[j]) / (node_lons[j+1] - node_lons[j])
+    v = node_values
+
+    return((1-t)*(1-u)*v[i][j] + (1-t)*u*v[i][j+1] +
+           t*(1-u)*v[i+1][j] + t*u*v[i+1][j+1])
+
+def write_map(path, node_lats, node_lons, node_values):
+    # Lat, Lon and Target text files of a map; returns their paths
+    directories = {'Lat': os.path.join(path, 'LAT.TXT'),
+                   'Lon': os.path.join(path, 'LON.TXT'),
+                   'Target': os.path.join(path, 'TARGET.TXT')}
+
+    rows = {'Lat': [[lat] * len(node_lons) for lat in node_lats],
+            'Lon': [node_lons] * len(node_lats),
+            'Target': node_values}
+    for name, matrix in rows.items():
+        with open(directories[name], 'w') as fp:
+            for row in matrix:
+                fp.write(' '.join('%.5f' % x for x in row) + '\n')
+
+    return(directories)
+
+class BilinearInterpolationTest(unittest.TestCase):
+    # Points inside the cells, on nodes and across the 0/360 seam; the
+    # longitudes are given in both conventions
+    points = [(15.0, 45.0), (-12.5, 200.0), (44.0, 359.0), (-50.0, 0.5),
+              (5.0, -10.0), (30.0, 90.0), (-59.0, 181.0), (0.0, -0.25),
+              (21.7, 346.3), (-29.9, 13.1)]
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.directories = write_map(self.path, lats, lons, values)
+        self.lats = np.array([lat for lat, _ in self.points])
+        self.lons = np.array([lon for _, lon in self.points])
+        self.expected = [bilinear(lats, lons, values, lat, lon)
+                         for lat, lon in self.points]
+        clear_grid_registry()
+
+    def tearDown(self):
+        for directories in list(BilinearInterpolation._grid_windows):
+            BilinearInterpolation._grid_windows.pop(directories)
+        clear_grid_registry()
+        shutil.rmtree(self.path)
+
+    def test_hand_computed(self):
+        # Middle of the cell 0..30 N, 30..60 E: the mean of its corners
+        # (5 + 14 + 17 + 4) / 4
+        self.assertAlmostEqual(bilinear(lats, lons, values, 15.0, 45.0),
+                               10.0, places = 12)
+
+        # Across the seam, a quarter of the way from 330 E to 360 E along
+        # the 30 N row: 7 + (12 - 7) / 4
+        self.assertAlmostEqual(bilinear(lats, lons, values, 30.0, 337.5),
+                               8.25, places = 12)
+
+        for convert_to_west in (False, True):
+            reader = BilinearInterpolation.BilinearInterpolation(
+                15.0, 45.0, self.directories, convert_to_west)
+            self.assertAlmostEqual(reader.interpolate(), 10.0, places = 12)
+
+            reader = BilinearInterpolation.BilinearInterpolation(
+                30.0, -22.5, self.directories, convert_to_west)
+            self.assertAlmostEqual(reader.interpolate(), 8.25, places = 12)
+
+    def test_scalar(self):
+        for convert_to_west in (False, True):
+            for (lat, lon), expected in zip(self.points, self.expected):
+                reader = BilinearInterpolation.BilinearInterpolation(
+                    lat, lon, self.directories, convert_to_west)
+                self.assertAlmostEqual(reader.interpolate(), expected,
+                                       places = 12)
+
+    def test_array(self):
+        for convert_to_west in (False, True):
+            res = BilinearInterpolation.BilinearInterpolation.interpolate_many(
+                self.lats, self.lons, self.directories, convert_to_west)
+            np.testing.assert_allclose(res, self.expected, rtol = 0,
+                                       atol = 1e-12)
+
+    def test_snapshot(self):
+        for convert_to_west in (False, True):
+            convert_grid_to_binary(self.directories, convert_to_west)
+            clear_grid_registry()
+
+            grid = load_snapshot(self.directories, convert_to_west)
+            self.assertIsInstance(grid, BilinearInterpolation.GridSnapshot)
+            for (lat, lon), expected in zip(self.points, self.expected):
+                self.assertAlmostEqual(grid.interpolate(lat, lon), expected,
+                                       places = 12)
+
+    def test_damaged_snapshot(self):
+        # The cache is written without leftover temporary files, and a
+        # truncated one is a cache miss rather than an error
+        convert_grid_to_binary(self.directories, False)
+        path = BilinearInterpolation.grid_cache_path(self.directories, False)
+        self.assertEqual(sorted(os.listdir(path)),
+                         ['header.json', 'values.npy'])
+
+        for size in (0, 20, 200):
+            with open(os.path.join(path, 'values.npy'), 'r+b') as fp:
+                fp.truncate(size)
+            clear_grid_registry()
+            self.assertIsNone(load_snapshot(self.directories, False))
+
+            reader = BilinearInterpolation.BilinearInterpolation(
+                15.0, 45.0, self.directories, False)
+            self.assertAlmostEqual(reader.interpolate(), 10.0, places = 12)
+
+    def test_window(self):
+        # Windows across the 0/360 seam in both longitude conventions
+        inside = [i for i, (lat, lon) in enumerate(self.points)
+                  if -40.0 <= lat <= 50.0 and (lon % 360.0 >= 320.0 or
+                                               lon % 360.0 <= 50.0)]
+        lats_in = self.lats[inside]
+        lons_in = self.lons[inside]
+        expected = [self.expected[i] for i in inside]
+
+        for convert_to_west, bbox in ((False, (-40.0, 50.0, 320.0, 50.0)),
+                                      (True, (-40.0, 50.0, -40.0, 50.0))):
+            grid = parse_window(self.directories, convert_to_west, bbox)
+            self.assertIsNotNone(grid.window)
+            self.assertTrue(grid.covers(lats_in, lons_in))
+            np.testing.assert_allclose(grid.interpolate_many(lats_in,
+                                                             lons_in),
+                                       expected, rtol = 0, atol = 1e-12)
+            for lat, lon, value in zip(lats_in, lons_in, expected):
+                self.assertAlmostEqual(grid.interpolate(lat, lon), value,
+                                       places = 12)
+
+            # Through the registry, with the window set on the map
+            BilinearInterpolation.use_grid_cache = False
+            try:
+                set_grid_window(self.directories, bbox)
+                res = BilinearInterpolation.BilinearInterpolation.\
+                    interpolate_many(lats_in, lons_in, self.directories,
+                                     convert_to_west)
+            finally:
+                BilinearInterpolation.use_grid_cache = True
+                set_grid_window(self.directories, None)
+                clear_grid_registry()
+            np.testing.assert_allclose(res, expected, rtol = 0,
+                                       atol = 1e-12)
+
+    def test_non_finite(self):
+        # NaN or infinite coordinates interpolate to NaN without disturbing
+        # the other points
+        bad_lats = np.array([15.0, np.nan, np.inf, 15.0])
+        bad_lons = np.array([45.0, 45.0, 45.0, -np.inf])
+        for convert_to_west in (False, True):
+            res = BilinearInterpolation.BilinearInterpolation.interpolate_many(
+                bad_lats, bad_lons, self.directories, convert_to_west)
+            self.assertAlmostEqual(res[0], 10.0, places = 12)
+            self.assertTrue(np.isnan(res[1:]).all())
+
+            for lat, lon in zip(bad_lats[1:], bad_lons[1:]):
+                reader = BilinearInterpolation.BilinearInterpolation(
+                    lat, lon, self.directories, convert_to_west)
+                self.assertTrue(np.isnan(reader.interpolate()))
+
+    def test_irregular(self):
+        # Uneven longitude spacing: the cell is found from the nearest node
+        uneven_lons   = [0.0, 30.0, 60.0, 100.0, 150.0, 200.0, 250.0, 300.0,
+                         360.0]
+        uneven_values = [row[:3] + row[4:6] + row[7:8] + row[9:10] +
+                         row[10:11] + row[12:] for row in values]
+        directories = write_map(self.path, lats, uneven_lons, uneven_values)
+
+        grid = BilinearInterpolation.load_grid(directories, False)
+        self.assertFalse(grid.regular)
+
+        points = [(15.0, 45.0), (-12.5, 170.0), (10.0, 80.0), (-20.0, 260.0),
+                  (40.0, 130.0)]
+        for lat, lon in points:
+            self.assertAlmostEqual(grid.interpolate(lat, lon),
+                                   bilinear(lats, uneven_lons, uneven_values,
+                                            lat, lon), places = 12)
+        self.assertTrue(np.isnan(grid.interpolate(np.nan, 45.0)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,285 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import BilinearInterpolation
+import ITU_R_P_618_13
+from ITU_R_P_618_13 import compute_rain_attenuation,\
+                           compute_rain_attenuation_many, result_keys,\
+                           bisect_many, step_10_attenuation_many,\
+                           step_10_percentage_many, parse_link,\
+                           evaluate_links
+
+def write_matrix(path, matrix):
+    with open(path, 'w') as fp:
+        for row in matrix:
+            fp.write(' '.join('%.5f' % x for x in row) + '\n')
+
+def write_maps(path, seed = 7):
+    '''
+    Coarse synthetic ITU-R P.839-4 and P.837-7 maps under path, laid out as
+    ITU_R_P_618_13 expects them: the 0 degree C isotherm heights on a 15 x 30
+    degree lattice from 0 to 360 E, and R_0.01 on the same lattice from -180
+    to 180 E with a dry band around 60 S
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    p839 = os.path.join(path, ITU_R_P_618_13.p839_sub_dir)
+    p837 = os.path.join(path, ITU_R_P_618_13.p837_sub_dir)
+    os.makedirs(p839)
+    os.makedirs(p837)
+
+    lats = np.arange(90.0, -90.1, -15.0)
+    lons = np.arange(0.0, 360.1, 30.0)
+    h0   = rng.uniform(0.0, 5.0, (len(lats), len(lons)))
+    h0[:, -1] = h0[:, 0]
+    write_matrix(os.path.join(p839, 'Lat.txt'),
+                 [[lat] * len(lons) for lat in lats])
+    write_matrix(os.path.join(p839, 'Lon.txt'), [lons] * len(lats))
+    write_matrix(os.path.join(p839, 'h0.txt'), h0)
+
+    lats = lats[::-1]
+    lons = lons - 180.0
+    R = rng.uniform(0.0, 120.0, (len(lats), len(lons)))
+    R[1:4] = 0.0
+    R[:, -1] = R[:, 0]
+    write_matrix(os.path.join(p837, 'LAT_R001.TXT'),
+                 [[lat] * len(lons) for lat in lats])
+    write_matrix(os.path.join(p837, 'LON_R001.TXT'), [lons] * len(lats))
+    write_matrix(os.path.join(p837, 'R001.TXT'), R)
+
+class ArrayChainTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.maps_dir = tempfile.mkdtemp()
+        write_maps(cls.maps_dir)
+        BilinearInterpolation.clear_grid_registry()
+
+        # Random links, plus the early exits of the scalar chain: stations
+        # above the rain height, R_0.01 = 0 (given and from the dry band),
+        # zenith and beyond elevation angles, and percentages outside of
+        # 0.001% to 5%
+        rng = np.random.default_rng(11)
+        n   = 400
+        cls.links = {
+            'h_s':    rng.uniform(0.0, 3.0, n),
+            'theta':  rng.uniform(5.0, 90.0, n),
+            'lat':    rng.uniform(-89.0, 89.0, n),
+            'lon':    rng.uniform(-180.0, 180.0, n),
+            'f':      rng.uniform(1.0, 55.0, n),
+            'p':      10**rng.uniform(-3.0, math.log10(5.0), n),
+            'pol':    rng.choice(['v', 'h', 'c', 'V'], n),
+            'R_0_01': np.where(rng.random(n) < 0.5, np.nan,
+                               rng.uniform(0.0, 150.0, n))
+        }
+        links = cls.links
+        links['R_0_01'][:10] = 0.0
+        links['lat'][10:30] = rng.uniform(-75.0, -45.0, 20)
+        links['R_0_01'][10:30] = np.nan
+        links['theta'][30:40] = 90.0
+        links['theta'][40:50] = rng.uniform(90.0, 120.0, 10)
+        links['p'][50:60] = rng.uniform(0.0002, 0.001, 10)
+        links['p'][60:70] = rng.uniform(5.0, 20.0, 10)
+        links['h_s'][70:80] = 6.0
+
+    @classmethod
+    def tearDownClass(cls):
+        BilinearInterpolation.clear_grid_registry()
+        shutil.rmtree(cls.maps_dir)
+
+    def scalar(self, i):
+        link = {name: values[i] for name, values in self.links.items()}
+        R_0_01 = None if np.isnan(link['R_0_01']) else float(link['R_0_01'])
+
+        return compute_rain_attenuation(
+            float(link['h_s']), float(link['theta']), float(link['lat']),
+            float(link['lon']), float(link['f']), float(link['p']),
+            str(link['pol']).lower(), R_0_01, self.maps_dir)
+
+    def assert_matches(self, res, i, index = None):
+        # Compare the result of link i with the array result at index (None
+        # in the scalar result is NaN in the array one). Inputs outside of
+        # the domain of the scalar chain come out as NaN from the array one.
+        try:
+            expected = self.scalar(i)
+        except (ValueError, ZeroDivisionError, OverflowError):
+            self.assertTrue(np.isnan(res['A_p'][i if index is None
+                                                else index]))
+            return
+
+        for name in result_keys:
+            value = res[name][i if index is None else index]
+            if expected[name] is None:
+                if name == 'A_p':
+                    self.assertEqual(value, 0.0)
+                else:
+                    self.assertTrue(np.isnan(value), name)
+            else:
+                self.assertAlmostEqual(value, expected[name], delta =
+                                       1e-12 * max(1.0, abs(expected[name])),
+                                       msg = name + ' of link ' + str(i))
+
+    def test_parity(self):
+        links = self.links
+        res = compute_rain_attenuation_many(
+            links['h_s'], links['theta'], links['lat'], links['lon'],
+            links['f'], links['p'], links['pol'], links['R_0_01'],
+            self.maps_dir)
+
+        for i in range(len(links['h_s'])):
+            self.assert_matches(res, i)
+
+        # Every early exit was taken by some of the links
+        self.assertTrue(np.isnan(res['L_s']).any())
+        self.assertTrue(((res['R_0_01'] == 0) & np.isnan(res['k'])).any())
+        self.assertTrue((res['R_0_01'][10:30] == 0).any())
+
+    def test_broadcast(self):
+        # Sites x frequencies x percentages: the maps are interpolated once
+        # per site and broadcast
+        links = self.links
+        sites = slice(80, 90)
+        f = np.array([4.0, 12.0, 30.0])[:, None]
+        p = np.array([0.01, 0.3, 2.0])[:, None, None]
+
+        res = compute_rain_attenuation_many(
+            links['h_s'][sites], links['theta'][sites], links['lat'][sites],
+            links['lon'][sites], f, p, 'c', maps_dir = self.maps_dir)
+        self.assertEqual(res['A_p'].shape, (3, 3, 10))
+
+        flat = compute_rain_attenuation_many(
+            np.broadcast_to(links['h_s'][sites], (3, 3, 10)).ravel(),
+            np.broadcast_to(links['theta'][sites], (3, 3, 10)).ravel(),
+            np.broadcast_to(links['lat'][sites], (3, 3, 10)).ravel(),
+            np.broadcast_to(links['lon'][sites], (3, 3, 10)).ravel(),
+            np.broadcast_to(f, (3, 3, 10)).ravel(),
+            np.broadcast_to(p, (3, 3, 10)).ravel(), 'c',
+            maps_dir = self.maps_dir)
+        for name in result_keys:
+            np.testing.assert_array_equal(res[name].ravel(), flat[name])
+
+    def test_bisect_many(self):
+        target = np.array([-8.0, 0.5, 3.0, 26.0])
+        x, iterations, converged = bisect_many(
+            lambda x, links: x**3, target, np.full(4, -4.0), np.full(4, 4.0),
+            tol = 1e-12)
+
+        np.testing.assert_allclose(x, np.cbrt(target), rtol = 0,
+                                   atol = 1e-12)
+        self.assertTrue(converged.all())
+        self.assertTrue((iterations <= 43).all())
+
+    def test_percentage_round_trip(self):
+        A_0_01 = np.array([2.0, 10.0, 35.0])[:, None]
+        p      = np.array([0.001, 0.004, 0.01, 0.2, 1.0, 3.5, 5.0])
+        lat, theta = 40.0, 20.0
+
+        A_p, _ = step_10_attenuation_many(A_0_01, p, lat, theta)
+        found, _, converged = step_10_percentage_many(A_0_01, A_p, lat,
+                                                      theta)
+
+        np.testing.assert_allclose(found, np.broadcast_to(p, found.shape),
+                                   rtol = 1e-8)
+        self.assertTrue(converged.all())
+
+    def test_percentage_endpoints(self):
+        # The attenuations at p_min and p_max, within rounding, give p_min
+        # and p_max; beyond them there is no solution
+        A_0_01 = np.array([2.0, 10.0, 35.0])
+        lat, theta = 40.0, 20.0
+        A_hi, _ = step_10_attenuation_many(A_0_01, 0.001, lat, theta)
+        A_lo, _ = step_10_attenuation_many(A_0_01, 5.0, lat, theta)
+
+        for scale in (1.0, 1.0 + 1e-13, 1.0 - 1e-13):
+            found, _, _ = step_10_percentage_many(A_0_01, A_lo * scale, lat,
+                                                  theta)
+            np.testing.assert_allclose(found, 5.0, rtol = 1e-8)
+            found, _, _ = step_10_percentage_many(A_0_01, A_hi * scale, lat,
+                                                  theta)
+            np.testing.assert_allclose(found, 0.001, rtol = 1e-8)
+
+        for A_p in (A_lo * 0.999, A_hi * 1.001):
+            found, _, _ = step_10_percentage_many(A_0_01, A_p, lat, theta)
+            self.assertTrue(np.isnan(found).all())
+
+class BuildCacheTest(unittest.TestCase):
+    def test_region(self):
+        # --build-cache caches the whole maps, even with a --region
+        maps_dir = tempfile.mkdtemp()
+        try:
+            write_maps(maps_dir)
+            BilinearInterpolation.clear_grid_registry()
+            ITU_R_P_618_13.main(['--build-cache', '--maps-dir', maps_dir,
+                                 '--region', '30', '50', '-10', '10'])
+
+            p837_dir = os.path.join(maps_dir, ITU_R_P_618_13.p837_sub_dir,
+                                    '')
+            self.assertIsNone(ITU_R_P_618_13.ITU_R_P_837_7.get_region(
+                p837_dir))
+
+            directories = ITU_R_P_618_13.ITU_R_P_837_7.get_directories(
+                p837_dir)
+            BilinearInterpolation.clear_grid_registry()
+            grid = BilinearInterpolation.load_snapshot(directories, False)
+            self.assertIsNotNone(grid)
+            self.assertEqual((grid.row_count, grid.col_count), (13, 13))
+        finally:
+            BilinearInterpolation.clear_grid_registry()
+            shutil.rmtree(maps_dir)
+
+class LinkRecordTest(unittest.TestCase):
+    record = {'h_s': '0.1', 'theta': '30', 'lat': '40', 'lon': '-3',
+              'f': '20', 'p': '0.01', 'pol': 'V', 'R_0_01': '42'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.maps_dir = tempfile.mkdtemp()
+        write_maps(cls.maps_dir)
+        BilinearInterpolation.clear_grid_registry()
+
+    @classmethod
+    def tearDownClass(cls):
+        BilinearInterpolation.clear_grid_registry()
+        shutil.rmtree(cls.maps_dir)
+
+    def test_parse(self):
+        self.assertEqual(parse_link(self.record),
+                         (0.1, 30.0, 40.0, -3.0, 20.0, 0.01, 'v', 42.0))
+
+        link = parse_link(dict(self.record, R_0_01 = ''))
+        self.assertTrue(math.isnan(link[-1]))
+
+    def test_rejected(self):
+        for changes in ({'lat': 'nan'}, {'theta': 'inf'}, {'f': '-inf'},
+                        {'h_s': float('nan')}, {'R_0_01': 'nan'},
+                        {'R_0_01': '-5'}, {'R_0_01': 'inf'}, {'f': '0'},
+                        {'p': '-0.1'}, {'pol': 'x'}, {'lon': ''},
+                        {'f': 'abc'}, {None: ['1', '2']}):
+            with self.assertRaises(ValueError, msg = str(changes)):
+                parse_link({**self.record, **changes})
+
+        with self.assertRaises(ValueError):
+            parse_link(['0.1', '30'])
+
+    def test_evaluate_errors(self):
+        # Bad records get an error entry, a lone one included, without
+        # disturbing the other records
+        bad = dict(self.record, R_0_01 = '-5')
+        res = evaluate_links([bad], self.maps_dir)
+        self.assertIn('error', res[0])
+
+        res = evaluate_links([self.record, bad,
+                              dict(self.record, lat = 'nan')],
+                             self.maps_dir)
+        self.assertNotIn('error', res[0])
+        self.assertGreater(res[0]['A_p'], 0.0)
+        self.assertIn('error', res[1])
+        self.assertIn('error', res[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+import ITU_R_P_838_3
+from ITU_R_P_838_3 import compute_coeffs, compute_specific_attenuation_coeffs,\
+                          compute_specific_attenuation_coeffs_many
+
+class CoeffsTest(unittest.TestCase):
+    # Frequencies over the whole 1 to 1000 GHz range of the recommendation
+    # and elevation angles from the horizon to the zenith
+    f     = np.array([1.0, 2.5, 4.0, 7.5, 10.0, 12.0, 14.25, 20.0, 30.0, 45.0,
+                      60.0, 100.0, 300.0, 1000.0])
+    theta = np.array([0.0, 5.0, 17.5, 30.0, 45.0, 60.0, 89.0, 90.0])
+
+    def tearDown(self):
+        ITU_R_P_838_3.disable_coeffs_cache()
+
+    def test_table_values(self):
+        # k and alpha of Table 5 of ITU-R P.838-3, given to 4 or 5 figures
+        table = {10.0: (0.01217, 1.2571, 0.01129, 1.2156),
+                 20.0: (0.09164, 1.0568, 0.09611, 0.9847),
+                 30.0: (0.2403, 0.9485, 0.2291, 0.9129)}
+        for f, (k_H, alpha_H, k_V, alpha_V) in table.items():
+            # Horizontal and vertical polarizations on a horizontal path
+            for pol, k, alpha in (('h', k_H, alpha_H), ('v', k_V, alpha_V)):
+                res = compute_coeffs(f, 0.0, pol)
+                self.assertAlmostEqual(res[0], k, delta = 5e-4 * k)
+                self.assertAlmostEqual(res[1], alpha, delta = 5e-4 * alpha)
+
+    def test_parity(self):
+        for pol in ('h', 'v', 'c'):
+            f, theta = np.meshgrid(self.f, self.theta)
+            k, alpha = compute_specific_attenuation_coeffs_many(f, theta, pol)
+            self.assertEqual(k.shape, f.shape)
+
+            for index in np.ndindex(f.shape):
+                expected = compute_coeffs(float(f[index]),
+                                          float(theta[index]), pol)
+                self.assertAlmostEqual(k[index], expected[0],
+                                       delta = 1e-12 * expected[0])
+                self.assertAlmostEqual(alpha[index], expected[1],
+                                       delta = 1e-12 * expected[1])
+
+    def test_mixed_polarizations(self):
+        # One pass over links with different polarizations, in either case
+        pols     = np.array(['h', 'V', 'c', 'v', 'H'])
+        f        = self.f[:5]
+        k, alpha = compute_specific_attenuation_coeffs_many(f, 30.0, pols)
+        for i, pol in enumerate(pols):
+            expected = compute_coeffs(f[i], 30.0, pol.lower())
+            self.assertAlmostEqual(k[i], expected[0],
+                                   delta = 1e-12 * expected[0])
+            self.assertAlmostEqual(alpha[i], expected[1],
+                                   delta = 1e-12 * expected[1])
+
+    def test_cache(self):
+        links = [(f, theta, pol) for f in self.f[::3]
+                                 for theta in self.theta[::2]
+                                 for pol in ('h', 'v', 'c')]
+        expected = [compute_specific_attenuation_coeffs(f, theta, pol, False)
+                    for f, theta, pol in links]
+
+        ITU_R_P_838_3.enable_coeffs_cache()
+        for _ in range(2):
+            for link, res in zip(links, expected):
+                self.assertEqual(compute_specific_attenuation_coeffs(
+                    *link, False), res)
+
+        info = ITU_R_P_838_3.coeffs_cache_info()
+        self.assertEqual(info.misses, len(links))
+        self.assertEqual(info.hits, len(links))
+
+        ITU_R_P_838_3.disable_coeffs_cache()
+        self.assertIsNone(ITU_R_P_838_3.coeffs_cache_info())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import BilinearInterpolation
+from ResultCache import ResultCache
+from test_ITU_R_P_618_13 import write_maps
+
+class ResultCacheTest(unittest.TestCase):
+    link = (0.1, 30.0, 40.0, -3.0, 20.0, 0.01, 'v', 42.0)
+
+    def setUp(self):
+        self.path     = tempfile.mkdtemp()
+        self.maps_dir = os.path.join(self.path, 'maps')
+        write_maps(self.maps_dir)
+        BilinearInterpolation.clear_grid_registry()
+
+        self.cache = ResultCache(os.path.join(self.path, 'cache.db'),
+                                 maps_dir = self.maps_dir)
+
+    def tearDown(self):
+        self.cache.close()
+        BilinearInterpolation.clear_grid_registry()
+        shutil.rmtree(self.path)
+
+    def test_key(self):
+        key = self.cache.key(*self.link)
+        self.assertEqual(key, (40000, -3000, 100, 3000, 20000, 1000, 4200,
+                               'v'))
+
+        # A missing R_0.01 has a key of its own
+        for R_0_01 in (None, math.nan):
+            self.assertEqual(self.cache.key(*self.link[:-1], R_0_01)[6], -1)
+
+    def test_non_finite(self):
+        for i in range(6):
+            for value in (math.nan, math.inf, -math.inf):
+                link = self.link[:i] + (value,) + self.link[i+1:]
+                with self.assertRaises(ValueError):
+                    self.cache.key(*link)
+
+        for R_0_01 in (math.inf, -0.01):
+            with self.assertRaises(ValueError):
+                self.cache.key(*self.link[:-1], R_0_01)
+
+    def test_hits(self):
+        res = self.cache.compute_rain_attenuation(*self.link)
+        self.assertEqual(self.cache.compute_rain_attenuation(*self.link),
+                         res)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        many = self.cache.compute_rain_attenuation_many(
+            *[np.full(3, x) for x in self.link])
+        np.testing.assert_array_equal(many['A_p'], res['A_p'])
+
+if __name__ == '__main__':
+    unittest.main()